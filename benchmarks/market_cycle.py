@@ -0,0 +1,262 @@
+"""
+Benchmark of market cycle latency across synthetic network sizes.
+
+Builds a node with N neighbors, M local assets (ModelFrameAssets or TCCModels) and a day-ahead auction of K intervals,
+attached to the in-process bus of the NetworkRunner. The weather agent and the TCC MarketAgent are replaced by
+stand-ins. For each configuration, the benchmark runs a simulated day on the discrete event clock, timing each
+market cycle by the state transitions it made. It then times schedule_power, update_vertices and publish_records
+on the market with the most active intervals.
+
+Results can be saved as a JSON baseline and compared with a later run to find regressions between commits.
+
+Usage: python benchmarks/market_cycle.py [--neighbors 1 10] [--assets 1 10] [--intervals 24 96]
+                                         [--asset-types ModelFrameAsset TCCModel] [--repetitions 20]
+                                         [--output baseline.json] [--compare baseline.json] [--threshold 1.2]
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from datetime import timedelta
+
+# When run as a script, only the benchmarks directory is on the path.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from tent.containers.interval_value import IntervalValue
+from tent.enumerations.measurement_type import MeasurementType
+from tent.utils.timer import Timer
+
+from transactive_node.local_asset import tcc_model
+from transactive_node.network_runner import NetworkRunner, load_config
+
+START_TIME = '2022-02-06T00:00:00'
+
+
+class WeatherServiceStandIn(object):
+    """Stands in for the weather agent backed forecast model with a fixed diurnal temperature profile."""
+    def __init__(self, name='TemperatureForecast', transactive_node=None, **kwargs):
+        self.name = name
+        self.predictedValues = []
+
+    @staticmethod
+    def temperature(hours):
+        return 10.0 + 8.0 * np.sin((np.asarray(hours, dtype=float) - 9.0) * np.pi / 12.0)
+
+    def update_information(self, market):
+        time_intervals = market.timeIntervals
+        values = self.temperature([ti.startTime.hour for ti in time_intervals])
+        self.predictedValues = [IntervalValue(self, ti, market, MeasurementType.Temperature, float(value))
+                                for ti, value in zip(time_intervals, values)]
+
+    def forecast_values(self, start_times):
+        return self.temperature([t.hour for t in start_times])
+
+
+class MarketAgentStandIn(object):
+    """Stands in for the TCC MarketAgent, accepting every reservation and offer."""
+    def __init__(self, *args, **kwargs):
+        self.markets = {}
+        self.offers = 0
+
+    def join_market(self, market_name, buyer_seller, reservation_callback, offer_callback, aggregate_callback,
+                    price_callback, error_callback):
+        self.markets[market_name] = buyer_seller
+
+    def make_reservation(self, market_name, buyer_seller):
+        return True
+
+    def make_offer(self, market_name, buyer_seller, curve):
+        self.offers += 1
+        return True, None
+
+
+def build_agent_stand_in(*args, **kwargs):
+    return MarketAgentStandIn()
+
+
+def _summarize(durations):
+    durations = np.asarray(durations)
+    return {
+        'count': int(durations.size),
+        'mean': float(durations.mean()),
+        'min': float(durations.min()),
+        'p95': float(np.percentile(durations, 95)),
+        'max': float(durations.max())
+    }
+
+
+def node_config(neighbors, assets, intervals, asset_type):
+    market = load_config(os.path.join(REPO_ROOT, 'sample_config', 'tns_day_ahead_auction.json'))
+    market.update({'name': 'Day-Ahead_Auction', 'module_name': 'transactive_node.tns_day_ahead_auction',
+                   'initial_market_state': 'Active', 'market_series_name': 'Day-Ahead Auction',
+                   'interval_duration': int(market['future_horizon'] // intervals)})
+    if asset_type == 'TCCModel':
+        asset_config = load_config(os.path.join(REPO_ROOT, 'sample_config', 'tcc_model.json'))
+        asset_config.update({'module_name': 'transactive_node.local_asset.tcc_model', 'tcc_interval_count': intervals})
+    else:
+        with open(os.path.join(REPO_ROOT, 'transactive_node', 'model_frame', 'config.json')) as f:
+            model_configs = json.load(f)
+        asset_config = {'class_name': 'ModelFrameAsset',
+                        'module_name': 'transactive_node.local_asset.model_frame_asset',
+                        'model_configs': model_configs,
+                        'temperature_forecast_name': 'TemperatureForecast',
+                        'occupancy_manager': {'schedule': {}}}
+    return {
+        'name': 'benchmark_node',
+        'db_topic': 'tnc',
+        'tz': 'UTC',
+        'informationServiceModels': [{'class_name': 'WeatherServiceStandIn', 'module_name': __name__,
+                                      'name': 'TemperatureForecast'}],
+        'localAssets': [dict(asset_config, name=f'{asset_type}_{i}') for i in range(assets)],
+        'neighbors': [{'class_name': 'TNSNeighbor', 'module_name': 'transactive_node.tns_neighbor',
+                       'name': f'neighbor_{i}', 'subscription_topic_postfix': 'demand',
+                       'publication_topic_postfix': 'supply'} for i in range(neighbors)],
+        'markets': [market]
+    }
+
+
+def run_cycles(runner, node, until):
+    """Run the network until the market time until, timing each cycle by the market state transitions it made."""
+    cycles = {}
+    while Timer.get_cur_time() < until:
+        states = {m.name: m.marketState for m in node.markets}
+        start = time.perf_counter()
+        runner.run_once()
+        duration = time.perf_counter() - start
+        transitions = sorted(f'{states[m.name].name}->{m.marketState.name}' for m in node.markets
+                             if m.name in states and states[m.name] != m.marketState)
+        cycles.setdefault('cycle:' + (','.join(transitions) if transitions else 'poll'), []).append(duration)
+        if not any(n.market_scheduler.woken for n in runner.nodes.values()):
+            runner.advance(until)
+    return cycles
+
+
+def time_operation(operation, repetitions):
+    durations = []
+    for _ in range(repetitions):
+        start = time.perf_counter()
+        operation()
+        durations.append(time.perf_counter() - start)
+    return durations
+
+
+def benchmark(neighbors, assets, intervals, asset_type, repetitions=20, days=1.0):
+    runner = NetworkRunner(START_TIME)
+    node = runner.add_node(node_config(neighbors, assets, intervals, asset_type))
+    for asset in node.localAssets:
+        asset.informationServices = node.informationServiceModels
+    timings = {}
+    try:
+        timings.update(run_cycles(runner, node, Timer.get_cur_time() + timedelta(days=days)))
+        market = max(node.markets, key=lambda m: len(m.timeIntervals))
+        operations = {
+            'schedule_power': lambda: [asset.schedule_power(market) for asset in node.localAssets],
+            'update_vertices': lambda: [asset.update_vertices(market) for asset in node.localAssets],
+            'publish_records': lambda: market.publish_records(node),
+            'publisher_flush': node.publisher.flush_all
+        }
+        for name, operation in operations.items():
+            try:
+                timings[name] = time_operation(operation, repetitions)
+            except Exception as e:
+                print(f'  {name} failed: {e!r}', file=sys.stderr)
+    finally:
+        runner.stop()
+    return {
+        'neighbors': neighbors,
+        'assets': assets,
+        'intervals': intervals,
+        'asset_type': asset_type,
+        'timings': {name: _summarize(durations) for name, durations in sorted(timings.items())}
+    }
+
+
+def _key(result):
+    return f"{result['asset_type']}/n{result['neighbors']}/m{result['assets']}/k{result['intervals']}"
+
+
+def compare(results, baseline, threshold):
+    """Print the change in mean latency against the baseline. Returns the number of regressions."""
+    baseline_results = {_key(r): r for r in baseline['results']}
+    regressions = 0
+    for result in results:
+        previous = baseline_results.get(_key(result))
+        if previous is None:
+            continue
+        for name, summary in result['timings'].items():
+            previous_summary = previous['timings'].get(name)
+            if not previous_summary or not previous_summary['mean']:
+                continue
+            ratio = summary['mean'] / previous_summary['mean']
+            flag = ''
+            if ratio > threshold:
+                regressions += 1
+                flag = '  REGRESSION'
+            print(f'{_key(result):<36} {name:<48} {ratio:6.2f}x{flag}')
+    return regressions
+
+
+def metadata():
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+                                         stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine()
+    }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Benchmark market cycle latency across network sizes.')
+    arg_parser.add_argument('--neighbors', type=int, nargs='+', default=[1, 10])
+    arg_parser.add_argument('--assets', type=int, nargs='+', default=[1, 10])
+    arg_parser.add_argument('--intervals', type=int, nargs='+', default=[24, 96])
+    arg_parser.add_argument('--asset-types', nargs='+', default=['ModelFrameAsset', 'TCCModel'])
+    arg_parser.add_argument('--repetitions', type=int, default=20)
+    arg_parser.add_argument('--days', type=float, default=1.0, help='simulated days of market cycles per run')
+    arg_parser.add_argument('--output', help='save the results to this JSON file')
+    arg_parser.add_argument('--compare', help='compare the results with this JSON baseline')
+    arg_parser.add_argument('--threshold', type=float, default=1.2,
+                            help='ratio to the baseline mean above which a timing is a regression')
+    args = arg_parser.parse_args(argv)
+
+    tcc_model.build_agent = build_agent_stand_in
+    results = []
+    for asset_type in args.asset_types:
+        for neighbors in args.neighbors:
+            for assets in args.assets:
+                for intervals in args.intervals:
+                    result = benchmark(neighbors, assets, intervals, asset_type, args.repetitions, args.days)
+                    results.append(result)
+                    for name, summary in result['timings'].items():
+                        print(f'{_key(result):<36} {name:<48} mean {summary["mean"] * 1e3:9.3f} ms'
+                              f'  p95 {summary["p95"] * 1e3:9.3f} ms  n={summary["count"]}')
+
+    output = {'metadata': metadata(), 'results': results}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        print(f'{regressions} regression(s) above {args.threshold:.2f}x')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""
+Microbenchmark of transactive signal encoding in TNSNeighbor.publish_signal.
+
+Compares the JSON encode and decode round trip previously used to obtain wire-ready primitives with the direct
+conversion of WireEncoder, for signals of 24 and 288 intervals, and the optional msgpack payload.
+
+Usage: python benchmarks/signal_encoding.py [repetitions]
+"""
+
+import json
+import os
+import sys
+import timeit
+
+from datetime import datetime, timedelta
+
+# When run as a script, only the benchmarks directory is on the path.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from transactive_node.util.wire_encoding import MSGPACK, WireEncoder, msgpack, pack
+
+
+class TransactiveRecordStandIn(object):
+    """Stands in for the library TransactiveRecord, which is encoded through its attribute dictionary."""
+    def __init__(self, time_interval, record, marginal_price, power):
+        self.timeStamp = datetime(2022, 2, 6, 10)
+        self.timeInterval = time_interval
+        self.record = record
+        self.marginalPrice = marginal_price
+        self.power = power
+        self.powerUncertainty = 0.0
+        self.cost = 0.0
+        self.reactivePower = 0.0
+        self.reactivePowerUncertainty = 0.0
+        self.voltage = 0.0
+        self.voltageUncertainty = 0.0
+
+
+def json_encoder_stand_in(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return obj.__dict__
+
+
+def make_signal(interval_count, records_per_interval=3):
+    start = datetime(2022, 2, 6, 10)
+    return [TransactiveRecordStandIn(format(start + timedelta(hours=i)), r, 0.05 + 0.001 * r, 100.0 * r)
+            for i in range(interval_count) for r in range(records_per_interval)]
+
+
+def main(repetitions=200):
+    encoder = WireEncoder(default=json_encoder_stand_in)
+    for interval_count in (24, 288):
+        signal = make_signal(interval_count)
+        assert encoder.encode(signal) == json.loads(json.dumps(signal, default=json_encoder_stand_in))
+        round_trip = timeit.timeit(lambda: json.loads(json.dumps(signal, default=json_encoder_stand_in)),
+                                   number=repetitions) / repetitions
+        direct = timeit.timeit(lambda: encoder.encode(signal), number=repetitions) / repetitions
+        print(f'{interval_count:>4} intervals: json round trip {round_trip * 1e6:9.1f} us,'
+              f' direct {direct * 1e6:9.1f} us, speedup {round_trip / direct:5.2f}x')
+        if msgpack is not None:
+            wire = encoder.encode(signal)
+            packed = timeit.timeit(lambda: pack(wire, MSGPACK), number=repetitions) / repetitions
+            print(f'{"":>4}            msgpack pack {packed * 1e6:9.1f} us, payload {len(pack(wire, MSGPACK))} bytes'
+                  f' vs json {len(json.dumps(wire))} bytes')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
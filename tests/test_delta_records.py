@@ -0,0 +1,101 @@
+from datetime import datetime
+from types import SimpleNamespace
+
+from transactive_node.tns_auction import TNSAuction
+from transactive_node.tns_publisher import RecordDeltaTracker
+from transactive_node.tns_real_time_auction import TNSRealTimeAuction
+from transactive_node.util.versioning import VersionedList
+
+START = datetime(2022, 2, 6, 10)
+
+
+class EntityStandIn(object):
+    def __init__(self, name):
+        self.name = name
+        self.sentSignal = VersionedList([1.0])
+        self.receivedSignal = VersionedList([2.0])
+        self.activeVertices = VersionedList([3.0])
+        self.serialized = 0
+
+    def get_dict(self):
+        self.serialized += 1
+        return {'sent_signal': list(self.sentSignal), 'received_signal': list(self.receivedSignal),
+                'vertices': list(self.activeVertices)}
+
+
+def _market(cls=TNSAuction):
+    market = cls()
+    market.name = 'market-1'
+    market.marketSeriesName = 'series'
+    market.marginalPrices = [SimpleNamespace(timeInterval=SimpleNamespace(startTime=START), value=0.05)]
+    return market
+
+
+def _node(neighbors=(), assets=(), full_interval=10):
+    return SimpleNamespace(neighbors=list(neighbors), localAssets=list(assets), transactive_operation_deltas=True,
+                           transactive_operation_full_interval=full_interval)
+
+
+def test_tracker_reports_changes_removals_and_periodic_full_records():
+    tracker = RecordDeltaTracker(full_record_interval=3)
+    assert tracker.start_record()
+    assert tracker.changed('a', 1)
+    assert tracker.changed('b', 1)
+    assert tracker.removed() == []
+
+    assert not tracker.start_record()
+    assert not tracker.changed('b', 1)
+    assert tracker.changed('b', 2)
+    assert tracker.removed() == ['a']
+
+    assert not tracker.start_record()
+    assert not tracker.changed('b', 2)
+    assert tracker.removed() == []
+
+    assert tracker.start_record()
+    assert tracker.changed('b', 2)
+
+
+def test_delta_record_serializes_only_changed_entities():
+    neighbor, other = EntityStandIn('n1'), EntityStandIn('n2')
+    node = _node(neighbors=[neighbor, other])
+    market = _market()
+
+    record = market.transactive_operation_record(node)
+    assert record['snapshot'] == 'full'
+    assert record['prices'] == [(START.isoformat(), 0.05)]
+    assert set(record['demand']['bid']) == {'n1', 'n2'}
+
+    neighbor.sentSignal.append(1.5)
+    record = market.transactive_operation_record(node)
+    assert record['snapshot'] == 'delta'
+    assert record['prices'] == []
+    assert record['demand']['bid'] == {'n1': [1.0, 1.5]}
+    assert other.serialized == 1
+
+    node.neighbors.remove(other)
+    record = market.transactive_operation_record(node)
+    assert record['demand']['bid'] == {}
+    assert record['removed'] == {'bid': ['n2']}
+
+
+class PublisherStandIn(object):
+    def __init__(self):
+        self.published = []
+
+    def publish(self, topic, message, headers=None, coalesce=True, coalesce_key=None):
+        self.published.append((topic, message, coalesce, coalesce_key))
+
+
+def test_only_real_time_markets_publish_actual_demand():
+    node = _node(neighbors=[EntityStandIn('n1')], assets=[EntityStandIn('a1')])
+    node.publisher = PublisherStandIn()
+    node.transactive_operation_topic = 'tn/transactive_operation'
+
+    _market().publish_records(node)
+    _market(TNSRealTimeAuction).publish_records(node)
+
+    (topic, day_ahead, coalesce, key), (_, real_time, _, _) = node.publisher.published
+    assert (topic, coalesce, key) == ('tn/transactive_operation/series', True, 'market-1')
+    assert 'actual' not in day_ahead['demand']
+    assert real_time['demand']['actual'] == {'neighbor': {'n1': [2.0]}, 'assets': {'a1': [3.0]}}
@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+
+from transactive_node.local_asset.tcc_model import DemandCurveArray
+
+
+def test_curves_with_more_points_keep_end_points_and_evenly_spaced_points():
+    curves = DemandCurveArray(2, max_points=3)
+    curves.set(0, [(q, 10.0 - q) for q in range(9)])
+    assert curves[0].tolist() == [[0, 10], [4, 6], [8, 2]]
+    curves.set(1, [(10, 0.5), (20, 0.1)])
+    assert curves[1].tolist() == [[10, 0.5], [20, 0.1]]
+    assert curves.to_wire() == [[[0, 10], [4, 6], [8, 2]], [[10, 0.5], [20, 0.1]]]
+
+
+def test_two_point_curves_keep_their_ends():
+    curves = DemandCurveArray(1)
+    curves.set(0, [(0, 0.9), (5, 0.5), (7, 0.3), (10, 0.1)])
+    assert curves[0].tolist() == [[0, 0.9], [10, 0.1]]
+
+
+def test_shorter_curve_clears_the_points_of_the_previous_one():
+    curves = DemandCurveArray(1, max_points=4)
+    curves.set(0, [(0, 0.9), (5, 0.5), (7, 0.3), (10, 0.1)])
+    curves.set(0, [(1, 0.4)])
+    assert curves[0].tolist() == [[1, 0.4]]
+    assert np.isnan(curves.points[0, 1:]).all()
+
+
+def test_missing_curves_and_completion():
+    curves = DemandCurveArray(3)
+    curves.set(1, [(10, 0.5), (20, 0.1)])
+    assert curves[0] is None
+    assert not curves.complete
+    assert np.isnan(curves.max_quantities()[0])
+    assert curves.max_quantities()[1] == 20
+    with pytest.raises(IndexError):
+        curves[3]
+    curves.set(0, [(1, 0.5)])
+    curves.set(2, [(2, 0.5)])
+    assert curves.complete
+    curves.reset()
+    assert curves.to_wire() == [None, None, None]
+
+
+def test_copy_from_does_not_share_arrays():
+    curves = DemandCurveArray(2)
+    curves.set(0, [(10, 0.5), (20, 0.1)])
+    copy = DemandCurveArray(2)
+    copy.copy_from(curves)
+    curves.reset()
+    assert copy[0].tolist() == [[10, 0.5], [20, 0.1]]
+    assert copy[1] is None
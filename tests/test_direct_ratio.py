@@ -0,0 +1,95 @@
+from types import SimpleNamespace
+
+from transactive_node.local_asset.actuation_manager.tns_direct_ratio import TNSDirectRatioActuationManager
+
+from volttron.platform.jsonrpc import MethodNotFound, RemoteError
+
+
+class ResultStandIn(object):
+    def __init__(self, value=None, error=None):
+        self.value = value
+        self.error = error
+
+    def get(self, timeout=None):
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class RPCStandIn(object):
+    def __init__(self):
+        self.calls = []
+        self.errors = {}  # method -> exception raised by its calls
+        self.failures = {}  # topics which set_multiple_points reports as failed
+
+    def call(self, peer, method, **kwargs):
+        self.calls.append((method, kwargs))
+        if method in self.errors:
+            return ResultStandIn(error=self.errors[method])
+        return ResultStandIn(self.failures if method == 'set_multiple_points' else None)
+
+    def methods(self):
+        return [method for method, _ in self.calls]
+
+
+class NodeStandIn(object):
+    def __init__(self):
+        self.vip = SimpleNamespace(rpc=RPCStandIn())
+
+
+def _manager(node, **kwargs):
+    return TNSDirectRatioActuationManager('platform.actuator', parent=SimpleNamespace(name='rtu'),
+                                          transactive_node=node, **kwargs)
+
+
+def test_set_points_within_the_deadband_are_not_written_again():
+    node = NodeStandIn()
+    manager = _manager(node, set_point_deadband=0.5)
+    assert manager.direct_actuate('a', 22.0)
+    assert manager.direct_actuate('a', 22.4)
+    assert manager.direct_actuate('a', 23.0)
+    assert [kwargs['value'] for _, kwargs in node.vip.rpc.calls] == [22.0, 23.0]
+    assert manager.last_written == {'a': 23.0}
+
+
+def test_several_set_points_are_written_in_one_bulk_call():
+    node = NodeStandIn()
+    node.vip.rpc.failures = {'b': 'locked'}
+    manager = _manager(node)
+    manager.direct_actuate_many({'a': 22.0, 'b': 23.0})
+    assert node.vip.rpc.methods() == ['set_multiple_points']
+    assert node.vip.rpc.calls[0][1]['topics_values'] == [('a', 22.0), ('b', 23.0)]
+    # The failed point is written again next time, the other only when it changes.
+    manager.direct_actuate_many({'a': 22.0, 'b': 23.0})
+    assert node.vip.rpc.methods() == ['set_multiple_points', 'set_point']
+    assert manager.last_written == {'a': 22.0, 'b': 23.0}
+
+
+def test_actuators_without_bulk_writes_fall_back_to_single_writes():
+    node = NodeStandIn()
+    node.vip.rpc.errors['set_multiple_points'] = MethodNotFound(message='set_multiple_points')
+    manager = _manager(node)
+    manager.direct_actuate_many({'a': 22.0, 'b': 23.0})
+    assert not manager.use_set_multiple_points
+    assert sorted(node.vip.rpc.methods()) == ['set_multiple_points', 'set_point', 'set_point']
+    assert manager.last_written == {'a': 22.0, 'b': 23.0}
+
+
+def test_failed_bulk_writes_are_not_remembered_or_retried_singly():
+    node = NodeStandIn()
+    node.vip.rpc.errors['set_multiple_points'] = RemoteError('locked')
+    manager = _manager(node)
+    manager.direct_actuate_many({'a': 22.0, 'b': 23.0})
+    assert manager.use_set_multiple_points
+    assert node.vip.rpc.methods() == ['set_multiple_points']
+    assert manager.last_written == {}
+
+
+def test_released_points_are_written_again():
+    node = NodeStandIn()
+    manager = _manager(node)
+    manager.direct_actuate('a', 22.0)
+    manager.direct_release_many(['a'])
+    assert manager.last_written == {}
+    manager.direct_actuate('a', 22.0)
+    assert node.vip.rpc.methods() == ['set_point', 'revert_point', 'set_point']
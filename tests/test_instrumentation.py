@@ -0,0 +1,66 @@
+import weakref
+
+import pytest
+
+from transactive_node.util.instrumentation import Instrumentation, LatencyHistogram, instrumented
+
+
+class NodeStandIn(object):
+    def __init__(self):
+        self.instrumentation = Instrumentation()
+
+
+class AssetStandIn(object):
+    def __init__(self, tn=None):
+        self.tn = weakref.ref(tn) if tn is not None else None
+
+    @instrumented('asset.run')
+    def run(self, *args):
+        return len(args)
+
+
+def test_histogram_percentiles_are_bucket_bounds():
+    histogram = LatencyHistogram()
+    for seconds in (1e-5, 1e-5, 1e-5, 0.5):
+        histogram.record(seconds)
+    assert histogram.count == 4
+    assert histogram.percentile(50) == 1e-5
+    assert histogram.percentile(99) == 0.5
+    assert LatencyHistogram().percentile(50) is None
+
+
+def test_every_call_is_counted_and_only_sampled_calls_are_timed():
+    instrumentation = Instrumentation(sample_every=2)
+    for _ in range(5):
+        instrumentation.call('op', lambda: None)
+    assert instrumentation.counters['op'] == 5
+    assert instrumentation.histograms['op'].count == 2
+
+
+def test_errors_are_counted_and_raised():
+    instrumentation = Instrumentation()
+    with pytest.raises(ZeroDivisionError):
+        instrumentation.call('op', lambda: 1 / 0)
+    assert instrumentation.errors == {'op': 1}
+    assert instrumentation.get_metrics(reset=True)['counters'] == {'op': 1}
+    assert instrumentation.counters == {}
+
+
+def test_wrap_counts_calls_of_an_attribute():
+    class PubSubStandIn(object):
+        def publish(self, topic):
+            return topic
+
+    instrumentation = Instrumentation()
+    pubsub = PubSubStandIn()
+    instrumentation.wrap(pubsub, 'publish', 'pubsub.publish.enqueue')
+    assert pubsub.publish('t') == 't'
+    assert instrumentation.counters == {'pubsub.publish.enqueue': 1}
+
+
+def test_instrumented_methods_find_the_node_through_arguments_or_weak_reference():
+    node = NodeStandIn()
+    assert AssetStandIn().run(node) == 1
+    assert AssetStandIn(node).run() == 0
+    assert AssetStandIn().run() == 0
+    assert node.instrumentation.counters == {'asset.run': 2}
@@ -0,0 +1,101 @@
+import pickle
+
+from datetime import datetime, timedelta
+
+from tent.containers.interval_value import IntervalValue
+from tent.containers.time_interval import TimeInterval
+from tent.enumerations.market_state import MarketState
+from tent.enumerations.measurement_type import MeasurementType
+
+from transactive_node.local_asset.interval_value_store import IntervalValueStore
+
+START = datetime(2022, 2, 6, 10)
+
+
+class MarketStandIn(object):
+    def __init__(self, name, series='series'):
+        self.name = name
+        self.marketSeriesName = series
+        self.marketState = MarketState.Active
+
+
+def _interval(market, hour):
+    start = START + timedelta(hours=hour)
+    return TimeInterval(START, timedelta(hours=1), market, START, start)
+
+
+def _value(market, time_interval, value):
+    return IntervalValue(None, time_interval, market, MeasurementType.ScheduledPower, value)
+
+
+def test_values_are_found_by_market_and_interval_start():
+    market = MarketStandIn('ma')
+    other = MarketStandIn('mb')
+    store = IntervalValueStore([_value(market, _interval(market, h), h) for h in range(3)])
+    store.append(_value(other, _interval(other, 1), 10))
+    assert len(store) == 4
+    assert store.get(_interval(market, 1)).value == 1
+    assert store.get(_interval(other, 1)).value == 10
+    assert store.get(_interval(market, 5)) is None
+    assert store.get(_interval(market, 5), 'default') == 'default'
+
+
+def test_markets_of_the_same_name_in_different_series_are_kept_apart():
+    day_ahead = MarketStandIn('m1', 'day-ahead')
+    real_time = MarketStandIn('m1', 'real-time')
+    store = IntervalValueStore([_value(day_ahead, _interval(day_ahead, 0), 1),
+                                _value(real_time, _interval(real_time, 0), 2)])
+    assert store.get(_interval(day_ahead, 0)).value == 1
+    assert store.get(_interval(real_time, 0)).value == 2
+    day_ahead.marketState = MarketState.Expired
+    store.expire()
+    assert [v.value for v in store] == [2]
+
+
+def test_replace_and_remove_values_of_an_interval():
+    market = MarketStandIn('ma')
+    time_interval = _interval(market, 0)
+    first = _value(market, time_interval, 1)
+    store = IntervalValueStore([first, _value(market, _interval(market, 1), 2)])
+    store.append(_value(market, time_interval, 3))
+    assert [v.value for v in store.get_all(time_interval)] == [1, 3]
+    store.replace(time_interval, [_value(market, time_interval, 5)])
+    assert [v.value for v in store.get_all(time_interval)] == [5]
+    store.replace(time_interval, [])
+    assert store.get(time_interval) is None
+    assert first not in store
+    value = store[0]
+    store.remove(value)
+    assert not store
+
+
+def test_version_changes_with_every_mutation():
+    market = MarketStandIn('ma')
+    time_interval = _interval(market, 0)
+    store = IntervalValueStore()
+    versions = [store.version]
+    store.append(_value(market, time_interval, 1))
+    versions.append(store.version)
+    store.replace(time_interval, [_value(market, time_interval, 2)])
+    versions.append(store.version)
+    store.clear()
+    versions.append(store.version)
+    assert len(set(versions)) == len(versions)
+    assert IntervalValueStore().version != store.version
+
+
+def test_expire_removes_values_of_expired_markets():
+    market = MarketStandIn('ma')
+    other = MarketStandIn('mb')
+    store = IntervalValueStore([_value(market, _interval(market, 0), 1), _value(other, _interval(other, 0), 2)])
+    market.marketState = MarketState.Expired
+    store.expire()
+    assert [v.value for v in store] == [2]
+
+
+def test_pickle_round_trip_rebuilds_indexes():
+    market = MarketStandIn('ma')
+    store = IntervalValueStore([_value(market, _interval(market, h), h) for h in range(3)])
+    restored = pickle.loads(pickle.dumps(store))
+    assert [v.value for v in restored] == [0, 1, 2]
+    assert restored.get(_interval(restored[0].market, 2)).value == 2
@@ -0,0 +1,129 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from tent.enumerations.market_state import MarketState
+
+from transactive_node.util import market_scheduler
+from transactive_node.util.market_scheduler import MarketScheduler
+
+NOW = datetime(2022, 2, 6, 10)
+
+
+class NodeStandIn(object):
+    def __init__(self):
+        self.markets = []
+        self.instrumentation = None
+
+
+def _market(name='ma', state=MarketState.Active, clearing_in=timedelta(minutes=30)):
+    return SimpleNamespace(name=name, marketState=state, marketClearingTime=NOW + clearing_in,
+                           activationLeadTime=timedelta(minutes=10), negotiationLeadTime=timedelta(minutes=10),
+                           marketLeadTime=timedelta(minutes=5), deliveryLeadTime=timedelta(minutes=5),
+                           intervalDuration=timedelta(hours=1), intervalsToClear=1,
+                           marketClearingInterval=timedelta(hours=1))
+
+
+@pytest.fixture
+def scheduler(monkeypatch):
+    monkeypatch.setattr(market_scheduler.Timer, 'get_cur_time', classmethod(lambda cls: NOW))
+    monkeypatch.setattr(market_scheduler.Timer, 'simulation', False, raising=False)
+    monkeypatch.setattr(market_scheduler.SimulationTimer, 'simulation', False)
+    tn = NodeStandIn()
+    scheduler = MarketScheduler(tn, poll_interval=2.0, max_sleep=60.0)
+    scheduler.node = tn  # Keep the node alive, since the scheduler only holds a weak reference.
+    return scheduler
+
+
+def test_next_deadline_is_the_next_state_transition(scheduler):
+    # Clearing in 30 minutes, so the next transition is activation, 25 minutes before clearing.
+    assert scheduler.next_deadline(_market(), NOW) == NOW + timedelta(minutes=5)
+    # Then negotiation, 15 minutes before clearing.
+    assert scheduler.next_deadline(_market(), NOW + timedelta(minutes=5)) == NOW + timedelta(minutes=15)
+    assert scheduler.next_deadline(_market(clearing_in=timedelta(minutes=-1)), NOW) \
+        == NOW + timedelta(minutes=4)
+
+
+def test_negotiation_is_polled(scheduler):
+    market = _market(state=MarketState.Negotiation)
+    assert scheduler.next_deadline(market, NOW) == NOW + timedelta(seconds=2)
+
+
+def test_market_past_its_transitions_is_polled(scheduler):
+    market = _market(clearing_in=timedelta(hours=-3))
+    market.marketClearingInterval = None
+    assert scheduler.next_deadline(market, NOW) == NOW + timedelta(seconds=2)
+
+
+def test_earliest_deadline_and_sleep(scheduler):
+    assert scheduler.earliest_deadline() is None
+    assert scheduler.seconds_until_next_deadline() == 60.0
+    scheduler.reschedule([_market('ma'), _market('mb', clearing_in=timedelta(minutes=29, seconds=30))])
+    assert scheduler.earliest_deadline() == NOW + timedelta(minutes=4, seconds=30)
+    # Sleeps are capped at max_sleep.
+    assert scheduler.seconds_until_next_deadline() == 60.0
+
+
+def test_run_once_evaluates_every_market(scheduler):
+    calls = []
+    markets = [_market('ma'), _market('mb')]
+    for market in markets:
+        market.events = lambda tn, name=market.name: calls.append(name)
+    scheduler.node.markets = markets
+    scheduler.run_once(scheduler.node)
+    assert calls == ['ma', 'mb']
+    assert scheduler.cycle_count == 1
+    assert scheduler.earliest_deadline() == NOW + timedelta(minutes=5)
+
+
+def test_wake(scheduler):
+    assert not scheduler.woken
+    scheduler.wake('meter update')
+    assert scheduler.woken and scheduler.wake_count == 1
+    scheduler.clear_wake()
+    assert not scheduler.woken
+
+
+@pytest.fixture
+def discrete_clock(monkeypatch):
+    monkeypatch.setattr(market_scheduler.SimulationTimer, 'simulation', True)
+    monkeypatch.setattr(market_scheduler.SimulationTimer, 'discrete_event', True)
+    monkeypatch.setattr(market_scheduler.SimulationTimer, 'discrete_time', NOW)
+
+
+def test_discrete_clock_advances_to_the_earliest_deadline(scheduler, discrete_clock):
+    assert scheduler.discrete_event
+    scheduler.reschedule([_market('ma'), _market('mb', clearing_in=timedelta(hours=1))])
+    scheduler.advance_discrete_clock()
+    assert market_scheduler.SimulationTimer.discrete_time == NOW + timedelta(minutes=5)
+
+
+def test_discrete_clock_waits_while_woken(scheduler, discrete_clock):
+    scheduler.reschedule([_market()])
+    scheduler.wake('neighbor signal')
+    scheduler.advance_discrete_clock()
+    assert market_scheduler.SimulationTimer.discrete_time == NOW
+
+
+def test_discrete_clock_without_markets_advances_by_max_sleep(scheduler, discrete_clock):
+    scheduler.advance_discrete_clock()
+    assert market_scheduler.SimulationTimer.discrete_time == NOW + timedelta(seconds=60)
+
+
+def test_price_statistics_are_invalidated_after_market_events(scheduler):
+    markets = [_market('ma'), _market('mb')]
+    seen = []
+
+    def events(tn, market=markets[0]):
+        # Statistics filled while the events run are dropped afterward, since the events may change the prices.
+        seen.append([m.price_statistics for m in tn.markets])
+        market.price_statistics = 'filled'
+    markets[0].events = events
+    markets[1].events = lambda tn: seen.append([m.price_statistics for m in tn.markets])
+    for market in markets:
+        market.price_statistics = 'stale'
+    scheduler.node.markets = markets
+    scheduler.run_once(scheduler.node)
+    assert seen == [['stale', 'stale'], [None, None]]
+    assert [m.price_statistics for m in markets] == [None, None]
@@ -0,0 +1,49 @@
+from datetime import datetime, timedelta
+
+from transactive_node.tns_meter_point import MeterWindow
+
+
+def test_interval_average_weights_readings_by_time_held():
+    window = MeterWindow(capacity=10)
+    window.append(0, 10.0)
+    window.append(30, 20.0)
+    window.append(60, 40.0)
+    assert window.interval_average(0, 60) == 15.0
+    assert window.interval_average(15, 45) == 15.0
+    # The latest reading holds until the next one.
+    assert window.interval_average(60, 120) == 40.0
+
+
+def test_interval_average_with_datetimes():
+    window = MeterWindow(capacity=10)
+    start = datetime(2022, 2, 6, 10)
+    window.append(start, 1.0)
+    window.append(start + timedelta(minutes=45), 5.0)
+    assert window.interval_average(start, start + timedelta(hours=1)) == 2.0
+
+
+def test_interval_average_not_covered_by_window():
+    window = MeterWindow(capacity=10)
+    assert window.interval_average(0, 10) is None
+    window.append(100, 1.0)
+    assert window.interval_average(50, 150) is None
+    assert window.interval_average(150, 150) is None
+
+
+def test_window_keeps_latest_readings_after_wrap_around():
+    window = MeterWindow(capacity=3)
+    for t in range(0, 60, 10):
+        window.append(t, float(t))
+    assert len(window) == 3
+    assert window.latest() == 50.0
+    assert window.latest_time() == 50.0
+    assert window.interval_average(30, 50) == 35.0
+    assert window.interval_average(10, 50) is None
+
+
+def test_out_of_order_readings_are_ignored():
+    window = MeterWindow(capacity=10)
+    window.append(10, 1.0)
+    window.append(5, 100.0)
+    assert len(window) == 1
+    assert window.latest() == 1.0
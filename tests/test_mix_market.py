@@ -0,0 +1,74 @@
+import gevent
+
+from gevent.pool import Pool
+
+from transactive_node.local_asset.tcc_model import MixMarketBarrier, TCCModel
+
+
+def test_barrier_completes_once_when_every_interval_has_cleared():
+    barrier = MixMarketBarrier(3)
+    barrier.aggregate_received(1)
+    assert not barrier.price_received(0)
+    assert not barrier.price_received(2)
+    assert barrier.price_received(1)
+    assert barrier.completed
+    assert not barrier.price_received(1)
+    summary = barrier.summary()
+    assert summary['cleared'] == 3
+    assert summary['slowest_interval'] in (0, 1, 2)
+    assert summary['aggregate_latencies'][0] is None
+
+
+def _model(concurrency):
+    model = TCCModel.__new__(TCCModel)
+    model.mix_market_pool = Pool(concurrency)
+    return model
+
+
+def test_dispatched_callbacks_run_concurrently():
+    events = []
+
+    def price_callback(timestamp, market_name, buyer_seller, price, quantity):
+        events.append(('start', market_name))
+        gevent.sleep(0.01)
+        events.append(('end', market_name))
+
+    model = _model(4)
+    dispatch = model._dispatch(price_callback)
+    for idx in range(3):
+        dispatch(None, f'electric_{idx}', 'buyer', 0.05, 10.0)
+    model.mix_market_pool.join()
+    assert [kind for kind, _ in events] == ['start'] * 3 + ['end'] * 3
+
+
+def test_pool_bounds_the_concurrent_callbacks():
+    running, peak = [0], [0]
+
+    def aggregate_callback(*args):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        gevent.sleep(0.01)
+        running[0] -= 1
+
+    model = _model(2)
+    dispatch = model._dispatch(aggregate_callback)
+    for idx in range(5):
+        dispatch(idx)
+    model.mix_market_pool.join()
+    assert peak[0] == 2
+
+
+def test_failed_callbacks_do_not_stop_the_others():
+    handled = []
+
+    def price_callback(idx):
+        if idx == 0:
+            raise ValueError('no price')
+        handled.append(idx)
+
+    model = _model(4)
+    dispatch = model._dispatch(price_callback)
+    greenlets = [dispatch(idx) for idx in range(3)]
+    model.mix_market_pool.join()
+    assert handled == [1, 2]
+    assert isinstance(greenlets[0].exception, ValueError)
@@ -0,0 +1,51 @@
+import numpy as np
+
+from datetime import datetime, timedelta
+
+from transactive_node.model_frame import ModelFrame
+from transactive_node.model_frame.thermostat import OAT
+
+START = datetime(2022, 2, 6, 22)
+
+
+def _model_frame():
+    hours = np.arange(24)
+    return ModelFrame({'demand_curve_points': 3, 'models': [
+        {'topic': 'rtu', 'model_type': 'thermostat.Thermostat', 'model_config': {
+            'c1': (-0.1 - hours * 0.001).tolist(), 'c2': [0.05] * 24, 'c3': [0.02] * 24, 'c4': [1.5] * 24,
+            'rated_power': 10.0, 'oat': 20.0, 'csp': 22.0, 'room_temp': 23.0, 'unoccupied_set_point': 25.0}},
+        {'topic': 'lights', 'model_type': 'light.Lighting', 'model_config': {
+            'rated_power': 2.0, 'default_lighting_schedule': (0.5 + hours / 100).tolist()}},
+        {'topic': 'plugs', 'model_type': 'uncontrolled.UncontrolledLoad', 'model_config': {
+            'uncontrolled_load_schedule': (1.0 + hours / 10).tolist()}}]})
+
+
+def _params(interval_time, oat, occupied):
+    params = {'interval_time': interval_time, 'occupied': occupied}
+    if not np.isnan(oat):
+        params[OAT] = oat
+    return params
+
+
+def test_batched_predictions_match_predictions_of_each_interval():
+    model_frame = _model_frame()
+    # The intervals cross midnight, and the NaN forecast falls back to the measured outdoor air temperature.
+    times = [START + timedelta(hours=h) for h in range(4)]
+    oats = [30.0, np.nan, 25.0, 27.5]
+    occupied = [True, True, False, True]
+
+    flexibility = model_frame.model_flexibility_many(times, oats, occupied)
+    power = model_frame.model_power_many(times, oats, occupied)
+
+    expected_flexibility = [model_frame.model_flexibility(_params(*p)) for p in zip(times, oats, occupied)]
+    expected_power = [model_frame.model_power(_params(*p)) for p in zip(times, oats, occupied)]
+    assert flexibility.shape == (4, 3)
+    assert np.allclose(flexibility, expected_flexibility)
+    assert np.allclose(power, expected_power)
+
+
+def test_interval_times_may_be_datetime64_arrays():
+    model_frame = _model_frame()
+    times = [START + timedelta(hours=h) for h in range(4)]
+    assert np.array_equal(model_frame.model_power_many(np.array(times, dtype='datetime64[us]')),
+                          model_frame.model_power_many(times))
@@ -0,0 +1,72 @@
+from types import SimpleNamespace
+
+from transactive_node.tns_neighbor import TNSNeighbor
+
+
+class NodeStandIn(object):
+    def __init__(self):
+        self.name = 'node'
+        self.db_topic = 'tns'
+        self.subscribe_all_platforms = False
+        self.instrumentation = None
+        self.vip = SimpleNamespace(pubsub=SimpleNamespace(subscribe=lambda **kwargs: None))
+        self.wakes = 0
+
+    def wake_scheduler(self, reason):
+        self.wakes += 1
+
+
+def _neighbor(node, **kwargs):
+    return TNSNeighbor('', '', name='upstream', transactive_node=node, **kwargs)
+
+
+def _receive(neighbor, curves):
+    neighbor.new_transactive_signal('pubsub', 'upstream', '', neighbor.subscribeTopic, {}, {'curves': curves})
+    neighbor._signal_greenlet.join()
+
+
+def test_unchanged_curves_are_processed_once():
+    node = NodeStandIn()
+    neighbor = _neighbor(node)
+    _receive(neighbor, [[1, 2]])
+    _receive(neighbor, [[1, 2]])
+    _receive(neighbor, [[1, 3]])
+    assert neighbor.received == [[[1, 2]], [[1, 3]]]
+    assert neighbor.get_signal_metrics()['deduplicated'] == 1
+    assert node.wakes == 2
+
+
+def test_curves_are_processed_again_after_the_received_signals_are_cleared():
+    node = NodeStandIn()
+    neighbor = _neighbor(node)
+    _receive(neighbor, [[1, 2]])
+    neighbor.receivedSignal = []
+    _receive(neighbor, [[1, 2]])
+    assert neighbor.received == [[[1, 2]], [[1, 2]]]
+
+
+def test_failed_signals_are_not_remembered():
+    node = NodeStandIn()
+    neighbor = _neighbor(node)
+    _receive(neighbor, 'bad')
+    _receive(neighbor, 'bad')
+    assert neighbor.get_signal_metrics()['failed'] == 2
+    assert neighbor.get_signal_metrics()['deduplicated'] == 0
+
+
+def test_only_the_newest_pending_signal_is_processed():
+    node = NodeStandIn()
+    neighbor = _neighbor(node)
+    for curves in ([[1]], [[2]], [[3]]):
+        neighbor.new_transactive_signal('pubsub', 'upstream', '', neighbor.subscribeTopic, {}, {'curves': curves})
+    neighbor._signal_greenlet.join()
+    assert neighbor.received == [[[3]]]
+    assert neighbor.get_signal_metrics()['superseded'] == 2
+
+
+def test_deduplication_can_be_turned_off():
+    node = NodeStandIn()
+    neighbor = _neighbor(node, deduplicate_signals=False)
+    _receive(neighbor, [[1, 2]])
+    _receive(neighbor, [[1, 2]])
+    assert len(neighbor.received) == 2
@@ -0,0 +1,65 @@
+import pytest
+
+from transactive_node.network_runner import InMemoryBus, NetworkRunner, load_config
+
+
+def test_load_config_ignores_comments_and_trailing_commas_outside_strings(tmp_path):
+    path = tmp_path / 'node.json'
+    path.write_text('{\n  # A comment\n  "name": "node # 1",\n  "topics": ["a,]", "b",],\n}\n')
+    assert load_config(str(path)) == {'name': 'node # 1', 'topics': ['a,]', 'b']}
+
+
+def test_load_config_reports_the_line_of_template_values(tmp_path):
+    path = tmp_path / 'template.json'
+    path.write_text('{\n  "name": "node",\n  "minimum_power": maximum_power/2\n}\n')
+    with pytest.raises(ValueError, match=r'line 3: .*"minimum_power": maximum_power/2'):
+        load_config(str(path))
+
+
+def test_add_node_requires_unique_names():
+    runner = NetworkRunner()
+    with pytest.raises(ValueError, match='must have a name'):
+        runner.add_node({})
+    runner.nodes['node'] = object()
+    with pytest.raises(ValueError, match='already has a node named node'):
+        runner.add_node({'name': 'node'})
+
+
+def test_add_node_rejects_unnamed_dependencies():
+    with pytest.raises(ValueError, match='Neighbors of node node must have names'):
+        NetworkRunner().add_node({'name': 'node', 'neighbors': [{'name': ''}]})
+
+
+def test_add_node_from_file_names_the_file_in_errors(tmp_path):
+    path = tmp_path / 'node.json'
+    path.write_text('{"localAssets": [{}]}')
+    with pytest.raises(ValueError, match=r'node.json: LocalAssets of node other must have names'):
+        NetworkRunner().add_node_from_file(str(path), 'other')
+
+
+def test_bus_delivers_copies_in_order_and_counts_errors():
+    bus = InMemoryBus()
+    received = []
+
+    def on_message(peer, sender, bus_name, topic, headers, message):
+        received.append((topic, message))
+        if topic == 'a/1':
+            bus.publish('node', 'a/2', message={'n': 2})
+
+    def on_error(*args):
+        raise RuntimeError('failed')
+
+    bus.subscribe('node', 'a/', on_message)
+    bus.subscribe('other', 'a/1', on_error)
+    message = {'n': 1}
+    bus.publish('node', 'a/1', message=message)
+    bus.publish('node', 'b/1', message={'n': 3})
+    assert received == []
+    assert bus.deliver() == 3
+    assert received == [('a/1', {'n': 1}), ('a/2', {'n': 2})]
+    assert received[0][1] is not message
+    assert bus.error_count == 1
+    bus.unsubscribe('node')
+    bus.publish('node', 'a/3', message={})
+    bus.deliver()
+    assert len(received) == 2
@@ -0,0 +1,50 @@
+import numpy as np
+
+from datetime import datetime, timedelta
+
+from transactive_node.local_asset.occupancy_manager import OccupancyManager
+
+SCHEDULE = {
+    'Monday': {'start': '8:00', 'end': '17:00'},
+    'Tuesday': {'start': '8:00', 'end': '17:00'},
+    'Saturday': 'always_on',
+    'Sunday': 'always_off'
+}
+MONDAY = datetime(2022, 2, 7)
+
+
+def test_schedule_bitmap():
+    manager = OccupancyManager(SCHEDULE)
+    assert not manager.check_schedule(MONDAY.replace(hour=7, minute=59))
+    assert manager.check_schedule(MONDAY.replace(hour=8))
+    assert manager.check_schedule(MONDAY.replace(hour=16, minute=59))
+    assert not manager.check_schedule(MONDAY.replace(hour=17))
+    # Wednesday is not in the schedule.
+    assert not manager.check_schedule(MONDAY + timedelta(days=2, hours=12))
+    assert manager.check_schedule(MONDAY + timedelta(days=5, hours=3))
+    assert not manager.check_schedule(MONDAY + timedelta(days=6, hours=12))
+
+
+def test_exceptions_replace_the_weekly_schedule():
+    manager = OccupancyManager(SCHEDULE, exceptions={'2022-02-07': 'always_off',
+                                                     '2022-02-09': {'start': '10:00', 'end': '11:00'}})
+    assert not manager.check_schedule(MONDAY.replace(hour=12))
+    assert manager.check_schedule(MONDAY + timedelta(days=1, hours=12))
+    assert manager.check_schedule(MONDAY + timedelta(days=2, hours=10, minutes=30))
+    # The exception is for one date only.
+    assert not manager.check_schedule(MONDAY + timedelta(days=7, hours=7))
+    assert manager.check_schedule(MONDAY + timedelta(days=7, hours=12))
+
+
+def test_without_schedule_always_occupied():
+    manager = OccupancyManager({})
+    assert manager.check_schedule(MONDAY + timedelta(days=6, hours=3))
+
+
+def test_check_schedule_many_matches_check_schedule():
+    manager = OccupancyManager(SCHEDULE, exceptions={'2022-02-08': 'always_off'})
+    times = [MONDAY + timedelta(minutes=17 * i) for i in range(1200)]
+    expected = [manager.check_schedule(t) for t in times]
+    assert manager.check_schedule_many(times).tolist() == expected
+    datetimes = np.array(times, dtype='datetime64[m]')
+    assert manager.check_schedule_many(datetimes).tolist() == expected
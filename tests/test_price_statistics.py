@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from transactive_node.util.price_statistics import get_price_statistics, invalidate_price_statistics
+
+START = datetime(2022, 2, 6, 10)
+
+
+class PriceModelStandIn(object):
+    def __init__(self):
+        self.calls = 0
+        self.average = 0.05
+
+    def get(self, start_time):
+        self.calls += 1
+        return self.average, 0.01
+
+
+def _market(price_model, intervals=3):
+    return SimpleNamespace(priceModel=price_model, timeIntervals=[
+        SimpleNamespace(startTime=START + timedelta(hours=h)) for h in range(intervals)])
+
+
+def test_statistics_are_filled_once_and_shared():
+    price_model = PriceModelStandIn()
+    market = _market(price_model)
+    statistics = get_price_statistics(market)
+    assert price_model.calls == 3
+    assert get_price_statistics(market) is statistics
+    assert statistics.get(START + timedelta(hours=1)) == (0.05, 0.01)
+    assert price_model.calls == 3
+    # Times outside the intervals are computed on demand.
+    assert statistics.get(START + timedelta(hours=5)) == (0.05, 0.01)
+    assert price_model.calls == 4
+
+
+def test_invalidated_statistics_follow_the_price_model():
+    price_model = PriceModelStandIn()
+    markets = [_market(price_model), _market(price_model)]
+    for market in markets:
+        get_price_statistics(market)
+    price_model.average = 0.07
+    invalidate_price_statistics(markets)
+    assert [get_price_statistics(m).get(START) for m in markets] == [(0.07, 0.01), (0.07, 0.01)]
@@ -0,0 +1,93 @@
+from transactive_node.tns_publisher import Publisher
+
+
+class RecordingPublisher(Publisher):
+    def __init__(self, *args, **kwargs):
+        super(RecordingPublisher, self).__init__(*args, **kwargs)
+        self.sent = []
+
+    def _send(self, topic, headers, message):
+        if message == 'fail':
+            raise RuntimeError('bus is down')
+        self.sent.append((topic, message))
+
+
+def test_records_with_the_same_key_coalesce_in_place():
+    publisher = RecordingPublisher()
+    publisher.publish('prices', {'v': 1})
+    publisher.publish('prices', {'v': 2})
+    assert publisher.queue_depth == 1
+    assert publisher.coalesced_count == 1
+    publisher.flush_all()
+    assert publisher.sent == [('prices', {'v': 2})]
+
+
+def test_interleaved_keys_of_a_topic_coalesce():
+    publisher = RecordingPublisher()
+    for version in range(3):
+        for market in ('A', 'B'):
+            publisher.publish('operation', {'market': market, 'version': version}, coalesce_key=market)
+    assert publisher.queue_depth == 2
+    publisher.flush_all()
+    assert publisher.sent == [('operation', {'market': 'A', 'version': 2}),
+                              ('operation', {'market': 'B', 'version': 2})]
+
+
+def test_records_published_after_a_flush_are_queued_again():
+    publisher = RecordingPublisher()
+    publisher.publish('prices', 1)
+    publisher.flush_all()
+    publisher.publish('prices', 2)
+    publisher.flush_all()
+    assert publisher.sent == [('prices', 1), ('prices', 2)]
+
+
+def test_uncoalesced_records_are_all_sent_in_order():
+    publisher = RecordingPublisher()
+    for n in range(3):
+        publisher.publish('curves', n, coalesce=False)
+    publisher.flush_all()
+    assert publisher.sent == [('curves', 0), ('curves', 1), ('curves', 2)]
+    assert publisher.coalesced_count == 0
+
+
+def test_flush_takes_topics_in_turn_up_to_the_batch_size():
+    publisher = RecordingPublisher(batch_size=3)
+    for n in range(3):
+        publisher.publish('a', n, coalesce=False)
+        publisher.publish('b', n, coalesce=False)
+    assert publisher.flush() == 3
+    assert publisher.sent == [('a', 0), ('b', 0), ('a', 1)]
+    assert publisher.queue_depth == 3
+
+
+def test_queued_records_are_snapshots():
+    publisher = RecordingPublisher()
+    curves = [[1, 2]]
+    publisher.publish('curves', {'Curves': curves})
+    curves.append([3, 4])
+    publisher.flush_all()
+    assert publisher.sent == [('curves', {'Curves': [[1, 2]]})]
+
+
+def test_oldest_records_are_dropped_beyond_max_queue_depth():
+    publisher = RecordingPublisher(max_queue_depth=3)
+    publisher.publish('other', 'x', coalesce=False)
+    for n in range(4):
+        publisher.publish('curves', n, coalesce=False)
+    assert publisher.queue_depth == 3
+    assert publisher.dropped_count == 2
+    publisher.flush_all()
+    # The oldest records of the topic being published to are dropped first.
+    assert publisher.sent == [('other', 'x'), ('curves', 2), ('curves', 3)]
+
+
+def test_send_failures_are_counted():
+    publisher = RecordingPublisher()
+    publisher.publish('a', 'fail')
+    publisher.publish('b', 'ok')
+    publisher.flush_all()
+    assert publisher.error_count == 1
+    assert publisher.published_count == 1
+    assert publisher.get_metrics()['queue_depth'] == 0
+
@@ -0,0 +1,77 @@
+import sqlite3
+
+import pytest
+
+from transactive_node.util.record_store import RecordStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = RecordStore(str(tmp_path), segment_seconds=100, retention_seconds=200, batch_size=10)
+    yield store
+    store.close()
+
+
+def test_records_are_written_to_segments_by_time(store):
+    store.append('meter', 10, 1.0, entity='m1')
+    store.append('meter', 150, 2.0, entity='m1')
+    store.append('cleared_price', 160, 0.05, market='ma', interval_start=3600, payload={'converged': True})
+    assert store.flush() == 3
+    assert store._segments() == [0, 100]
+    times, values = store.values('meter', entity='m1')
+    assert times.tolist() == [10, 150]
+    assert values.tolist() == [1.0, 2.0]
+    record, = store.query(kind='cleared_price', market='ma')
+    assert record['interval_start'] == 3600
+    assert record['payload'] == {'converged': True}
+
+
+def test_query_flushes_pending_records(store):
+    store.append('meter', 10, 1.0)
+    assert len(store.query(kind='meter', start=0, end=100)) == 1
+    assert store.query(kind='meter', start=100) == []
+
+
+def test_segments_older_than_retention_are_removed(store):
+    for time in (10, 150, 250):
+        store.append('meter', time, 1.0)
+    store.flush()
+    assert store._segments() == [0, 100, 200]
+    store.append('meter', 450, 1.0)
+    store.flush()
+    # The latest record is at 450, so the segments which ended by 250 are removed.
+    assert store._segments() == [200, 400]
+    assert store.values('meter')[0].tolist() == [250, 450]
+
+
+def test_failed_writes_are_requeued(store, monkeypatch):
+    connect = store._connect
+    failing = {0}
+
+    def flaky_connect(segment_start):
+        if segment_start in failing:
+            raise sqlite3.OperationalError('disk I/O error')
+        return connect(segment_start)
+    monkeypatch.setattr(store, '_connect', flaky_connect)
+
+    store.append('meter', 10, 1.0)
+    store.append('meter', 110, 2.0)
+    assert store.flush() == 1
+    assert store.get_metrics()['pending'] == 1
+    failing.clear()
+    assert store.flush() == 1
+    assert store.values('meter')[1].tolist() == [1.0, 2.0]
+    assert store.dropped_count == 0
+
+
+def test_oldest_unwritten_records_are_dropped_beyond_max_pending(tmp_path, monkeypatch):
+    store = RecordStore(str(tmp_path), batch_size=2, max_pending=3)
+
+    def failing_connect(segment_start):
+        raise sqlite3.OperationalError('database is locked')
+    monkeypatch.setattr(store, '_connect', failing_connect)
+    for time in range(5):
+        store.append('meter', time, float(time))
+    store.flush()
+    assert store.dropped_count == 2
+    assert [row[5] for row in store._pending] == [2.0, 3.0, 4.0]
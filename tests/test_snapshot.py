@@ -0,0 +1,149 @@
+import json
+import os
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from tent.containers.interval_value import IntervalValue
+from tent.containers.time_interval import TimeInterval
+from tent.containers.transactive_record import TransactiveRecord
+from tent.containers.vertex import Vertex
+from tent.enumerations.market_state import MarketState
+from tent.enumerations.measurement_type import MeasurementType
+
+from transactive_node.util import snapshot
+from transactive_node.util.snapshot import SnapshotStore
+
+
+def _payload(n):
+    return json.dumps({'n': n}).encode()
+
+
+def test_latest_snapshot_is_read_first(tmp_path):
+    store = SnapshotStore(str(tmp_path), keep=2)
+    for n in range(3):
+        store.write(_payload(n))
+    assert len(os.listdir(tmp_path)) == 2
+    assert [json.loads(payload)['n'] for _, payload in store.latest()] == [2, 1]
+
+
+def test_corrupt_snapshot_falls_back_to_previous(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.write(_payload(1))
+    path = store.write(_payload(2))
+    with open(path, 'r+b') as f:
+        f.seek(-4, os.SEEK_END)
+        f.write(b'\x00\x00\x00\x00')
+    assert [json.loads(payload)['n'] for _, payload in store.latest()] == [1]
+
+
+def test_truncated_and_foreign_files_are_skipped(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.write(_payload(1))
+    with open(os.path.join(tmp_path, 'snapshot-99990101T000000000000.tns'), 'wb') as f:
+        f.write(b'TNS')
+    with open(os.path.join(tmp_path, 'snapshot-99980101T000000000000.tns'), 'wb') as f:
+        f.write(b'XXXX' + bytes(64))
+    assert [json.loads(payload)['n'] for _, payload in store.latest()] == [1]
+
+
+def test_no_temporary_files_are_left(tmp_path):
+    store = SnapshotStore(str(tmp_path))
+    store.write(_payload(1))
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_load_rejects_other_record_versions():
+    with pytest.raises(ValueError):
+        snapshot.load(json.dumps({'version': snapshot.FORMAT_VERSION - 1}).encode())
+    with pytest.raises(ValueError):
+        snapshot.load(json.dumps({'version': snapshot.FORMAT_VERSION, 'node': 'n'}).encode())
+
+
+START = datetime(2022, 2, 6, 10)
+
+
+class MarketStandIn(object):
+    def __init__(self, name, series='Day-Ahead_Auction'):
+        self.name = name
+        self.marketSeriesName = series
+        self.marketState = MarketState.Delivery
+        self.marketClearingTime = START
+        self.timeIntervals = []
+        self.marginalPrices = []
+
+
+class DependencyStandIn(object):
+    def __init__(self, name):
+        self.name = name
+        self.scheduledPowers = []
+        self.reserveMargins = []
+        self.activeVertices = []
+
+
+class NeighborStandIn(DependencyStandIn):
+    def __init__(self, name):
+        super(NeighborStandIn, self).__init__(name)
+        self.sentSignal = []
+        self.receivedSignal = []
+
+
+class NodeStandIn(object):
+    def __init__(self):
+        self.name = 'node'
+        self.markets = [MarketStandIn('Day-Ahead_Auction-1')]
+        self.localAssets = [DependencyStandIn('building')]
+        self.neighbors = [NeighborStandIn('campus')]
+
+
+def _running_node():
+    tn = NodeStandIn()
+    market = tn.markets[0]
+    for hour in range(2):
+        time_interval = TimeInterval(START, timedelta(hours=1), market, START, START + timedelta(hours=hour))
+        market.timeIntervals.append(time_interval)
+        market.marginalPrices.append(IntervalValue(market, time_interval, market, MeasurementType.MarginalPrice,
+                                                   [0.05, 0.06][hour]))
+        asset = tn.localAssets[0]
+        asset.scheduledPowers.append(IntervalValue(asset, time_interval, market, MeasurementType.ScheduledPower,
+                                                   10.0 + hour))
+        asset.reserveMargins.append(IntervalValue(asset, time_interval, market, MeasurementType.ReserveMargin, 1.0))
+        asset.activeVertices.append(IntervalValue(asset, time_interval, market, MeasurementType.ActiveVertex,
+                                                  Vertex(0.05, 0.0, 10.0 + hour)))
+        neighbor = tn.neighbors[0]
+        neighbor.sentSignal.append(TransactiveRecord(time_interval, 0, 0.05, 5.0 + hour))
+        neighbor.receivedSignal.append(TransactiveRecord(time_interval, 1, 0.06, -5.0 - hour))
+    return tn
+
+
+def test_restore_rebuilds_markets_and_negotiation_state():
+    payload = snapshot.capture(_running_node(), fingerprint='abc')
+    record = snapshot.load(payload)
+    assert record['fingerprint'] == 'abc'
+
+    tn = NodeStandIn()
+    assert snapshot.restore(tn, record)
+    market = tn.markets[0]
+    assert [ti.startTime for ti in market.timeIntervals] == [START, START + timedelta(hours=1)]
+    assert [p.value for p in market.marginalPrices] == [0.05, 0.06]
+    assert market.marketState == MarketState.Delivery
+    asset = tn.localAssets[0]
+    assert [iv.value for iv in asset.scheduledPowers] == [10.0, 11.0]
+    assert asset.scheduledPowers[1].timeInterval is market.timeIntervals[1]
+    assert [iv.value for iv in asset.reserveMargins] == [1.0, 1.0]
+    assert [iv.value.power for iv in asset.activeVertices] == [10.0, 11.0]
+    neighbor = tn.neighbors[0]
+    assert [(r.record, r.power) for r in neighbor.sentSignal] == [(0, 5.0), (0, 6.0)]
+    assert [(r.record, r.marginalPrice) for r in neighbor.receivedSignal] == [(1, 0.06), (1, 0.06)]
+    assert isinstance(neighbor.receivedSignal[0], TransactiveRecord)
+    assert isinstance(neighbor.receivedSignal[0].timeStamp, datetime)
+    assert neighbor.receivedSignal[1].timeInterval == market.timeIntervals[1].name
+
+
+def test_restore_without_configured_series_does_nothing():
+    record = snapshot.load(snapshot.capture(_running_node()))
+    tn = NodeStandIn()
+    tn.markets = [MarketStandIn('Real-Time_Auction-1', series='Real-Time_Auction')]
+    assert not snapshot.restore(tn, record)
+    assert tn.neighbors[0].sentSignal == []
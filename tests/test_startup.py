@@ -0,0 +1,37 @@
+import gevent
+
+from transactive_node.local_asset.tcc_model import TCCModel
+from transactive_node.network_runner import NetworkRunner
+
+
+def test_startup_timings_cover_each_dependency_type():
+    runner = NetworkRunner(simulation_start_time='2022-02-06T10:00:00')
+    timings = runner.add_node({'name': 'node'}).get_startup_timings()
+    assert list(timings) == ['init', 'configure (NEW)']
+    assert list(timings['configure (NEW)']) == ['MeterPoints', 'InformationServiceModels', 'LocalAssets', 'Neighbors',
+                                                'Markets', 'total']
+    assert all(seconds >= 0 for seconds in timings['configure (NEW)'].values())
+
+
+def test_failed_tcc_agent_builds_are_retried_with_backoff():
+    attempts = []
+
+    def build():
+        attempts.append(model.tcc_agent_failures)
+        if len(attempts) < 3:
+            raise RuntimeError('platform not ready')
+        return 'agent'
+
+    model = TCCModel.__new__(TCCModel)
+    model.name = 'tcc'
+    model.tcc_agent_failures = 0
+    model.tcc_agent_retry_base = 0.001
+    model.tcc_agent_retry_max = 0.01
+    model._build_tcc_agent = build
+    model._spawn_tcc_agent_build()
+    with gevent.Timeout(5):
+        while not (model.tcc_agent_greenlet.ready() and model.tcc_agent_greenlet.successful()):
+            gevent.sleep(0.005)
+    assert attempts == [0, 1, 2]
+    assert model.tcc_agent_failures == 2
+    assert model.tcc_agent_greenlet.value == 'agent'
@@ -0,0 +1,62 @@
+import numpy as np
+
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from transactive_node.model_frame.thermostat import CSP, OAT, TIN, Thermostat
+from transactive_node.model_frame.time_series import DeviceHistory
+
+TRUE_COEFFICIENTS = np.array([-0.1, 0.05, 0.02, 1.0])
+
+
+def _thermostat(**config):
+    config = dict({c: [0.0] * 24 for c in ('c1', 'c2', 'c3', 'c4')}, rated_power=10.0, **config)
+    return Thermostat(config)
+
+
+def _duty_cycle(csp, temp, oat):
+    return float(np.array([csp, temp, oat, 1.0]) @ TRUE_COEFFICIENTS)
+
+
+def test_calibration_converges_to_the_coefficients_of_the_hour():
+    thermostat = _thermostat(forgetting_factor=1.0, calibration_initial_covariance=1.0e6,
+                             calibration_max_covariance=1.0e7)
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        csp, temp, oat = 22.0 + rng.uniform(-2, 2), 23.0 + rng.uniform(-2, 2), 25.0 + rng.uniform(-5, 5)
+        thermostat.calibrate_sample(7, csp, temp, oat, _duty_cycle(csp, temp, oat))
+    assert np.allclose(thermostat.coefficient_array[7], TRUE_COEFFICIENTS, atol=1e-3)
+    # The coefficients are seen through the hourly views, and the other hours are untouched.
+    assert thermostat.c1[7] == thermostat.coefficient_array[7, 0]
+    assert thermostat.calibration_samples[7] == 200
+    assert not thermostat.coefficient_array[8].any()
+
+
+def test_saturated_duty_cycles_are_ignored():
+    thermostat = _thermostat()
+    thermostat.calibrate_sample(7, 22.0, 23.0, 30.0, 1.0)
+    thermostat.calibrate_sample(7, 22.0, 23.0, 10.0, 0.0)
+    assert not thermostat.coefficient_array.any()
+    assert thermostat.calibration_samples[7] == 0
+
+
+def test_covariance_is_bounded_without_excitation():
+    thermostat = _thermostat(forgetting_factor=0.5, calibration_max_covariance=500.0)
+    for _ in range(50):
+        thermostat.calibrate_sample(7, 22.0, 23.0, 25.0, 0.5)
+    assert np.trace(thermostat.covariance[7]) <= 500.0 + 1e-9
+
+
+def test_each_completed_window_is_one_sample_of_its_hour():
+    history = DeviceHistory()
+    thermostat = _thermostat(calibrate=True, calibration_point='Cooling', calibration_window=600, topic='rtu')
+    thermostat.parent = SimpleNamespace(device_history=history)
+    start = datetime(2022, 2, 6, 10, tzinfo=timezone.utc)
+    for minute in range(0, 21):
+        now = start + timedelta(minutes=minute)
+        data = {OAT: 25.0, CSP: 22.0, TIN: 23.0, 'Cooling': float(minute % 2)}
+        history.append('rtu', now, data)
+        thermostat.update_data(data, now)
+    # The windows starting at 10:00 and 10:10 are complete, the one starting at 10:20 is not.
+    assert thermostat.calibration_samples[10] == 2
+    assert thermostat.calibration_samples.sum() == 2
@@ -0,0 +1,77 @@
+import numpy as np
+
+from datetime import datetime, timedelta
+
+from transactive_node.model_frame.time_series import DeviceHistory, RingBufferSeries
+
+
+def test_window_is_latest_rows_in_order_after_wrap_around():
+    series = RingBufferSeries(['a'], capacity=4)
+    for t in range(10):
+        series.append(t, {'a': t * 10})
+    times, values = series.window()
+    assert len(series) == 4
+    assert times.tolist() == [6, 7, 8, 9]
+    assert values[:, 0].tolist() == [60, 70, 80, 90]
+    assert series.latest('a') == 90
+
+
+def test_window_by_seconds_and_count():
+    series = RingBufferSeries(['a'], capacity=8)
+    for t in range(8):
+        series.append(t, {'a': t})
+    assert series.column('a', seconds=2).tolist() == [5, 6, 7]
+    assert series.column('a', count=2).tolist() == [6, 7]
+
+
+def test_out_of_order_rows_are_dropped():
+    series = RingBufferSeries(['a'], capacity=4)
+    series.append(10, {'a': 1})
+    series.append(5, {'a': 2})
+    series.append(10, {'a': 3})
+    assert series.dropped == 1
+    assert series.column('a').tolist() == [1, 3]
+
+
+def test_new_points_are_added_as_columns():
+    series = RingBufferSeries(['a'], capacity=4)
+    series.append(0, {'a': 1})
+    series.append(1, {'a': 2, 'b': 5, 'status': 'on'})
+    assert series.points == ['a', 'b', 'status']
+    assert np.isnan(series.column('b')[0])
+    assert series.latest('b') == 5
+    assert series.latest('status') is None
+
+
+def test_interval_mean_includes_start_and_excludes_end():
+    series = RingBufferSeries(['on'], capacity=16)
+    start = datetime(2022, 2, 6, 10)
+    for minute, on in enumerate([1, 1, 0, 0, 1, 0]):
+        series.append(start + timedelta(minutes=minute), {'on': on})
+    assert series.interval_mean('on', start, start + timedelta(minutes=4)) == 0.5
+    assert series.interval_mean('on', start + timedelta(minutes=4), start + timedelta(minutes=6)) == 0.5
+    assert series.interval_mean('on', start + timedelta(hours=1), start + timedelta(hours=2)) is None
+    assert series.interval_mean('missing', start, start + timedelta(minutes=4)) is None
+
+
+def test_interval_mean_after_wrap_around():
+    series = RingBufferSeries(['a'], capacity=3)
+    for t in range(6):
+        series.append(t, {'a': t})
+    assert series.interval_mean('a', 0, 6) == 4.0
+
+
+def test_stats_and_gaps():
+    series = RingBufferSeries(['a'], capacity=8)
+    for t in (0, 1, 2, 10, 11):
+        series.append(t, {'a': t})
+    assert series.stats('a')['count'] == 5
+    assert series.stats('a')['max'] == 11
+    assert series.gaps(max_interval=5) == [(2.0, 10.0)]
+
+
+def test_device_history_capacity_from_horizon():
+    history = DeviceHistory(horizon=3600, sample_period=60)
+    history.append('devices/ahu', 0, {'a': 1})
+    assert 'devices/ahu' in history
+    assert history.get('devices/ahu').capacity == 60
@@ -0,0 +1,63 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from transactive_node.util.timer import Timer as SimulationTimer
+
+START = datetime(2022, 2, 6)
+
+
+class LibraryTimer(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return START.replace(year=2000)
+
+    @classmethod
+    def get_cur_time(cls):
+        return cls.now()
+
+
+class InheritingTimer(datetime):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def reset_clock():
+    yield
+    for timer_class in list(SimulationTimer._installed):
+        SimulationTimer.uninstall(timer_class)
+    SimulationTimer.set()
+
+
+def test_discrete_clock_stands_still_until_advanced():
+    SimulationTimer.set(3600, START, simulation=True, discrete_event=True)
+    assert SimulationTimer.now() == START
+    SimulationTimer.advance_to(START + timedelta(hours=1))
+    assert SimulationTimer.get_cur_time() == START + timedelta(hours=1)
+    # The clock never moves backward.
+    SimulationTimer.advance_to(START)
+    assert SimulationTimer.now() == START + timedelta(hours=1)
+
+
+def test_discrete_clock_needs_a_start_time():
+    with pytest.raises(ValueError):
+        SimulationTimer.set(3600, None, simulation=True, discrete_event=True)
+
+
+def test_install_and_uninstall_restore_the_library_clock():
+    SimulationTimer.set(3600, START, simulation=True, discrete_event=True)
+    SimulationTimer.install(LibraryTimer)
+    SimulationTimer.install(LibraryTimer)
+    assert LibraryTimer.get_cur_time() == START
+    SimulationTimer.uninstall(LibraryTimer)
+    assert LibraryTimer.get_cur_time() == START.replace(year=2000)
+    assert LibraryTimer.now() == START.replace(year=2000)
+
+
+def test_uninstall_restores_inherited_methods():
+    SimulationTimer.set(3600, START, simulation=True, discrete_event=True)
+    SimulationTimer.install(InheritingTimer)
+    assert InheritingTimer.now() == START
+    SimulationTimer.uninstall(InheritingTimer)
+    assert 'now' not in vars(InheritingTimer)
+    assert InheritingTimer.now() != START
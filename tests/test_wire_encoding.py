@@ -0,0 +1,65 @@
+import json
+
+from collections import OrderedDict
+from datetime import datetime
+from enum import IntEnum
+
+import pytest
+
+from transactive_node.util import wire_encoding
+from transactive_node.util.wire_encoding import JSON, MSGPACK, WireEncoder, pack, to_wire, unpack
+
+
+class RecordStandIn(object):
+    def __init__(self, value):
+        self.value = value
+        self.time = datetime(2022, 2, 6, 10)
+
+
+def _default(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    return obj.__dict__
+
+
+class Level(IntEnum):
+    LOW = 1
+
+
+@pytest.mark.parametrize('obj', [
+    {'a': [1, 2.5, None, True, 'x'], 'b': {'c': (1, 2)}},
+    {1: 'int key', 2.5: 'float key', False: 'bool key', None: 'null key'},
+    [RecordStandIn(1), RecordStandIn([RecordStandIn(2)])],
+    OrderedDict([('z', 1), ('a', Level.LOW)]),
+    'text'
+])
+def test_encode_matches_json_round_trip(obj):
+    expected = json.loads(json.dumps(obj, default=_default))
+    assert WireEncoder(_default).encode(obj) == expected
+
+
+def test_unsupported_keys_raise_type_error():
+    with pytest.raises(TypeError):
+        WireEncoder(_default).encode({(1, 2): 'tuple key'})
+
+
+def test_to_wire_copies_containers():
+    curves = [[1, 2]]
+    message = {'Curves': curves}
+    wire = to_wire(message)
+    curves.append([3, 4])
+    assert wire == {'Curves': [[1, 2]]}
+
+
+def test_json_payload_is_unchanged():
+    wire = {'a': [1, 2]}
+    assert pack(wire, JSON) is wire
+    assert unpack(wire, JSON) is wire
+
+
+@pytest.mark.skipif(wire_encoding.msgpack is None, reason='msgpack is not installed')
+def test_msgpack_round_trip():
+    wire = {'a': [1, 2.5, None, 'x'], 'b': {'c': True}}
+    payload = pack(wire, MSGPACK)
+    assert isinstance(payload, str)
+    assert unpack(payload, MSGPACK) == wire
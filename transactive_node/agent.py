@@ -41,14 +41,18 @@ operated by BATTELLE for the UNITED STATES DEPARTMENT OF ENERGY
 under Contract DE-AC05-76RL01830
 """
 
-import gevent
+import copy
 import importlib
 import logging
+import os
 import pytz
 import re
 import sys
+import time
 
+from collections import OrderedDict
 from dateutil import parser
+from gevent.pool import Group
 from tzlocal import get_localzone
 
 from tent.enumerations.market_state import MarketState
@@ -56,13 +60,41 @@ from tent.market import Market
 from tent.transactive_node import TransactiveNode
 from tent.utils.timer import Timer
 
+from transactive_node.tns_meter_point import MeterRegistry
+from transactive_node.tns_publisher import TNSPublisher
+from transactive_node.util.instrumentation import Instrumentation
+from transactive_node.util.market_scheduler import MarketScheduler
+from transactive_node.util.record_store import RecordStore
+from transactive_node.util import snapshot
+from transactive_node.util.timer import Timer as SimulationTimer
+
+from volttron.platform import get_home
 from volttron.platform.agent import utils
-from volttron.platform.vip.agent import Agent, Core
+from volttron.platform.vip.agent import Agent, Core, RPC
 
 utils.setup_logging()
 _log = logging.getLogger(__name__)
 __version__ = '0.1'
 
+_first_cap_re = re.compile('(.)([A-Z][a-z]+)')
+_all_cap_re = re.compile('([a-z0-9])([A-Z])')
+_dependency_classes = {}  # (module_name, class_name) -> class
+
+
+def camel_to_snake(name):
+    s1 = _first_cap_re.sub(r'\1_\2', name)
+    return _all_cap_re.sub(r'\1_\2', s1).lower()
+
+
+def resolve_dependency_class(module_name, class_name):
+    """Import and return a dependency class. Classes are cached, so each module is only looked up once."""
+    key = (module_name, class_name)
+    dependency_class = _dependency_classes.get(key)
+    if dependency_class is None:
+        _log.debug(f'module_name is: {module_name}')
+        dependency_class = _dependency_classes[key] = getattr(importlib.import_module(module_name), class_name)
+    return dependency_class
+
 
 class TransactiveNodeAgent(Agent, TransactiveNode):
     """Transactive Node Agent.
@@ -72,10 +104,37 @@ class TransactiveNodeAgent(Agent, TransactiveNode):
     The Transactive Node Agent handles configuration of the node and its services,
     provides access to messages on the VOLTTRON message bus, and runs the loop.
     """
+    # Dependency types in the order they are configured.
+    DEPENDENCY_TYPES = [('meterPoints', 'MeterPoints'),
+                        ('informationServiceModels', 'InformationServiceModels'),
+                        ('localAssets', 'LocalAssets'),
+                        ('neighbors', 'Neighbors'),
+                        ('markets', 'Markets')]
+    # Local assets and neighbors hold references to the meter points and information services, so are rebuilt with them.
+    REFERENCED_DEPENDENCIES = ('meterPoints', 'informationServiceModels')
+    REFERENCING_DEPENDENCIES = ('localAssets', 'neighbors')
+    # Changes to these settings affect the topics or clocks of every dependency, so all of them are rebuilt.
+    NODE_CONFIG_KEYS = ('name', 'db_topic', 'subscribe_all_platforms', 'tz', 'simulation', 'simulation_start_time',
+                        'simulation_one_hour_in_seconds', 'simulation_discrete_event')
+    # Configuration keys of the record store, which is only rebuilt when one of them changes.
+    RECORD_STORE_KEYS = ('record_store_directory', 'record_store_segment_seconds', 'record_store_retention_seconds',
+                         'record_store_flush_interval')
+
     def __init__(self, config_path=None, *args, **kwargs):
         _log.debug('in init')
-        Agent.__init__(self, *args, **kwargs)
+        init_start = self._created = time.perf_counter()
+        self.startup_timings = OrderedDict()
+        self._init_platform(*args, **kwargs)
         _log.debug('Agent initialized')
+        self.instrumentation = Instrumentation()
+        # These return an AsyncResult at once, so only the time to queue the message is measured, not the round trip.
+        self.instrumentation.wrap(self.vip.pubsub, 'publish', 'pubsub.publish.enqueue')
+        self.instrumentation.wrap(self.vip.pubsub, 'subscribe', 'pubsub.subscribe.enqueue')
+        self.instrumentation.wrap(self.vip.rpc, 'call', 'rpc.call.enqueue')
+        self._subscriptions = []  # [(prefix, callback)] of the dependencies, to unsubscribe them when they are removed.
+        self._track_subscriptions()
+        self._active_config = None  # The configuration of the dependencies which are currently running.
+        self._scheduler_start = None
         TransactiveNode.__init__(self)
         _log.debug('Node initialized')
 
@@ -88,6 +147,7 @@ class TransactiveNodeAgent(Agent, TransactiveNode):
         self.transactive_record_topic = f'{self.db_topic}/{self.name}/transactive_record'
         self.local_asset_topic = f"{self.db_topic}/{self.name}/local_assets"
         self.market_balanced_price_topic = "{}/{}/market_balanced_prices".format(self.db_topic, self.name)
+        self.instrumentation_topic = f"{self.db_topic}/{self.name}/instrumentation"
         self.subscribe_all_platforms = False
         self.tz = get_localzone()  # TODO: The Timer does not use aware date-times. This should be fixed.
         self.plots_active = False  # TODO: Do the plots actually belong in the agent code, if not where?
@@ -95,6 +155,38 @@ class TransactiveNodeAgent(Agent, TransactiveNode):
         self.simulation = False
         self.simulation_start_time = Timer.get_cur_time()
         self.simulation_one_hour_in_seconds = 3600
+        self.simulation_discrete_event = False
+        self.scheduler_poll_interval = 1.0
+        self.scheduler_max_sleep = 60.0
+        self.scheduler_settle_time = 0.0
+        self.scheduler_start_delay = 5.0
+        self.concurrent_startup = True
+        self.market_scheduler = MarketScheduler(self, self.scheduler_poll_interval, self.scheduler_max_sleep,
+                                                self.scheduler_settle_time)
+        self.publish_batch_size = 100
+        self.publish_coalesce_window = 0.5
+        self.publish_max_queue_depth = 10000
+        self.publisher = TNSPublisher(self, self.publish_batch_size, self.publish_coalesce_window,
+                                      self.publish_max_queue_depth)
+        self.transactive_operation_deltas = False
+        self.transactive_operation_full_interval = 10
+        self.instrumentation_enabled = True
+        self.instrumentation_sample_every = 1
+        self.instrumentation_publish_interval = 0
+        self._instrumentation_greenlet = None
+        self.snapshot_interval = 0
+        self.snapshot_directory = 'snapshots'  # Relative to the data directory of the agent.
+        self.snapshot_keep = 3
+        self.snapshot_max_age = 3600
+        self._snapshot_store = None
+        self._snapshot_greenlet = None
+        self._config_fingerprint = None
+        self.record_store_directory = None
+        self.record_store_segment_seconds = 86400
+        self.record_store_retention_seconds = 2592000
+        self.record_store_flush_interval = 5.0
+        self.record_store = None
+        self._record_store_greenlet = None
 
         # TODO: Add configuration in appropriate dependency class (probably ConsensusMarket):
         #  self.reschedule_interval = timedelta(minutes=10, seconds=1)
@@ -122,6 +214,27 @@ class TransactiveNodeAgent(Agent, TransactiveNode):
             "tz": self.tz,
             "plots_active": self.plots_active,
             "simulation": self.simulation,
+            "scheduler_poll_interval": self.scheduler_poll_interval,
+            "scheduler_max_sleep": self.scheduler_max_sleep,
+            "scheduler_settle_time": self.scheduler_settle_time,
+            "scheduler_start_delay": self.scheduler_start_delay,
+            "concurrent_startup": self.concurrent_startup,
+            "publish_batch_size": self.publish_batch_size,
+            "publish_coalesce_window": self.publish_coalesce_window,
+            "publish_max_queue_depth": self.publish_max_queue_depth,
+            "transactive_operation_deltas": self.transactive_operation_deltas,
+            "transactive_operation_full_interval": self.transactive_operation_full_interval,
+            "instrumentation_enabled": self.instrumentation_enabled,
+            "instrumentation_sample_every": self.instrumentation_sample_every,
+            "instrumentation_publish_interval": self.instrumentation_publish_interval,
+            "snapshot_interval": self.snapshot_interval,
+            "snapshot_directory": self.snapshot_directory,
+            "snapshot_keep": self.snapshot_keep,
+            "snapshot_max_age": self.snapshot_max_age,
+            "record_store_directory": self.record_store_directory,
+            "record_store_segment_seconds": self.record_store_segment_seconds,
+            "record_store_retention_seconds": self.record_store_retention_seconds,
+            "record_store_flush_interval": self.record_store_flush_interval,
 
             # TODO: Add configuration in appropriate dependency class (probably ConsensusMarket):
             #  "reschedule_interval": self.reschedule_interval.total_seconds(),
@@ -129,17 +242,43 @@ class TransactiveNodeAgent(Agent, TransactiveNode):
         if self.simulation:
             self.default_config["simulation_start_time"] = utils.format_timestamp(self.simulation_start_time)
             self.default_config["simulation_one_hour_in_seconds"] = self.simulation_one_hour_in_seconds
+            self.default_config["simulation_discrete_event"] = self.simulation_discrete_event
         _log.debug('TN: before set_default')
         self.vip.config.set_default("config", self.default_config)
         _log.debug('TN: after set_default')
         self.vip.config.subscribe(self.configure_main, actions=["NEW", "UPDATE"], pattern="config")
+        self.startup_timings['init'] = time.perf_counter() - init_start
         _log.debug('TN: end of init')
 
+    @property
+    def meterPoints(self) -> MeterRegistry:
+        return self._meter_points
+
+    @meterPoints.setter
+    def meterPoints(self, meters):
+        # Meter points are looked up by hook and topic, so keep them in an indexed registry.
+        self._meter_points = meters if isinstance(meters, MeterRegistry) else MeterRegistry(meters if meters else [])
+
+    def _init_platform(self, *args, **kwargs):
+        # Connection to the VOLTTRON platform. The in-process network runner overrides this to attach its own bus.
+        Agent.__init__(self, *args, **kwargs)
+
     def configure_main(self, config_name, action, contents):
         _log.info('Received configuration {} signal: {}'.format(action, config_name))
-        self.vip.pubsub.unsubscribe("pubsub", None, None)
+        configure_start = time.perf_counter()
+        timings = OrderedDict()
         config = self.default_config.copy()
         config.update(contents)
+        old_config = self._active_config
+        full_rebuild = old_config is None or any(old_config.get(k) != config.get(k) for k in self.NODE_CONFIG_KEYS)
+        if full_rebuild:
+            self.vip.pubsub.unsubscribe("pubsub", None, None)
+            self._subscriptions = []
+        # Dependencies consume their configurations, so keep a copy to compare with the next update.
+        active_config = {k: copy.deepcopy(config.get(k)) for k in self.NODE_CONFIG_KEYS}
+        active_config.update({attribute: copy.deepcopy(config.get(attribute))
+                              for attribute, _ in self.DEPENDENCY_TYPES})
+        active_config.update({k: config.get(k) for k in self.RECORD_STORE_KEYS})
 
         # TransactiveNode Configurations:
         self.description = config.get('description', self.description)
@@ -153,6 +292,7 @@ class TransactiveNodeAgent(Agent, TransactiveNode):
         self.transactive_record_topic = f'{self.db_topic}/{self.name}/transactive_record'
         self.local_asset_topic = f"{self.db_topic}/{self.name}/local_assets"
         self.market_balanced_price_topic = "{}/{}/market_balanced_prices".format(self.db_topic, self.name)
+        self.instrumentation_topic = f"{self.db_topic}/{self.name}/instrumentation"
         self.subscribe_all_platforms = bool(config.get('subscribe_all_platforms', self.subscribe_all_platforms))
         self.tz = pytz.timezone(str(config.get('tz', self.tz)))
         self.plots_active = bool(config.get('plots_active', self.plots_active))
@@ -163,10 +303,106 @@ class TransactiveNodeAgent(Agent, TransactiveNode):
             self.simulation_start_time = parser.parse(config.get('simulation_start_time', self.simulation_start_time))
             self.simulation_one_hour_in_seconds = int(config.get('simulation_one_hour_in_seconds',
                                                                  self.simulation_one_hour_in_seconds))
-        Timer.created_time = Timer.get_cur_time()
-        Timer.simulation = self.simulation
-        Timer.sim_start_time = self.simulation_start_time
-        Timer.sim_one_hr_in_sec = self.simulation_one_hour_in_seconds
+            self.simulation_discrete_event = bool(config.get('simulation_discrete_event',
+                                                             self.simulation_discrete_event))
+        # The clock settings are node configuration keys, so the clock is only (re)started with a full rebuild.
+        # Resetting it under the markets kept by a partial update would move market time backward.
+        if full_rebuild:
+            if self.simulation and self.simulation_discrete_event:
+                if not config.get('simulation_start_time'):
+                    raise ValueError('simulation_discrete_event requires a simulation_start_time.')
+                # Market time jumps from one scheduled event to the next instead of following the wall clock.
+                SimulationTimer.set(self.simulation_one_hour_in_seconds, self.simulation_start_time, simulation=True,
+                                    discrete_event=True)
+                SimulationTimer.install(Timer)
+            else:
+                # A previous configuration may have run a discrete clock. Give the library its own clock back.
+                SimulationTimer.uninstall(Timer)
+                SimulationTimer.set(self.simulation_one_hour_in_seconds, self.simulation_start_time,
+                                    simulation=self.simulation)
+            Timer.created_time = Timer.get_cur_time()
+            Timer.simulation = self.simulation
+            Timer.sim_start_time = self.simulation_start_time
+            Timer.sim_one_hr_in_sec = self.simulation_one_hour_in_seconds
+
+        # Market Scheduler Configurations:
+        self.scheduler_poll_interval = float(config.get('scheduler_poll_interval', self.scheduler_poll_interval))
+        self.scheduler_max_sleep = float(config.get('scheduler_max_sleep', self.scheduler_max_sleep))
+        self.market_scheduler.poll_interval = self.scheduler_poll_interval
+        self.market_scheduler.max_sleep = self.scheduler_max_sleep
+        self.scheduler_settle_time = float(config.get('scheduler_settle_time', self.scheduler_settle_time))
+        self.market_scheduler.settle_time = self.scheduler_settle_time
+        self.scheduler_start_delay = float(config.get('scheduler_start_delay', self.scheduler_start_delay))
+        self.concurrent_startup = bool(config.get('concurrent_startup', self.concurrent_startup))
+
+        # Publisher Configurations:
+        self.publish_batch_size = int(config.get('publish_batch_size', self.publish_batch_size))
+        self.publish_coalesce_window = float(config.get('publish_coalesce_window', self.publish_coalesce_window))
+        self.publish_max_queue_depth = int(config.get('publish_max_queue_depth', self.publish_max_queue_depth))
+        self.publisher.batch_size = self.publish_batch_size
+        self.publisher.coalesce_window = self.publish_coalesce_window
+        self.publisher.max_queue_depth = max(self.publish_max_queue_depth, 1)
+        self.publisher.start()
+        self.transactive_operation_deltas = bool(config.get('transactive_operation_deltas',
+                                                            self.transactive_operation_deltas))
+        self.transactive_operation_full_interval = int(config.get('transactive_operation_full_interval',
+                                                                  self.transactive_operation_full_interval))
+
+        # Instrumentation Configurations:
+        self.instrumentation_enabled = bool(config.get('instrumentation_enabled', self.instrumentation_enabled))
+        self.instrumentation_sample_every = int(config.get('instrumentation_sample_every',
+                                                           self.instrumentation_sample_every))
+        self.instrumentation_publish_interval = float(config.get('instrumentation_publish_interval',
+                                                                 self.instrumentation_publish_interval))
+        self.instrumentation.enabled = self.instrumentation_enabled
+        self.instrumentation.sample_every = max(self.instrumentation_sample_every, 1)
+        if self._instrumentation_greenlet is not None:
+            self._instrumentation_greenlet.kill()
+            self._instrumentation_greenlet = None
+        if self.instrumentation_enabled and self.instrumentation_publish_interval > 0:
+            self._instrumentation_greenlet = self.core.periodic(self.instrumentation_publish_interval,
+                                                                self.publish_instrumentation,
+                                                                wait=self.instrumentation_publish_interval)
+
+        # Snapshot Configurations:
+        self.snapshot_interval = float(config.get('snapshot_interval', self.snapshot_interval))
+        self.snapshot_directory = str(config.get('snapshot_directory', self.snapshot_directory))
+        self.snapshot_keep = int(config.get('snapshot_keep', self.snapshot_keep))
+        self.snapshot_max_age = float(config.get('snapshot_max_age', self.snapshot_max_age))
+        self._snapshot_store = snapshot.SnapshotStore(self.data_path(self.snapshot_directory), self.snapshot_keep) \
+            if self.snapshot_interval > 0 else None
+        if self._snapshot_greenlet is not None:
+            self._snapshot_greenlet.kill()
+            self._snapshot_greenlet = None
+        if self._snapshot_store is not None:
+            self._snapshot_greenlet = self.core.periodic(self.snapshot_interval, self.save_snapshot,
+                                                         wait=self.snapshot_interval)
+
+        # Record Store Configurations:
+        self.record_store_directory = config.get('record_store_directory', self.record_store_directory)
+        self.record_store_segment_seconds = float(config.get('record_store_segment_seconds',
+                                                             self.record_store_segment_seconds))
+        self.record_store_retention_seconds = float(config.get('record_store_retention_seconds',
+                                                               self.record_store_retention_seconds))
+        self.record_store_flush_interval = float(config.get('record_store_flush_interval',
+                                                            self.record_store_flush_interval))
+        # The store holds open segment files and buffered records, so it is only replaced when its settings change.
+        record_store_changed = old_config is None or any(old_config.get(k) != config.get(k)
+                                                         for k in self.RECORD_STORE_KEYS)
+        if record_store_changed:
+            if self._record_store_greenlet is not None:
+                self._record_store_greenlet.kill()
+                self._record_store_greenlet = None
+            if self.record_store is not None:
+                self.record_store.close()
+                self.record_store = None
+            if self.record_store_directory:
+                self.record_store = RecordStore(self.data_path(self.record_store_directory),
+                                                self.record_store_segment_seconds, self.record_store_retention_seconds)
+                if self.record_store_flush_interval > 0:
+                    self._record_store_greenlet = self.core.periodic(self.record_store_flush_interval,
+                                                                     self.record_store.flush,
+                                                                     wait=self.record_store_flush_interval)
 
         # TODO: Move these into appropriate dependency class (probably ConsensusMarket):
         #  reschedule_interval = float(config.get('reschedule_interval'))
@@ -175,15 +411,31 @@ class TransactiveNodeAgent(Agent, TransactiveNode):
 
         # Configure TransactiveNode Component Classes
         try:
-            self.meterPoints = self.configure_dependencies(config.get('meterPoints'), 'MeterPoints')
-            self.informationServiceModels = self.configure_dependencies(config.get('informationServiceModels'),
-                                                                        'InformationServiceModels')
-            self.localAssets = self.configure_dependencies(config.get('localAssets'), 'LocalAssets')
-            self.neighbors = self.configure_dependencies(config.get('neighbors'), 'Neighbors')
-            self.markets = self.configure_dependencies(config.get('markets'), 'Markets')
+            referenced_changed = False
+            for attribute, dependency_type in self.DEPENDENCY_TYPES:
+                phase_start = time.perf_counter()
+                if full_rebuild:
+                    setattr(self, attribute, self.configure_dependencies(config.get(attribute), dependency_type))
+                else:
+                    rebuild = attribute in self.REFERENCING_DEPENDENCIES and referenced_changed
+                    dependencies, changed = self.reconfigure_dependencies(getattr(self, attribute),
+                                                                          old_config.get(attribute),
+                                                                          config.get(attribute),
+                                                                          dependency_type, rebuild)
+                    setattr(self, attribute, dependencies)
+                    if changed and attribute in self.REFERENCED_DEPENDENCIES:
+                        referenced_changed = True
+                timings[dependency_type] = time.perf_counter() - phase_start
         except ValueError as e:
             _log.error("ERROR PROCESSING CONFIGURATION {}".format(e))
             raise
+        self._active_config = active_config
+        # The simulation clock settings change from run to run, and the record store does not affect the markets, so
+        # both are left out of the comparison with snapshots.
+        self._config_fingerprint = snapshot.config_fingerprint({k: v for k, v in active_config.items()
+                                                                if not k.startswith('simulation_')
+                                                                and k not in self.RECORD_STORE_KEYS})
+        restored = old_config is None and self.restore_snapshot()
 
         # TODO: This could probably be pushed down to the market constructor, but other places that initialize markets
         #  would need to be updated as well so it doesn't do all this twice.
@@ -198,7 +450,17 @@ class TransactiveNodeAgent(Agent, TransactiveNode):
             for p in market.marginalPrices:
                 _log.debug(f"Market: {market.name} has initial marginal prices {p.value}"
                            f" for interval: {p.timeInterval.startTime}")
-        self.core.spawn_later(5, self.state_machine_loop)
+        # There must only ever be one scheduler loop, whether it is running or still waiting to start.
+        if self.market_scheduler.running:
+            self.market_scheduler.wake('configuration change')
+        elif self._scheduler_start is None:
+            # A restored node is part way through its market cycles, so it should not wait to resume them.
+            self._scheduler_start = self.core.spawn_later(0 if restored else self.scheduler_start_delay,
+                                                          self.state_machine_loop)
+        timings['total'] = time.perf_counter() - configure_start
+        self.startup_timings[f'configure ({action})'] = timings
+        _log.info(f'{self.name} configured in {timings["total"]:.3f} s: '
+                  + ', '.join(f'{phase} {seconds:.3f} s' for phase, seconds in timings.items() if phase != 'total'))
 
     def configure_dependencies(self, configs, dependency_type):
         """Configures each dependency in passed list of configurations.
@@ -208,44 +470,190 @@ class TransactiveNodeAgent(Agent, TransactiveNode):
         a reference to this agent.
         It is up to the individual dependency to manage its own configuration.
 
-        Returns list of instantiated and configured dependencies"""
-        first_cap_re = re.compile('(.)([A-Z][a-z]+)')
-        all_cap_re = re.compile('([a-z0-9])([A-Z])')
-
-        def camel_to_snake(name):
-            s1 = first_cap_re.sub(r'\1_\2', name)
-            return all_cap_re.sub(r'\1_\2', s1).lower()
+        Dependencies of the same type are independent of each other, so, except for markets, they are built
+        concurrently when concurrent_startup is set. Dependencies which wait on I/O while they are built then do not
+        hold up the others.
 
+        Returns list of instantiated and configured dependencies"""
         dependencies = []
         if not configs:
             return dependencies
+        builders = []
         for config in configs:
             cls = config.pop('class_name')
             # TODO: What will be the default directory for classes in the TransactiveNodeAgent module?
             default_module_name = 'tns.' + camel_to_snake(cls)
             module = config.pop('module_name', default_module_name)
-            _log.debug(f'module_name is: {module}')
-            module = importlib.import_module(module)
             config['transactive_node'] = self
-            dependency_class = getattr(module, cls)
+            dependency_class = resolve_dependency_class(module, cls)
             if issubclass(dependency_class, Market):
                 config['first_market_in_series'] = True
-            dependency = dependency_class(**config)
-            dependencies.append(dependency)
+            builders.append((dependency_class, config))
+        if self.concurrent_startup and len(builders) > 1 and dependency_type != 'Markets':
+            group = Group()
+            greenlets = [group.spawn(dependency_class, **config) for dependency_class, config in builders]
+            group.join(raise_error=True)
+            dependencies = [greenlet.value for greenlet in greenlets]
+        else:
+            dependencies = [dependency_class(**config) for dependency_class, config in builders]
         dep_names = [d.name for d in dependencies]
         if len(dep_names) != len(set(dep_names)):
             raise ValueError(f'Configured {dependency_type} have duplicate names: {[d.name for d in dependencies]}')
         return dependencies
 
+    def reconfigure_dependencies(self, dependencies, old_configs, new_configs, dependency_type, rebuild=False):
+        """Rebuild only the dependencies whose configurations changed.
+
+        Unchanged dependencies are kept with their state and subscriptions. Markets are rebuilt all together if any of
+        their configurations changed, since the running markets of a series are spawned from the configured ones.
+
+        Returns the list of dependencies and whether any of them changed.
+        """
+        old_configs = old_configs if old_configs else []
+        new_configs = new_configs if new_configs else []
+        if not rebuild and old_configs == new_configs:
+            return dependencies, False
+        if dependency_type == 'Markets':
+            rebuild = True
+        old_by_name = {c.get('name'): c for c in old_configs}
+        existing = {d.name: d for d in dependencies}
+        kept = {}
+        for config in new_configs:
+            name = config.get('name')
+            if not rebuild and name in existing and old_by_name.get(name) == config:
+                kept[name] = existing[name]
+        for dependency in dependencies:
+            if kept.get(dependency.name) is not dependency:
+                self._unsubscribe_dependency(dependency)
+        built = iter(self.configure_dependencies([c for c in new_configs if c.get('name') not in kept],
+                                                 dependency_type))
+        reconfigured = [kept[c.get('name')] if c.get('name') in kept else next(built) for c in new_configs]
+        names = [d.name for d in reconfigured]
+        if len(names) != len(set(names)):
+            raise ValueError(f'Configured {dependency_type} have duplicate names: {names}')
+        _log.info(f'Reconfigured {dependency_type}: kept {list(kept)},'
+                  f' rebuilt {[n for n in names if n not in kept]}')
+        return reconfigured, True
+
+    def _track_subscriptions(self):
+        subscribe = self.vip.pubsub.subscribe
+
+        def tracked_subscribe(*args, **kwargs):
+            arguments = dict(zip(('peer', 'prefix', 'callback'), args))
+            arguments.update(kwargs)
+            self._subscriptions.append((arguments.get('prefix'), arguments.get('callback')))
+            return subscribe(*args, **kwargs)
+        self.vip.pubsub.subscribe = tracked_subscribe
+
+    def _unsubscribe_dependency(self, dependency):
+        for prefix, callback in list(self._subscriptions):
+            if getattr(callback, '__self__', None) is dependency:
+                self.vip.pubsub.unsubscribe('pubsub', prefix, callback)
+                self._subscriptions.remove((prefix, callback))
+
     def state_machine_loop(self):
-        while not self._stop_agent:
-            for market in self.markets:
-                market.events(self)
-                gevent.sleep(0.01)
+        self.market_scheduler.start()
+        self.startup_timings['scheduler_start'] = time.perf_counter() - self._created
+
+    @RPC.export
+    def get_publisher_metrics(self):
+        return self.publisher.get_metrics()
+
+    @RPC.export
+    def get_signal_metrics(self):
+        """Return the counts of signals received, superseded in the mailbox and skipped as unchanged per neighbor."""
+        return {n.name: n.get_signal_metrics() for n in self.neighbors if hasattr(n, 'get_signal_metrics')}
+
+    @RPC.export
+    def get_startup_timings(self):
+        """Return the seconds taken by each phase of agent initialization and of each configuration."""
+        return self.startup_timings
+
+    @RPC.export
+    def get_instrumentation_metrics(self, reset=False):
+        """Return the call counts and latency histograms of the instrumented operations of this node."""
+        return self.instrumentation.get_metrics(reset)
+
+    @RPC.export
+    def query_records(self, kind=None, market=None, entity=None, start=None, end=None, interval_start=None,
+                      interval_end=None, limit=None):
+        """Return records from the local record store. Times may be passed as timestamp strings or epoch seconds."""
+        if self.record_store is None:
+            return []
+
+        def parse(t):
+            return parser.parse(t) if isinstance(t, str) else t
+        return self.record_store.query(kind, market, entity, parse(start), parse(end), parse(interval_start),
+                                       parse(interval_end), limit)
+
+    def data_path(self, path: str) -> str:
+        """Resolve a path relative to the data directory of the agent. Absolute paths are returned unchanged."""
+        # Installed agents run from their install directory, in which VOLTTRON creates their <name>.agent-data
+        # directory. Agents run some other way keep their data under VOLTTRON_HOME.
+        cwd = os.getcwd()
+        data_directory = os.path.join(cwd, os.path.basename(cwd) + '.agent-data')
+        if not os.path.isdir(data_directory):
+            data_directory = os.path.join(get_home(), 'data', self.core.identity)
+        return os.path.join(data_directory, path)
+
+    def save_snapshot(self):
+        """Write a snapshot of the markets and negotiation state of the node for a warm restart."""
+        if self._snapshot_store is None or not self.markets:
+            return None
+        start = time.perf_counter()
+        try:
+            path = self._snapshot_store.write(snapshot.capture(self, self._config_fingerprint))
+        except Exception as e:
+            # A failed snapshot must never take down the periodic greenlet or the shutdown that calls this.
+            _log.warning(f'{self.name} could not write snapshot: {e!r}')
+            return None
+        _log.debug(f'{self.name} wrote snapshot {path} in {time.perf_counter() - start:.3f} s')
+        return path
+
+    def restore_snapshot(self):
+        """Resume from the latest valid snapshot, if it was taken recently with the same configuration."""
+        if self._snapshot_store is None:
+            return False
+        start = time.perf_counter()
+        for path, payload in self._snapshot_store.latest():
+            try:
+                state = snapshot.load(payload)
+            except Exception as e:
+                _log.warning(f'{self.name} could not load snapshot {path}: {e!r}')
+                continue
+            age = (Timer.get_cur_time() - state['time']).total_seconds()
+            if state['node'] != self.name or state['fingerprint'] != self._config_fingerprint:
+                _log.info(f'{self.name} not restoring snapshot {path}: the configuration has changed.')
+            elif not 0 <= age <= self.snapshot_max_age:
+                _log.info(f'{self.name} not restoring snapshot {path}: it is {age:.0f} s old.')
+            elif snapshot.restore(self, state):
+                self.startup_timings['restore_snapshot'] = time.perf_counter() - start
+                _log.info(f'{self.name} restored {len(self.markets)} markets from snapshot {path} ({age:.0f} s old).')
+                return True
+            return False  # Older snapshots are staler still.
+        return False
+
+    def publish_instrumentation(self):
+        self.publisher.publish(self.instrumentation_topic, self.instrumentation.get_metrics())
+
+    def wake_scheduler(self, reason: str = None):
+        """Have the market scheduler evaluate all markets now instead of at the next transition deadline."""
+        self.market_scheduler.wake(reason)
 
     @Core.receiver('onstop')
     def onstop(self, sender, **kwargs):
         self._stop_agent = True
+        self.market_scheduler.stop()
+        if self._instrumentation_greenlet is not None:
+            self._instrumentation_greenlet.kill()
+        if self._snapshot_greenlet is not None:
+            self._snapshot_greenlet.kill()
+            self.save_snapshot()
+        if self._record_store_greenlet is not None:
+            self._record_store_greenlet.kill()
+        if self.record_store is not None:
+            self.record_store.close()
+        self.publisher.stop()
 
 
 def main():
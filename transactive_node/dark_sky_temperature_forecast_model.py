@@ -1,6 +1,12 @@
 import gevent
+import json
 import logging
+import numpy as np
+import random
+import re
+import time
 
+from datetime import timezone
 from dateutil import parser
 
 from tent.information_service_model.temperature_forecast_model import TemperatureForecastModel
@@ -12,14 +18,98 @@ setup_logging()
 _log = logging.getLogger(__name__)
 
 
+# Timestamps as formatted by VOLTTRON's format_timestamp(), e.g., 2022-02-06T10:00:00.000000+00:00.
+# The weather agent forecasts hourly. Each forecast covers the hour from its timestamp.
+_FORECAST_PERIOD = np.timedelta64(1, 'h')
+_ISO_TIMESTAMP = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d{1,6})?([+-]\d{2}:\d{2}|Z)?$')
+
+
+def parse_timestamps(time_stamps, local_tz) -> np.ndarray:
+    """Parse timestamps to an array of naive local datetime64[us].
+
+    Timestamps in the ISO-8601 format emitted by the weather agent, with a UTC offset, are parsed by NumPy in one pass.
+    Anything else, including timestamps without an offset, falls back to dateutil, one timestamp at a time.
+    """
+    if not time_stamps:
+        return np.array([], dtype='datetime64[us]')
+    matches = [_ISO_TIMESTAMP.match(ts) for ts in time_stamps]
+    if not all(match and match.group(2) for match in matches):
+        # Timestamps without an offset are in the local time of the platform, as astimezone() takes naive datetimes.
+        return np.array([parser.parse(ts).astimezone(local_tz).replace(tzinfo=None) for ts in time_stamps],
+                        dtype='datetime64[us]')
+    offset_minutes = np.zeros(len(time_stamps), dtype=np.int64)
+    naive = []
+    for i, ts in enumerate(time_stamps):
+        if ts.endswith('Z'):
+            naive.append(ts[:-1])
+        else:
+            naive.append(ts[:-6])
+            sign = -1 if ts[-6] == '-' else 1
+            offset_minutes[i] = sign * (int(ts[-5:-3]) * 60 + int(ts[-2:]))
+    times = np.array(naive, dtype='datetime64[us]')
+    return _utc_to_local(times - offset_minutes.astype('timedelta64[m]'), local_tz)
+
+
+def _utc_to_local(utc: np.ndarray, local_tz) -> np.ndarray:
+    first, last = (utc[i].astype(object).replace(tzinfo=timezone.utc).astimezone(local_tz).utcoffset()
+                   for i in (0, -1))
+    if first == last:
+        return utc + np.timedelta64(int(first.total_seconds()), 's')
+    # The forecast spans a daylight saving time change, so convert each timestamp.
+    return np.array([t.replace(tzinfo=timezone.utc).astimezone(local_tz).replace(tzinfo=None)
+                     for t in utc.astype(object)], dtype='datetime64[us]')
+
+
+class ForecastCacheEntry(object):
+    def __init__(self):
+        self.weather_data = None
+        self.times = None
+        self.values = None
+        self.updated = None
+        self.failures = 0
+        self.retry_after = 0.0
+        self.refresh = None
+
+    def is_stale(self, ttl):
+        return self.updated is None or time.monotonic() - self.updated >= ttl
+
+    @property
+    def refreshing(self):
+        return self.refresh is not None and not self.refresh.dead
+
+
+# Forecasts are shared by all models on the platform querying the same location and point.
+_forecast_cache = {}
+
+
+def backoff_delay(failures, base, maximum):
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(maximum, base * 2 ** failures))
+
+
 class DarkSkyTemperatureForecastModel(TemperatureForecastModel):
     def __init__(self,
                  remote: dict = None,
                  remote_platform: str = '',
                  weather_vip: str = '',
+                 forecast_ttl: float = 3600,
+                 rpc_timeout: float = 15,
+                 rpc_attempts: int = 10,
+                 backoff_base: float = 1.0,
+                 backoff_max: float = 300.0,
+                 cold_start_timeout: float = 15,
                  *args, **kwargs):
         super(DarkSkyTemperatureForecastModel, self).__init__(*args, **kwargs)
+        self.forecast_ttl = float(forecast_ttl)
+        self.rpc_timeout = float(rpc_timeout)
+        self.rpc_attempts = int(rpc_attempts)
+        self.backoff_base = float(backoff_base)
+        self.backoff_max = float(backoff_max)
+        # Time to wait for the first forecast when none has been cached yet.
+        self.cold_start_timeout = float(cold_start_timeout)
 
+        # Only a remote connection is kept; the local agent is looked up through its weak reference on each call.
+        self.connection = None
         remote = dict(remote) if remote else {}
         if remote and self.tn and self.tn():
             self.connection = self.tn().vip.auth.connect_remote_platform(address=(remote.get("address")),
@@ -34,21 +124,69 @@ class DarkSkyTemperatureForecastModel(TemperatureForecastModel):
     def query_weather_data(self):
         """
         Use VOLTTRON DarkSky weather agent running on local or remote platform to get 24-hour forecast for weather data.
+
+        The last good forecast is returned immediately. If it is older than forecast_ttl, it is refreshed in the
+        background. Only when no forecast has been cached yet does this wait, up to cold_start_timeout, for one.
+        """
+        entry = _forecast_cache.setdefault(self._forecast_cache_key(), ForecastCacheEntry())
+        if entry.is_stale(self.forecast_ttl) and not entry.refreshing and time.monotonic() >= entry.retry_after:
+            entry.refresh = gevent.spawn(self._refresh_forecast, entry)
+        if entry.weather_data is None and entry.refreshing:
+            entry.refresh.join(timeout=self.cold_start_timeout)
+        return entry.weather_data if entry.weather_data is not None else []
+
+    def _forecast_cache_key(self):
+        # Models only share a forecast if they ask the same weather service on the same platform for the same location.
+        return (self.weather_vip, self.remote_platform, json.dumps(self.location, sort_keys=True, default=str),
+                self.oat_point_name)
+
+    def forecast_values(self, start_times) -> np.ndarray:
+        """Return the cached forecast of the hour covering each of the start times, or NaN where none was forecast.
+
+        Returns None if no forecast is cached, in which case predictedValues should be used.
         """
-        weather_results = self._rpc_handler()
-        return self._parse_rpc_data(weather_results)
+        entry = _forecast_cache.get(self._forecast_cache_key())
+        if entry is None or entry.times is None or not len(entry.times):
+            return None
+        start_times = np.asarray(start_times, dtype='datetime64[us]')
+        index = np.searchsorted(entry.times, start_times, side='right') - 1
+        covered = (index >= 0) & (start_times - entry.times[np.maximum(index, 0)] < _FORECAST_PERIOD)
+        return np.where(covered, entry.values[np.maximum(index, 0)], np.nan)
+
+    def _refresh_forecast(self, entry):
+        try:
+            weather_results = self._rpc_handler()
+            times, values = self._parse_rpc_arrays(weather_results) if weather_results else (None, None)
+        except Exception as e:
+            # Anything the RPC handler did not expect must still count as a failure, or the refresh would be retried
+            # at once on every query.
+            _log.warning(f'Error refreshing WEATHER forecast: {e!r}')
+            times, values = None, None
+        if times is not None and len(times):
+            order = np.argsort(times, kind='stable')
+            entry.times, entry.values = times[order], values[order]
+            entry.weather_data = self._to_weather_data(times, values)
+            entry.updated = time.monotonic()
+            entry.failures = 0
+        else:
+            # Keep serving the last good forecast, and back off before trying again.
+            entry.failures += 1
+            entry.retry_after = time.monotonic() + backoff_delay(entry.failures, self.backoff_base, self.backoff_max)
+            _log.warning(f'Failed to refresh WEATHER forecast {entry.failures} time(s) in a row.')
 
     def _rpc_handler(self):
         attempts = 0
         success = False
         result = []
         weather_results = None
-        while not success and attempts < 10:
+        while not success and attempts < self.rpc_attempts:
             try:
-                result = self.connection.vip.rpc.call(self.weather_vip,
-                                                      "get_hourly_forecast",
-                                                      self.location,
-                                                      external_platform=self.remote_platform).get(timeout=15)
+                connection = self.connection or (self.tn() if self.tn else None)
+                result = connection.vip.rpc.call(self.weather_vip,
+                                                 "get_hourly_forecast",
+                                                 self.location,
+                                                 external_platform=self.remote_platform).get(
+                    timeout=self.rpc_timeout)
 
                 weather_results = result[0]["weather_results"]
                 success = True
@@ -58,22 +196,33 @@ class DarkSkyTemperatureForecastModel(TemperatureForecastModel):
             except KeyError as ex:
                 _log.debug("No WEATHER Results!: {} -- {}".format(result, ex))
                 attempts += 1
-        if attempts >= 10:
-            _log.debug("10 Failed attempts to get WEATHER forecast via RPC!!!")
-            return weather_results
+            if not success and attempts < self.rpc_attempts:
+                gevent.sleep(backoff_delay(attempts, self.backoff_base, self.backoff_max))
+        if attempts >= self.rpc_attempts:
+            _log.debug("{} Failed attempts to get WEATHER forecast via RPC!!!".format(attempts))
         return weather_results
 
     def _parse_rpc_data(self, weather_results):
+        times, values = self._parse_rpc_arrays(weather_results)
+        return self._to_weather_data(times, values)
+
+    def _parse_rpc_arrays(self, weather_results):
+        """Parse forecast results to arrays of naive local datetime64 times and float temperatures."""
         try:
-            weather_data = [[parser.parse(oat[0]).astimezone(self.local_tz), oat[1][self.oat_point_name]] for oat in
-                            weather_results]
-            weather_data = [[oat[0].replace(tzinfo=None), oat[1]] for oat in weather_data]
-            _log.debug("Parsed WEATHER information: {}".format(weather_data))
+            time_stamps = [oat[0] for oat in weather_results]
+            values = np.array([oat[1][self.oat_point_name] for oat in weather_results], dtype=float)
+            times = parse_timestamps(time_stamps, self.local_tz)
+            _log.debug("Parsed %s WEATHER forecast values.", len(times))
         except KeyError:
-            weather_data = []
+            times, values = np.array([], dtype='datetime64[us]'), np.array([])
             _log.debug("Measurement WEATHER Point Name is not correct")
         # How do we deal with never getting weather information?  Exit?
         except Exception as ex:
-            weather_data = []
+            times, values = np.array([], dtype='datetime64[us]'), np.array([])
             _log.debug("Exception {} processing WEATHER data.".format(ex))
-        return weather_data
+        return times, values
+
+    @staticmethod
+    def _to_weather_data(times, values):
+        """Return forecast arrays in the [[datetime, value], ...] form used by TemperatureForecastModel."""
+        return [list(pair) for pair in zip(times.astype(object).tolist(), values.tolist())]
@@ -16,6 +16,7 @@ class DirectRatioActuationManager(ActuationManager):
             max_price = max(vertex_prices)
             price = min(max(price, min_price), max_price)  # clamp price within bid range.
             cleared_price_ratio = (price - min_price) / (max_price - min_price)
+            set_points = {}
             for model in self.parent.models.values():  # TODO: Generalize this away from models in ModelFrameAsset.
                 if model.actuation_topic:
                     min_set_point, max_set_point = model.set_point_range(start_time)
@@ -26,16 +27,27 @@ class DirectRatioActuationManager(ActuationManager):
                     #  and a deadband. For lighting, it is always reverse-acting (heating).
                     # new_set_point = max_set_point - (cleared_price_ratio * (
                     #            max_set_point - min_set_point))
-                    self.direct_actuate(model.actuation_topic, new_set_point)
+                    set_points[model.actuation_topic] = new_set_point
+            self.direct_actuate_many(set_points)
 
     def direct_actuate(self, target_id, new_set_point):
         pass
 
+    def direct_actuate_many(self, set_points: dict):
+        # Override to write several set points at once.
+        for target_id, new_set_point in set_points.items():
+            self.direct_actuate(target_id, new_set_point)
+
     def release(self, mkt):
         super(DirectRatioActuationManager, self).release(mkt)
-        for model in self.parent.models.values():  # TODO: Generalize this away from models in ModelFrameAsset.
-            if model.actuation_topic:
-                self.direct_release(model.actuation_topic)
+        # TODO: Generalize this away from models in ModelFrameAsset.
+        self.direct_release_many([model.actuation_topic for model in self.parent.models.values()
+                                  if model.actuation_topic])
 
     def direct_release(self, target_id):
         pass
+
+    def direct_release_many(self, target_ids: list):
+        # Override to release several set points at once.
+        for target_id in target_ids:
+            self.direct_release(target_id)
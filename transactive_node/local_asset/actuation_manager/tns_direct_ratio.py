@@ -1,11 +1,13 @@
 import gevent
 import logging
 
+from gevent.pool import Pool
+
 from tent.utils.log import setup_logging
 
 from transactive_node.local_asset.actuation_manager.direct_ratio import DirectRatioActuationManager
 
-from volttron.platform.jsonrpc import RemoteError
+from volttron.platform.jsonrpc import MethodNotFound, RemoteError
 from volttron.platform.vip.agent import errors
 
 setup_logging()
@@ -13,11 +15,23 @@ _log = logging.getLogger(__name__)
 
 
 class TNSDirectRatioActuationManager(DirectRatioActuationManager):
-    def __init__(self, actuator_identity, **kwargs):
+    def __init__(self, actuator_identity, max_concurrent_writes: int = 8, set_point_deadband: float = 0.0,
+                 use_set_multiple_points: bool = True, actuation_timeout: float = 15, **kwargs):
         super(TNSDirectRatioActuationManager, self).__init__(**kwargs)
         self.actuator_identity = actuator_identity
+        self.max_concurrent_writes = max(int(max_concurrent_writes), 1)
+        self.set_point_deadband = float(set_point_deadband)
+        self.use_set_multiple_points = use_set_multiple_points
+        self.actuation_timeout = actuation_timeout
+        self.last_written = {}  # Last set point successfully written to each target.
+
+    def _needs_write(self, target_id, new_set_point):
+        last = self.last_written.get(target_id)
+        return last is None or abs(new_set_point - last) > self.set_point_deadband
 
     def direct_actuate(self, target_id, new_set_point):
+        if not self._needs_write(target_id, new_set_point):
+            return True
         if self.tn and self.tn():
             tn = self.tn()
             try:
@@ -25,9 +39,41 @@ class TNSDirectRatioActuationManager(DirectRatioActuationManager):
                                 'set_point',
                                 requester_id=self.parent.name,
                                 topic=target_id,
-                                value=new_set_point).get(timeout=15)
+                                value=new_set_point).get(timeout=self.actuation_timeout)
+                self.last_written[target_id] = new_set_point
+                return True
             except (RemoteError, gevent.Timeout, errors.VIPError) as ex:
                 _log.warning(f"Failed to set {target_id} - ex: {str(ex)}")
+        return False
+
+    def direct_actuate_many(self, set_points: dict):
+        set_points = {t: v for t, v in set_points.items() if self._needs_write(t, v)}
+        if not set_points or not (self.tn and self.tn()):
+            return
+        if self.use_set_multiple_points and len(set_points) > 1:
+            try:
+                failures = self.tn().vip.rpc.call(self.actuator_identity,
+                                                  'set_multiple_points',
+                                                  requester_id=self.parent.name,
+                                                  topics_values=list(set_points.items())
+                                                  ).get(timeout=self.actuation_timeout)
+            except MethodNotFound as ex:
+                # Older actuators do not have set_multiple_points. Write the points one at a time from now on.
+                _log.info(f"{self.parent.name} - actuator has no bulk write, using set_point instead - ex: {str(ex)}")
+                self.use_set_multiple_points = False
+            except (RemoteError, gevent.Timeout, errors.VIPError) as ex:
+                # The actuator raises lock and schedule errors as RemoteErrors. Bulk writes are tried again next time.
+                _log.warning(f"Failed to set {list(set_points)} - ex: {str(ex)}")
+                return
+            else:
+                failures = failures if failures else {}
+                for target_id, new_set_point in set_points.items():
+                    if target_id in failures:
+                        _log.warning(f"Failed to set {target_id} - ex: {failures[target_id]}")
+                    else:
+                        self.last_written[target_id] = new_set_point
+                return
+        self._run_concurrently(self.direct_actuate, set_points.items())
 
     def direct_release(self, target_id):
         if self.tn and self.tn():
@@ -36,6 +82,21 @@ class TNSDirectRatioActuationManager(DirectRatioActuationManager):
                 tn.vip.rpc.call(self.actuator_identity,
                                 'revert_point',
                                 requester_id=self.parent.name,
-                                topic=target_id).get(timeout=15)
+                                topic=target_id).get(timeout=self.actuation_timeout)
+                self.last_written.pop(target_id, None)
             except (RemoteError, gevent.Timeout, errors.VIPError) as ex:
                 _log.warning(f"Failed to revert {target_id} - ex: {str(ex)}")
+
+    def direct_release_many(self, target_ids: list):
+        self._run_concurrently(self.direct_release, [(target_id,) for target_id in target_ids])
+
+    def _run_concurrently(self, method, calls):
+        # One slow device should not hold up the others, but the actuator is not flooded either.
+        calls = list(calls)
+        if len(calls) == 1:
+            method(*calls[0])
+            return
+        pool = Pool(self.max_concurrent_writes)
+        for args in calls:
+            pool.spawn(method, *args)
+        pool.join()
@@ -0,0 +1,163 @@
+from typing import Iterable, List
+
+from tent.containers.interval_value import IntervalValue
+from tent.containers.time_interval import TimeInterval
+from tent.enumerations.market_state import MarketState
+
+from transactive_node.util.versioning import next_version
+
+
+def _market_key(market) -> tuple:
+    # Market names are only unique within a market series.
+    return getattr(market, 'marketSeriesName', None), market.name
+
+
+def _interval_key(time_interval: TimeInterval) -> tuple:
+    return _market_key(time_interval.market) + (time_interval.startTime,)
+
+
+def _value_key(value: IntervalValue) -> tuple:
+    return _market_key(value.market) + (value.timeInterval.startTime,)
+
+
+class IntervalValueStore(object):
+    """Collection of IntervalValues indexed by their market and time interval.
+
+    This iterates like the plain list it replaces, so library code that reads scheduledPowers or activeVertices is
+    unaffected, but lookup and replacement of the values for one time interval no longer scan the whole collection.
+    Values are indexed by the series and name of their market and the start of their time interval, so an interval
+    rebuilt for the same market (e.g., from a snapshot) finds the same values. The store takes a new version whenever
+    it changes, so records of the values need only be rebuilt when the version has changed.
+    """
+    def __init__(self, values: Iterable[IntervalValue] = None):
+        self._values = {}  # (market series, market name, start time) -> [IntervalValue]
+        self._markets = {}  # (market series, market name) -> (Market, {(market series, market name, start time)})
+        self.version = next_version()
+        if values:
+            self.extend(values)
+
+    def append(self, value: IntervalValue):
+        self.version = next_version()
+        key = _value_key(value)
+        values = self._values.get(key)
+        if values is None:
+            self._values[key] = [value]
+            self._index_market(value)
+        else:
+            values.append(value)
+
+    def extend(self, values: Iterable[IntervalValue]):
+        for value in values:
+            self.append(value)
+
+    def get(self, time_interval: TimeInterval, default=None):
+        """Return the first value in the time interval, as find_obj_by_ti() would."""
+        values = self._values.get(_interval_key(time_interval))
+        return values[0] if values else default
+
+    def get_all(self, time_interval: TimeInterval) -> List[IntervalValue]:
+        return list(self._values.get(_interval_key(time_interval), []))
+
+    def replace(self, time_interval: TimeInterval, values: Iterable[IntervalValue]):
+        """Replace all values in the time interval with the passed values."""
+        values = list(values)
+        self.version = next_version()
+        key = _interval_key(time_interval)
+        if not values:
+            self.remove_interval(time_interval)
+        elif key in self._values:
+            self._values[key] = values
+        else:
+            self._values[key] = values
+            self._index_market(values[0])
+
+    def remove_interval(self, time_interval: TimeInterval):
+        self._remove_key(_interval_key(time_interval))
+
+    def _remove_key(self, key: tuple):
+        values = self._values.pop(key, None)
+        if values:
+            self.version = next_version()
+            market_entry = self._markets.get(key[:2])
+            if market_entry:
+                market_entry[1].discard(key)
+                if not market_entry[1]:
+                    del self._markets[key[:2]]
+
+    def remove(self, value: IntervalValue):
+        key = _value_key(value)
+        values = self._values.get(key, [])
+        values.remove(value)
+        self.version = next_version()
+        if not values:
+            self._remove_key(key)
+
+    def expire(self):
+        """Remove the values of all intervals belonging to expired markets."""
+        for market_key, (market, interval_keys) in list(self._markets.items()):
+            if market.marketState == MarketState.Expired:
+                for key in interval_keys:
+                    self._values.pop(key, None)
+                del self._markets[market_key]
+                self.version = next_version()
+
+    def clear(self):
+        self._values.clear()
+        self._markets.clear()
+        self.version = next_version()
+
+    def _index_market(self, value: IntervalValue):
+        # The latest market object of the name is kept, since it is the one whose state changes.
+        market = value.market
+        market_key = _market_key(market)
+        market_entry = self._markets.get(market_key)
+        market_entry = self._markets[market_key] = (market, market_entry[1] if market_entry else set())
+        market_entry[1].add(_value_key(value))
+
+    def __iter__(self):
+        for values in list(self._values.values()):
+            yield from values
+
+    def __len__(self):
+        return sum(len(values) for values in self._values.values())
+
+    def __bool__(self):
+        return bool(self._values)
+
+    def __getitem__(self, item):
+        return list(self)[item]
+
+    def __contains__(self, value):
+        return value in self._values.get(_value_key(value), [])
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({list(self)})'
+
+    # The market index holds the markets themselves, so only the values are pickled and the indexes are rebuilt.
+    def __getstate__(self):
+        return {'values': list(self)}
+
+    def __setstate__(self, state):
+        self.__init__(state['values'])
+
+
+class IntervalIndexedAsset(object):
+    """Mixin for LocalAssets that keeps scheduledPowers and activeVertices in IntervalValueStores.
+
+    Anything assigned to these properties, including the plain lists assigned by the library, is wrapped in a store.
+    """
+    @property
+    def scheduledPowers(self) -> IntervalValueStore:
+        return self._scheduled_powers
+
+    @scheduledPowers.setter
+    def scheduledPowers(self, values):
+        self._scheduled_powers = values if isinstance(values, IntervalValueStore) else IntervalValueStore(values)
+
+    @property
+    def activeVertices(self) -> IntervalValueStore:
+        return self._active_vertices
+
+    @activeVertices.setter
+    def activeVertices(self, values):
+        self._active_vertices = values if isinstance(values, IntervalValueStore) else IntervalValueStore(values)
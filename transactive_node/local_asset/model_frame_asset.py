@@ -1,19 +1,21 @@
 import importlib
 import logging
+import numpy as np
 
 from typing import List
 
 from transactive_node.model_frame import ModelFrame
+from transactive_node.local_asset.interval_value_store import IntervalIndexedAsset
 from transactive_node.local_asset.occupancy_manager import OccupancyManager
+from transactive_node.util.instrumentation import instrumented
+from transactive_node.util.price_statistics import PriceStatistics, get_price_statistics
 
 from tent.containers.interval_value import IntervalValue
 from tent.containers.time_interval import TimeInterval
 from tent.containers.vertex import Vertex
-from tent.enumerations.market_state import MarketState
 from tent.enumerations.measurement_type import MeasurementType
 from tent.local_asset import LocalAsset
 from tent.market import Market
-from tent.utils.helpers import find_obj_by_ti
 from tent.utils.log import setup_logging
 
 from volttron.platform.agent.utils import parse_timestamp_string
@@ -23,7 +25,7 @@ setup_logging()
 _log = logging.getLogger(__name__)
 
 
-class ModelFrameAsset(LocalAsset, ModelFrame):
+class ModelFrameAsset(IntervalIndexedAsset, LocalAsset, ModelFrame):
     def __init__(self,
                  model_configs: dict = None,
                  temperature_forecast_name: str = '',
@@ -69,32 +71,51 @@ class ModelFrameAsset(LocalAsset, ModelFrame):
         now = parse_timestamp_string(header[headers_mod.TIMESTAMP])
         data, meta = message
         if topic in self.models:
+            self.device_history.append(topic, now, data)
             self.models[topic].update_data(data, now)
 
-    def _get_scheduled_power_from_model(self, time_interval: TimeInterval, outside_air_temperature) -> float:
-        """Return a schedule power value for one interval from a model."""
-        occupied = self.occupancy_manager.check_schedule(time_interval.startTime)
-        params = {'interval_time': time_interval.startTime, 'OAT': outside_air_temperature, 'occupied': occupied}
-        return self.model_power(params=params)
-
-    def _get_power_flexibility_from_model(self, time_interval: TimeInterval, outside_air_temperature) -> List[float]:
-        occupied = self.occupancy_manager.check_schedule(time_interval.startTime)
-        params = {'interval_time': time_interval.startTime, 'OAT': outside_air_temperature, 'occupied': occupied}
-        flexibility = self.model_flexibility(params=params)
-        min_power = min(flexibility)
-        max_power = max(flexibility)
-        if min_power == max_power:
-            min_power = min_power - 1e-10
-        return [min_power, max_power]
-
-    def _get_price_flexibility(self, time_interval: TimeInterval, market: Market,
-                               multiplier: float = 1.0) -> List[float]:
+    def _get_model_inputs(self, time_intervals: List[TimeInterval]):
+        """Return the interval start times, forecast outdoor air temperatures and occupancy for the intervals."""
+        temperature_forecast = [x for x in self.informationServices if x.name == self.temperature_forecast_name][0]
+        interval_times = [ti.startTime for ti in time_intervals]
+        outside_air_temperatures = None
+        if hasattr(temperature_forecast, 'forecast_values'):
+            # Read the temperatures straight from the parsed forecast arrays where the service provides them.
+            outside_air_temperatures = temperature_forecast.forecast_values(interval_times)
+        if outside_air_temperatures is None:
+            temperatures = {}
+            for iv in temperature_forecast.predictedValues:
+                if iv.measurementType == MeasurementType.Temperature:
+                    temperatures.setdefault(iv.timeInterval.startTime, iv)
+            outside_air_temperatures = np.full(len(time_intervals), np.nan)
+            for i, start_time in enumerate(interval_times):
+                temperature = temperatures.get(start_time)
+                if temperature is not None and temperature.value is not None:
+                    outside_air_temperatures[i] = temperature.value
+        occupied = self.occupancy_manager.check_schedule_many(interval_times)
+        return interval_times, outside_air_temperatures, occupied
+
+    def _get_scheduled_powers_from_model(self, time_intervals: List[TimeInterval]) -> np.ndarray:
+        """Return schedule power values for each of the intervals from the models."""
+        return self.model_power_many(*self._get_model_inputs(time_intervals))
+
+    def _get_power_flexibilities_from_model(self, time_intervals: List[TimeInterval]) -> np.ndarray:
+        """Return an (intervals x 2) array of the minimum and maximum power of the models in each interval."""
+        flexibility = self.model_flexibility_many(*self._get_model_inputs(time_intervals))
+        power_flexibility = np.column_stack((flexibility.min(axis=1), flexibility.max(axis=1)))
+        inflexible = power_flexibility[:, 0] == power_flexibility[:, 1]
+        power_flexibility[inflexible, 0] -= 1e-10
+        return power_flexibility
+
+    def _get_price_flexibility(self, time_interval: TimeInterval, market: Market, multiplier: float = 1.0,
+                               price_statistics: PriceStatistics = None) -> List[float]:
         # interval_price = find_obj_by_ti(market.marginalPrices, time_interval)
         # effective_price = interval_price.value if interval_price else market.defaultPrice
         # min_price = 0.8 * effective_price
         # max_price = 1.2 * effective_price
         start_time = time_interval.startTime
-        average_price, standard_deviation = market.priceModel.get(start_time)
+        price_statistics = price_statistics if price_statistics else get_price_statistics(market)
+        average_price, standard_deviation = price_statistics.get(start_time)
         min_price = average_price - (multiplier * standard_deviation)
         max_price = average_price + (multiplier * standard_deviation)
         return [min_price, max_price]
@@ -106,6 +127,7 @@ class ModelFrameAsset(LocalAsset, ModelFrame):
         upper_vertex = Vertex(marginal_price=price_flexibility[1], prod_cost=0.0, power=power_flexibility[1])
         return [lower_vertex, upper_vertex]
 
+    @instrumented('model_frame_asset.schedule_power')
     def schedule_power(self, market):
         # Determine powers of an asset in active time intervals.
         # - Updates self.scheduledPowers - the schedule of power consumed
@@ -114,22 +136,17 @@ class ModelFrameAsset(LocalAsset, ModelFrame):
         time_intervals = market.timeIntervals
         time_intervals.sort(key=lambda x: x.startTime)
 
-        # Get temperature forecast:
-        temperature_forecast = [x for x in self.informationServices if x.name == self.temperature_forecast_name][0]
-        temperatures = [iv for iv in temperature_forecast.predictedValues
-                        if iv.measurementType == MeasurementType.Temperature]
-
         default_value = self.defaultPower
 
-        for time_interval in time_intervals:
-            # Get temperature for this interval:
-            outside_air_temperature = find_obj_by_ti(temperatures, time_interval)
-            # Get new scheduled power value for this time interval:
-            modeled_value = self._get_scheduled_power_from_model(time_interval, outside_air_temperature)
+        # Get new scheduled power values for all time intervals at once:
+        modeled_values = self._get_scheduled_powers_from_model(time_intervals)
+
+        for time_interval, modeled_value in zip(time_intervals, modeled_values):
+            modeled_value = float(modeled_value)
             value = modeled_value if modeled_value else default_value  # Use default if modeled values is not available.
 
             # Check whether a scheduled power already exists for the indexed time interval:
-            iv = find_obj_by_ti(self.scheduledPowers, time_interval)
+            iv = self.scheduledPowers.get(time_interval)
 
             if iv is None:  # A scheduled power does not exist for the indexed time interval.
                 # Create an interval value with the value and append it to scheduled powers:
@@ -140,41 +157,33 @@ class ModelFrameAsset(LocalAsset, ModelFrame):
                 iv.value = value  # [avg.kW]
 
         # Remove expired intervals to prevent the list of scheduled powers from growing indefinitely:
-        self.scheduledPowers = [x for x in self.scheduledPowers if x.market.marketState != MarketState.Expired]
+        self.scheduledPowers.expire()
 
         self.scheduleCalculated = True
 
+    @instrumented('model_frame_asset.update_vertices')
     def update_vertices(self, market):
         """Create vertices to represent the asset's flexibility"""
         # Gather and sort active time intervals:
         time_intervals = market.timeIntervals
         time_intervals.sort(key=lambda x: x.startTime)
 
-        # Get temperature forecast
-        temperature_forecast = [x for x in self.informationServices if x.name == self.temperature_forecast_name][0]
-        temperatures = [iv for iv in temperature_forecast.predictedValues
-                        if iv.measurementType == MeasurementType.Temperature]
+        # Get physical flexibility of all active time intervals at once:
+        power_flexibilities = self._get_power_flexibilities_from_model(time_intervals)
 
+        price_statistics = get_price_statistics(market)
         # Index through active time intervals.
-        for time_interval in time_intervals:
-            # Get temperature for this interval:
-            outside_air_temperature = find_obj_by_ti(temperatures, time_interval)
-
-            # Get physical flexibility:
-            power_flexibility = self._get_power_flexibility_from_model(time_interval, outside_air_temperature)
-
+        for time_interval, power_flexibility in zip(time_intervals, power_flexibilities.tolist()):
             # Get price flexibility:
-            price_flexibility = self._get_price_flexibility(time_interval, market)
+            price_flexibility = self._get_price_flexibility(time_interval, market, price_statistics=price_statistics)
 
             vertices = self._create_vertices(power_flexibility, price_flexibility)
-            self.activeVertices = [x for x in self.activeVertices if x.timeInterval != time_interval]
-            for vertex in vertices:
-                self.activeVertices.append(
-                    IntervalValue(self, time_interval, market, MeasurementType.ActiveVertex, vertex)
-                )
+            self.activeVertices.replace(time_interval,
+                                        [IntervalValue(self, time_interval, market, MeasurementType.ActiveVertex, v)
+                                         for v in vertices])
 
         # Trim the list of active vertices so that it will not grow indefinitely.
-        self.activeVertices = [x for x in self.activeVertices if x.market.marketState != MarketState.Expired]
+        self.activeVertices.expire()
 
     def actuate(self, mkt: Market):
         self.actuation_manager.actuate(mkt)
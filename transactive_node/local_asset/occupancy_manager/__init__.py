@@ -1,37 +1,84 @@
+import numpy as np
+
 from datetime import datetime
 from dateutil import parser
 
 from tent.utils.timer import Timer
 
+MINUTES_PER_DAY = 1440
+# 1970-01-01, the datetime64 epoch, was a Thursday.
+EPOCH_WEEKDAY = 3
+
 
 class OccupancyManager:
-    def __init__(self, schedule: dict):
+    def __init__(self, schedule: dict, exceptions: dict = None):
+        """Weekly occupancy schedule compiled into a minute resolution bitmap.
+
+        schedule maps day names to "always_on", "always_off" or {"start": time, "end": time}. Days which are not in
+        the schedule are unoccupied. exceptions maps dates (e.g., holidays) to the same kinds of entries, which take
+        the place of the weekly schedule on those dates.
+        """
         self.occupied = property(self.check_schedule)
         self.schedule = {}
+        self.exceptions = {}
         if schedule:
             self.always_occupied = False
             for day_str, schedule_info in schedule.items():
                 _day = parser.parse(day_str).weekday()
-                if schedule_info not in ["always_on", "always_off"]:
-                    start = parser.parse(schedule_info["start"]).time()
-                    end = parser.parse(schedule_info["end"]).time()
-                    self.schedule[_day] = {"start": start, "end": end}
-                else:
-                    self.schedule[_day] = schedule_info
+                self.schedule[_day] = self._parse_schedule_info(schedule_info)
         else:
             self.always_occupied = True
+        for date_str, schedule_info in (exceptions or {}).items():
+            self.exceptions[parser.parse(date_str).date()] = self._parse_schedule_info(schedule_info)
+        self._compile()
+
+    @staticmethod
+    def _parse_schedule_info(schedule_info):
+        if schedule_info not in ["always_on", "always_off"]:
+            start = parser.parse(schedule_info["start"]).time()
+            end = parser.parse(schedule_info["end"]).time()
+            return {"start": start, "end": end}
+        return schedule_info
+
+    @staticmethod
+    def _compile_day(schedule_info) -> np.ndarray:
+        minutes = np.arange(MINUTES_PER_DAY)
+        if schedule_info is None or "always_off" in schedule_info:
+            return np.zeros(MINUTES_PER_DAY, dtype=bool)
+        if "always_on" in schedule_info:
+            return np.ones(MINUTES_PER_DAY, dtype=bool)
+        start = schedule_info["start"].hour * 60 + schedule_info["start"].minute
+        end = schedule_info["end"].hour * 60 + schedule_info["end"].minute
+        return (start <= minutes) & (minutes < end)
+
+    def _compile(self):
+        if self.always_occupied:
+            self._week = np.ones(7 * MINUTES_PER_DAY, dtype=bool)
+        else:
+            self._week = np.concatenate([self._compile_day(self.schedule.get(day)) for day in range(7)])
+        self._exception_days = {np.datetime64(date, 'D').astype(np.int64): self._compile_day(info)
+                                for date, info in self.exceptions.items()}
 
     def check_schedule(self, dt: datetime = None):
+        dt = dt if dt else Timer.now()
+        if self._exception_days:
+            exception = self._exception_days.get(dt.toordinal() - 719163)  # Days since the datetime64 epoch.
+            if exception is not None:
+                return bool(exception[dt.hour * 60 + dt.minute])
         if self.always_occupied:
             return True
-        dt = dt if dt else Timer.now()
-        current_schedule = self.schedule[dt.weekday()]
-        if "always_on" in current_schedule:
-            occupied = True
-        elif "always_off" in current_schedule:
-            occupied = False
-        else:
-            _start = current_schedule["start"]
-            _end = current_schedule["end"]
-            occupied = True if _start <= dt.time() < _end else False
+        return bool(self._week[dt.weekday() * MINUTES_PER_DAY + dt.hour * 60 + dt.minute])
+
+    def check_schedule_many(self, times) -> np.ndarray:
+        """Return a boolean array of whether the schedule is occupied at each of the times."""
+        if not isinstance(times, np.ndarray):
+            times = np.array([t.replace(tzinfo=None) for t in times], dtype='datetime64[m]')
+        minutes = times.astype('datetime64[m]').astype(np.int64)
+        days = minutes // MINUTES_PER_DAY
+        minute_of_day = minutes % MINUTES_PER_DAY
+        occupied = self._week[((days + EPOCH_WEEKDAY) % 7) * MINUTES_PER_DAY + minute_of_day]
+        if self._exception_days:
+            for day in np.intersect1d(days, np.fromiter(self._exception_days, dtype=np.int64)):
+                mask = days == day
+                occupied[mask] = self._exception_days[day][minute_of_day[mask]]
         return occupied
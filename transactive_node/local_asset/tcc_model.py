@@ -1,17 +1,26 @@
+import functools
+import gevent
 import logging
+import numpy as np
+import time
 
 from datetime import timedelta
+from gevent.pool import Pool
 from typing import Union
 
 from tent.containers.interval_value import IntervalValue
 from tent.containers.vertex import Vertex
-from tent.enumerations.market_state import MarketState
 from tent.enumerations.measurement_type import MeasurementType
 from tent.local_asset import LocalAsset
 from tent.utils.timer import Timer
-from tent.utils.helpers import find_obj_by_ti, format_timestamp, production
+from tent.utils.helpers import format_timestamp, production
 from tent.utils.log import setup_logging
 
+from transactive_node.dark_sky_temperature_forecast_model import backoff_delay
+from transactive_node.local_asset.interval_value_store import IntervalIndexedAsset, IntervalValueStore
+from transactive_node.util.instrumentation import instrumented
+from transactive_node.util.price_statistics import get_price_statistics, invalidate_price_statistics
+
 from volttron.platform.vip.agent.utils import build_agent
 from volttron.platform.agent.base_market_agent import MarketAgent
 from volttron.platform.agent.base_market_agent.poly_line import PolyLine
@@ -24,7 +33,106 @@ setup_logging()
 _log = logging.getLogger(__name__)
 
 
-class TCCModel(LocalAsset):
+class MixMarketBarrier(object):
+    """Completion barrier over the interval mix-markets of one day-ahead clearing.
+
+    Records the latency of the aggregate and price callbacks of each interval, measured from the start of the clearing,
+    so that it can be seen which intervals hold up the clearing.
+    """
+    def __init__(self, interval_count: int):
+        self.interval_count = interval_count
+        self.started = time.monotonic()
+        self.aggregate_latencies = [None] * interval_count
+        self.price_latencies = [None] * interval_count
+        self.completed = False
+
+    def aggregate_received(self, idx: int):
+        self.aggregate_latencies[idx] = time.monotonic() - self.started
+
+    def price_received(self, idx: int) -> bool:
+        """Record the price of an interval. Returns True only once, when the last interval has cleared."""
+        if self.price_latencies[idx] is None:
+            self.price_latencies[idx] = time.monotonic() - self.started
+        if self.completed or any(latency is None for latency in self.price_latencies):
+            return False
+        self.completed = True
+        return True
+
+    def summary(self) -> dict:
+        cleared = [(latency, idx) for idx, latency in enumerate(self.price_latencies) if latency is not None]
+        slowest_latency, slowest_idx = max(cleared) if cleared else (None, None)
+        return {
+            'intervals': self.interval_count,
+            'cleared': len(cleared),
+            'clearing_time': time.monotonic() - self.started,
+            'slowest_interval': slowest_idx,
+            'slowest_latency': slowest_latency,
+            'aggregate_latencies': self.aggregate_latencies,
+            'price_latencies': self.price_latencies
+        }
+
+
+class DemandCurveArray(object):
+    """Aggregate demand curves of a set of mix-market intervals, as (quantity, price) points.
+
+    The points are held in a preallocated (intervals x max_points x 2) array, which is reset in place for each clearing.
+    Curves with more points than max_points keep their end points and evenly spaced points between. Intervals whose
+    curves have not been received are None when indexed.
+    """
+    def __init__(self, interval_count: int, max_points: int = 2):
+        self.max_points = max(int(max_points), 2)
+        self.points = np.full((int(interval_count), self.max_points, 2), np.nan)
+        self.counts = np.zeros(int(interval_count), dtype=int)
+
+    def __len__(self):
+        return self.counts.size
+
+    def __getitem__(self, idx):
+        count = self.counts[idx]  # Raises IndexError past the last interval, as the lists of curves did.
+        return self.points[idx, :count] if count else None
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.to_wire()})'
+
+    def set(self, idx: int, points):
+        """Set the curve of an interval from an array or sequence of (quantity, price) pairs or Points."""
+        points = np.asarray([p.tuppleize() if hasattr(p, 'tuppleize') else p for p in points], dtype=float)
+        if len(points) > self.max_points:
+            points = points[np.linspace(0, len(points) - 1, self.max_points).round().astype(int)]
+        self.points[idx, :len(points)] = points
+        self.points[idx, len(points):] = np.nan
+        self.counts[idx] = len(points)
+
+    def reset(self):
+        self.points.fill(np.nan)
+        self.counts.fill(0)
+
+    def copy_from(self, other: 'DemandCurveArray'):
+        if self.points.shape != other.points.shape:
+            self.max_points = other.max_points
+            self.points = other.points.copy()
+            self.counts = other.counts.copy()
+        else:
+            np.copyto(self.points, other.points)
+            np.copyto(self.counts, other.counts)
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.counts.all())
+
+    def max_quantities(self) -> np.ndarray:
+        """Return the largest quantity of the curve of each interval (NaN where there is no curve)."""
+        quantities = self.points[:, :, 0]
+        result = np.full(len(self), np.nan)
+        received = self.counts > 0
+        result[received] = np.nanmax(quantities[received], axis=1)
+        return result
+
+    def to_wire(self) -> list:
+        return [self.points[i, :count].tolist() if count else None for i, count in enumerate(self.counts)]
+
+
+class TCCModel(IntervalIndexedAsset, LocalAsset):
     # TCCModel - A LocalAssetModel specialization that interfaces integrates
     # the PNNL ILC and/or TCC building systems with the transactive network.
     # TCC - Transactive Control & Coordination: Manages HVAC system load using
@@ -48,6 +156,10 @@ class TCCModel(LocalAsset):
                  mix_market_duration: Union[float, int, timedelta] = timedelta(minutes=20),
                  real_time_market_name: str = 'refinement_electric',
                  tcc_interval_count: int = 24,
+                 tcc_curve_points: int = 2,
+                 tcc_agent_retry_base: float = 5.0,
+                 tcc_agent_retry_max: float = 300.0,
+                 mix_market_concurrency: int = 24,
                  *args, **kwargs):
         super(TCCModel, self).__init__(*args, **kwargs)
 
@@ -58,10 +170,15 @@ class TCCModel(LocalAsset):
             else timedelta(seconds=mix_market_duration)
         self.real_time_market_name = str(real_time_market_name)
         self.tcc_interval_count = int(tcc_interval_count)
+        self.tcc_curve_points = int(tcc_curve_points)  # Points of each aggregate demand curve used for vertices.
+        self.tcc_agent_retry_base = float(tcc_agent_retry_base)  # Seconds, doubled on each failure to build the agent.
+        self.tcc_agent_retry_max = float(tcc_agent_retry_max)
+        # Aggregate and price callbacks of the interval mix-markets run concurrently on up to this many greenlets.
+        self.mix_market_pool = Pool(max(int(mix_market_concurrency), 1))
 
         # These properties and lists are to be dynamically assigned. An implementer would usually not manually assign
         # these properties.
-        self.building_demand_curves = [None]*self.tcc_interval_count
+        self.building_demand_curves = DemandCurveArray(self.tcc_interval_count, self.tcc_curve_points)
         self._building_market_prices = [self.building_market_default_price]*self.tcc_interval_count
         _log.info("Initial price: {}".format(self._building_market_prices))
         self.current_day_ahead_market_name = None
@@ -74,31 +191,78 @@ class TCCModel(LocalAsset):
         self.real_time_mix_market_running = False
         self.real_time_price = [None]*2
         self.real_time_quantity = [None]*2
-        self.real_time_building_demand_curve = [None]*2
-        self.tcc_curves = None
+        self.real_time_building_demand_curve = DemandCurveArray(1, self.tcc_curve_points)
+        self.tcc_curves: DemandCurveArray = None
         self.tcc_market_names = ['_'.join([self.base_tcc_market_name, str(i)]) for i in range(self.tcc_interval_count)]
+        self.mix_market_barrier = None
+        self.last_mix_market_summary = None
         self.tnt_real_time_market = None
 
         # TODO: Does the self.name in the next line need to be tn.name?
         self.market_balanced_price_topic = "{}/{}/market_balanced_prices".format(self.tn().db_topic, self.tn().name)
         self.cleared_price_topic = 'tnc/cleared_prices/{}'.format(self.name)
 
-        # Create TCC Market Agent
-        self.tcc_agent: MarketAgent = build_agent(agent_class=MarketAgent)
-
         self.tn().vip.pubsub.subscribe(peer='pubsub',
                                        prefix=self.market_balanced_price_topic,
                                        callback=self.send_cleared_price)
 
-        # Join electric mix-markets
-        for market in self.tcc_market_names:
-            self.tcc_agent.join_market(market, SELLER, self.reservation_callback, self.electric_offer_callback,
-                                       self.aggregate_callback, self.price_callback, self.error_callback)
-
-        # Join real time market
-        self.tcc_agent.join_market(self.real_time_market_name, SELLER, self.real_time_reservation_callback,
-                                   self.real_time_offer_callback, self.real_time_aggregate_callback,
-                                   self.real_time_price_callback, self.error_callback)
+        # Create TCC Market Agent. Connecting it to the platform is slow, so it is built in the background. The mix
+        # market is not started until it is ready. Failed builds are retried with backoff.
+        self.tcc_agent: MarketAgent = None
+        self.tcc_agent_failures = 0
+        self.tcc_agent_greenlet = None
+        self._spawn_tcc_agent_build()
+
+    def _spawn_tcc_agent_build(self, delay: float = 0):
+        self.tcc_agent_greenlet = gevent.spawn_later(delay, self._build_tcc_agent)
+        self.tcc_agent_greenlet.link_exception(self._tcc_agent_build_failed)
+
+    def _tcc_agent_build_failed(self, greenlet):
+        self.tcc_agent_failures += 1
+        delay = backoff_delay(self.tcc_agent_failures, self.tcc_agent_retry_base, self.tcc_agent_retry_max)
+        _log.error(f'{self.name} could not build its TCC market agent (failure {self.tcc_agent_failures}):'
+                   f' {greenlet.exception!r}. Retrying in {delay:.1f} seconds.')
+        self._spawn_tcc_agent_build(delay)
+
+    def _build_tcc_agent(self) -> MarketAgent:
+        tcc_agent = build_agent(agent_class=MarketAgent)
+        try:
+            # Join electric mix-markets
+            for market in self.tcc_market_names:
+                tcc_agent.join_market(market, SELLER, self.reservation_callback, self.electric_offer_callback,
+                                      self._dispatch(self.aggregate_callback), self._dispatch(self.price_callback),
+                                      self.error_callback)
+
+            # Join real time market
+            tcc_agent.join_market(self.real_time_market_name, SELLER, self.real_time_reservation_callback,
+                                  self.real_time_offer_callback, self._dispatch(self.real_time_aggregate_callback),
+                                  self._dispatch(self.real_time_price_callback), self.error_callback)
+        except Exception:
+            tcc_agent.core.stop()  # Disconnect the partially joined agent before a new one is built.
+            raise
+        self.tcc_agent = tcc_agent
+        self.tcc_agent_failures = 0
+        _log.info(f'{self.name} TCC market agent is ready.')
+        return tcc_agent
+
+    def _dispatch(self, callback):
+        """Wrap a mix-market callback to run on the mix-market pool.
+
+        The MarketAgent delivers the callbacks of every interval market from its message loop, one after another.
+        Running them on the pool lets the callbacks of the other intervals proceed while one waits on the bus. The
+        pool blocks the message loop once it is full. Reservation and offer callbacks return their answer to the
+        MarketAgent, so they are not dispatched.
+        """
+        @functools.wraps(callback)
+        def dispatch(*args, **kwargs):
+            greenlet = self.mix_market_pool.spawn(callback, *args, **kwargs)
+            greenlet.link_exception(functools.partial(self._callback_failed, callback.__name__))
+            return greenlet
+        return dispatch
+
+    @staticmethod
+    def _callback_failed(name, greenlet):
+        _log.error(f'Mix-market {name} failed: {greenlet.exception!r}')
 
     def start_real_time_mixmarket(self, resend_balanced_prices=False, mkt=None):
         tn = self.tn()
@@ -127,6 +291,7 @@ class TCCModel(LocalAsset):
             near_end_of_hour = self.near_end_of_hour(now)
 
         self.tnt_real_time_market.check_marginal_prices(self)
+        invalidate_price_statistics([self.tnt_real_time_market])
 
         _log.debug("Building start_realtime_mixmarket for name: {}: converged: {}, resend_balanced_prices: {},"
                    " near_end_of_hour: {}".format(
@@ -148,7 +313,8 @@ class TCCModel(LocalAsset):
             initial_price = self.tnt_real_time_market.marginalPrices
             _log.debug("Building start_realtime_mixmarket:"
                        " initial startTime : {}".format(initial_price[0].timeInterval.startTime))
-            avg_price, std_dev = self.tnt_real_time_market.priceModel.get(initial_price[0].timeInterval.startTime)
+            price_statistics = get_price_statistics(self.tnt_real_time_market)
+            avg_price, std_dev = price_statistics.get(initial_price[0].timeInterval.startTime)
             prices_tuple = [(avg_price, std_dev)]
 
             self.real_time_price = [price[0].value]
@@ -189,26 +355,7 @@ class TCCModel(LocalAsset):
                                                    "temp": temps,
                                                    "Date": format_timestamp(now),
                                                    "correction_market": True})
-
-                # TODO: Remove this! Testing only!
-                self.real_time_reservation_callback(timestamp="2021-07-02 00:00:00",
-                                                    market_name="electric_0",
-                                                    buyer_seller="seller")
-                self.real_time_offer_callback(timestamp="2021-07-02 00:00:00",
-                                              market_name="electric_0",
-                                              buyer_seller="seller")
-                supply_curve = PolyLine()
-                supply_curve.add(Point(quantity=19.467139937430645, price=9.875727030740128))
-                supply_curve.add(Point(quantity=19.467139937430645, price=7.999302698874049))
-                self.real_time_aggregate_callback(timestamp=Timer.get_cur_time(),
-                                                  market_name=self.real_time_market_name,
-                                                  buyer_seller='buyer',
-                                                  aggregate_demand=supply_curve)
-                self.real_time_price_callback(timestamp=Timer.get_cur_time(),
-                                              market_name=self.real_time_market_name,
-                                              buyer_seller='buyer',
-                                              price=9.079124841003399,
-                                              quantity=19.46335661743057)
+                # The callbacks of the real time mix-market arrive from the market service once it has cleared.
 
     # 191219DJH: Consider the interactions of mixed market with the market state machine, please.
     #            I'm finding it very hard to determine which functions address the mixed market, and which address the
@@ -227,7 +374,7 @@ class TCCModel(LocalAsset):
 
         # Reset quantities and curves
         self.quantities = [None]*self.tcc_interval_count
-        self.building_demand_curves = [None]*self.tcc_interval_count
+        self.building_demand_curves.reset()
 
         # TODO: Did this work here? Moved from state_machine_loop.
         # Clear old self.day_ahead_clear_price_sent of expired markets.
@@ -257,6 +404,7 @@ class TCCModel(LocalAsset):
             near_end_of_hour = self.near_end_of_hour(now)
 
         market.check_marginal_prices(self)
+        invalidate_price_statistics([market])
 
         _log.debug("Building start_mixMarket for name: {}: converged: {}, resend_balanced_prices: {},"
                    " near_end_of_hour: {}".format(
@@ -275,8 +423,9 @@ class TCCModel(LocalAsset):
             initial_prices = market.marginalPrices
             prices_tuple = list()
             time_intervals = list()
+            price_statistics = get_price_statistics(market)
             for x in range(len(initial_prices)):
-                avg_price, std_dev = market.priceModel.get(initial_prices[x].timeInterval.startTime)
+                avg_price, std_dev = price_statistics.get(initial_prices[x].timeInterval.startTime)
                 prices_tuple.append((avg_price, std_dev))
                 time_intervals.append(initial_prices[x].timeInterval.startTime.strftime('%Y%m%dT%H%M%S'))
 
@@ -288,6 +437,7 @@ class TCCModel(LocalAsset):
             if not self.mix_market_running and not near_end_of_hour:
                 _log.debug("Building start_mixMarket: here2")
                 self.mix_market_running = True
+                self.mix_market_barrier = MixMarketBarrier(self.tcc_interval_count)
                 # Update weather information
                 weather_service = None
                 if len(tn.informationServiceModels) > 0:
@@ -317,26 +467,15 @@ class TCCModel(LocalAsset):
                                                    "temp": temps,
                                                    "Date": format_timestamp(now),
                                                    "correction_market": False})
-                # TODO: Remove this! Testing only!
-                self.reservation_callback(timestamp="2021-07-02 00:00:00",
-                                          market_name="electric_0",
-                                          buyer_seller="seller")
-                self.electric_offer_callback(timestamp="2021-07-02 00:00:00",
-                                             market_name="electric_0",
-                                             buyer_seller="seller")
-                for i in range(self.tcc_interval_count):
-                    supply_curve = PolyLine()
-                    supply_curve.add(Point(quantity=19.467139937430645, price=9.875727030740128))
-                    supply_curve.add(Point(quantity=19.467139937430645, price=7.999302698874049))
-                    self.aggregate_callback(timestamp=Timer.get_cur_time(),
-                                            market_name=f'electric_{i}',
-                                            buyer_seller='buyer',
-                                            aggregate_demand=supply_curve)
-                    self.price_callback(timestamp=Timer.get_cur_time(),
-                                        market_name=f'electric_{i}',
-                                        buyer_seller='buyer',
-                                        price=9.079124841003399,
-                                        quantity=19.46335661743057)
+                # The interval mix-markets clear independently in the market service. Their callbacks arrive as
+                # separate messages in any order and run concurrently on the mix-market pool. The barrier completes
+                # the clearing when the last one arrives.
+
+    def _get_mix_market_barrier(self) -> MixMarketBarrier:
+        # Callbacks may arrive for a clearing this node did not start itself.
+        if self.mix_market_barrier is None or self.mix_market_barrier.completed:
+            self.mix_market_barrier = MixMarketBarrier(self.tcc_interval_count)
+        return self.mix_market_barrier
 
     def near_end_of_hour(self, now):
         near_end_of_hour = False
@@ -346,6 +485,7 @@ class TCCModel(LocalAsset):
 
         return near_end_of_hour
 
+    @instrumented('tcc_model.send_cleared_price')
     def send_cleared_price(self, peer, sender, bus, topic, headers, message):
         _log.info("At {}, {} receives new cleared prices: {}".format(Timer.get_cur_time(),
                                                                      self.name, message))
@@ -361,10 +501,11 @@ class TCCModel(LocalAsset):
 
         now = Timer.get_cur_time()
         prices_tuple = list()
+        price_statistics = get_price_statistics(market)
         if market.name.startswith('Day-Ahead'):
             for idx, p in enumerate(market.marginalPrices):
                 self._building_market_prices[idx] = p.value
-                avg_price, std_dev = market.priceModel.get(p.timeInterval.startTime)
+                avg_price, std_dev = price_statistics.get(p.timeInterval.startTime)
                 prices_tuple.append((avg_price, std_dev))
             self.prices = self._building_market_prices  # [p.value for p in prices]
             _log.info(f"Market for name: {market.name} CLEARED marginal prices are: {self.prices},"
@@ -386,7 +527,7 @@ class TCCModel(LocalAsset):
             price = market.marginalPrices
             # Get real time price from Real time market
             self.real_time_price = [price[0].value]
-            avg_price, std_dev = market.priceModel.get(price[0].timeInterval.startTime)
+            avg_price, std_dev = price_statistics.get(price[0].timeInterval.startTime)
             price_tuple = [(avg_price, std_dev)]
             _log.info(f"Market for name: {market.name} CLEARED marginal price are: {self.real_time_price},"
                       f" flag: {self.real_time_clear_price_sent[market.name]}")
@@ -407,6 +548,7 @@ class TCCModel(LocalAsset):
     #########################################################################
     # Electric TCC MixMarket methods
     #########################################################################
+    @instrumented('tcc_model.electric_offer_callback')
     def electric_offer_callback(self, timestamp, market_name, buyer_seller):
         if market_name in self.tcc_market_names:
             _log.debug("Building offer_callback: market_name: {}".format(market_name))
@@ -432,6 +574,7 @@ class TCCModel(LocalAsset):
             success, message = self.tcc_agent.make_offer(market_name, SELLER, supply_curve)
             _log.debug("{}: offer has {} - Message: {}".format(self.name, success, message))
 
+    @instrumented('tcc_model.reservation_callback')
     def reservation_callback(self, timestamp, market_name, buyer_seller):
         _log.debug("{}: wants reservation for {} as {} at {}".format(self.name,
                                                                      market_name,
@@ -446,30 +589,31 @@ class TCCModel(LocalAsset):
                        f" {self.day_ahead_mixmarket_running}")
             return True
 
+    @instrumented('tcc_model.aggregate_callback')
     def aggregate_callback(self, timestamp, market_name, buyer_seller, aggregate_demand):
         tn = self.tn()
         if buyer_seller == BUYER and market_name in self.tcc_market_names:  # self.base_tcc_market_name in market_name:
-            _log.debug("{}: at ts {} min of aggregate curve : {}".format(self.name,
-                                                                         timestamp,
-                                                                         aggregate_demand.points[0]))
-            _log.debug("{}: at ts {} max of aggregate curve : {}".format(self.name,
-                                                                         timestamp,
-                                                                         aggregate_demand.points[- 1]))
-            _log.debug("At {}: Report aggregate Market: {} buyer Curve: {}".format(Timer.get_cur_time(),
-                                                                                   market_name,
-                                                                                   aggregate_demand))
+            curve = np.array([p.tuppleize() for p in aggregate_demand.points], dtype=float)
+            if _log.isEnabledFor(logging.DEBUG):
+                _log.debug(f"{self.name}: at ts {timestamp} aggregate curve of {market_name} from {curve[0].tolist()}"
+                           f" to {curve[-1].tolist()} ({len(curve)} points)")
             idx = int(market_name.split('_')[-1])
-            self.building_demand_curves[idx] = (aggregate_demand.points[0], aggregate_demand.points[-1])
+            self.building_demand_curves.set(idx, curve)
+            self._get_mix_market_barrier().aggregate_received(idx)
             db_topic = "/".join([tn.db_topic, self.name, "AggregateDemand"])
             message = {
                 "Timestamp": format_timestamp(timestamp),
                 "MarketName": market_name,
-                "Curve": aggregate_demand.points
+                "Curve": curve.tolist()
             }
             headers = {headers_mod.DATE: format_timestamp(Timer.get_cur_time())}
-            # TODO: Should this use tcc_agent?
-            tn.vip.pubsub.publish("pubsub", db_topic, headers, message).get()
+            # The aggregate demand of every mix-market is published to this topic, so these must not be coalesced.
+            tn.publisher.publish(db_topic, message, headers, coalesce=False)
+            if getattr(tn, 'record_store', None) is not None:
+                tn.record_store.append('aggregate_demand', Timer.get_cur_time(), market=market_name, entity=self.name,
+                                       payload=message)
 
+    @instrumented('tcc_model.price_callback')
     def price_callback(self, timestamp, market_name, buyer_seller, price, quantity):
         _log.debug("{}: cleared price ({}, {}) for {} as {} at {}".format(Timer.get_cur_time(),
                                                                           price,
@@ -505,69 +649,80 @@ class TCCModel(LocalAsset):
         if quantity is not None and quantity < 0:
             _log.error("Quantity received from mixmarket is negative!!! {}".format(quantity))
 
-        # If all markets (ie. exclude 1st value) are done then update demands, otherwise do nothing
-        mix_market_done = all([False if q is None else True for q in self.quantities])
-
-        idx = int(market_name.split('_')[-1])
+        # If all markets (ie. exclude 1st value) are done then update demands, otherwise do nothing.
+        # The barrier reports completion only once, however many callbacks are running concurrently.
+        barrier = self._get_mix_market_barrier()
+        mix_market_done = barrier.price_received(idx)
         _log.debug("Mix market done: {}, market idx: {}".format(mix_market_done, idx))
 
         if mix_market_done:
+            summary = self.last_mix_market_summary = barrier.summary()
+            _log.info(f"{self.name}: {summary['cleared']} mix-markets cleared in {summary['clearing_time']:.3f} s,"
+                      f" slowest was {self.base_tcc_market_name}_{summary['slowest_interval']}"
+                      f" at {summary['slowest_latency']:.3f} s.")
+            _log.debug(f"{self.name}: mix-market aggregate latencies: {summary['aggregate_latencies']},"
+                       f" price latencies: {summary['price_latencies']}")
             self.day_ahead_mixmarket_running = False
             # Check if any quantity is greater than physical limit of the supply wire
             _log.debug("Quantity: {}".format(self.quantities))
-            if not all([False if q > self.max_deliver_capacity else True for q in self.quantities]):
+            if np.any(np.asarray(self.quantities, dtype=float) > self.max_deliver_capacity):
                 _log.error("One of quantity is greater than "
                            "physical limit {}".format(self.max_deliver_capacity))
 
             # Check demand curves exist
-            all_curves_exist = all([False if q is None else True for q in self.building_demand_curves])
-            if not all_curves_exist:
-                _log.error("Demand curves: {}".format(self.building_demand_curves))
+            curves = self.building_demand_curves
+            if not curves.complete:
+                _log.error("Demand curves: {}".format(curves))
                 raise Exception("Mix market has all quantities but not all demand curves")
+            over_capacity = np.nonzero(curves.max_quantities() > self.max_deliver_capacity)[0]
+            if over_capacity.size:
+                _log.error(f"{self.name}: demand curves of intervals {over_capacity.tolist()} exceed the physical"
+                           f" limit {self.max_deliver_capacity}")
 
             # Update demand and balance market
             self.mix_market_running = False
 
-            curves_arr = [(c[0].tuppleize(), c[1].tuppleize()) if c is not None else None
-                          for c in self.building_demand_curves]
-            _log.debug("Data at time {}:".format(Timer.get_cur_time()))
-            _log.debug("Market intervals: {}".format([x.name for x in tn.markets[0].timeIntervals]))
-            _log.debug("Quantities: {}".format(self.quantities))
-            _log.debug("Prices: {}".format(self.prices))
-            _log.debug("Curves: {}".format(curves_arr))
+            if _log.isEnabledFor(logging.DEBUG):
+                _log.debug("Data at time {}:".format(Timer.get_cur_time()))
+                _log.debug("Market intervals: {}".format([x.name for x in tn.markets[0].timeIntervals]))
+                _log.debug("Quantities: {}".format(self.quantities))
+                _log.debug("Prices: {}".format(self.prices))
+                _log.debug("Curves: {}".format(curves))
 
             db_topic = "/".join([tn.db_topic, self.name, "AggregateDemand"])
-            message = {"Timestamp": format_timestamp(timestamp), "Curves": self.building_demand_curves}
+            message = {"Timestamp": format_timestamp(timestamp), "Curves": curves.to_wire()}
             headers = {headers_mod.DATE: format_timestamp(Timer.get_cur_time())}
-            # TODO: Should this use tcc_agent?
-            tn.vip.pubsub.publish("pubsub", db_topic, headers, message).get()
+            tn.publisher.publish(db_topic, message, headers)
 
             # Get TNT market index from current day ahead market name
             tnt_mkt = tn.get_market_by_name(self.current_day_ahead_market_name)
 
             db_topic = "/".join([tn.db_topic, self.name, "Price"])
             price_message = []
+            store = getattr(tn, 'record_store', None)
             for i in range(len(tnt_mkt.timeIntervals)):
                 ts = tnt_mkt.timeIntervals[i].name
                 price = self.prices[i]
                 quantity = self.quantities[i]
                 price_message.append({'timeInterval': ts, 'price': price, 'quantity': quantity})
+                if store is not None:
+                    store.append('tcc_cleared_price', Timer.get_cur_time(), price, market=tnt_mkt.name,
+                                 interval_start=tnt_mkt.timeIntervals[i].startTime, entity=self.name,
+                                 payload={'quantity': quantity})
             message = {"Timestamp": format_timestamp(timestamp), "Price": price_message}
             headers = {headers_mod.DATE: format_timestamp(Timer.get_cur_time())}
-            # TODO: Should this use tcc_agent?
-            tn.vip.pubsub.publish("pubsub", db_topic, headers, message).get()
+            tn.publisher.publish(db_topic, message, headers)
 
             # SN: Setting TCC curves in local asset model (TccModel)
             self.set_scheduled_power(self.quantities,
                                      self.prices,
                                      self.building_demand_curves,
                                      tnt_mkt)
-            for curve in self.building_demand_curves:
-                _log.debug("XXX Building curves: {}".format(curve))
 
     #########################################################################
     # Real Time TCC MixMarket methods
     #########################################################################
+    @instrumented('tcc_model.real_time_reservation_callback')
     def real_time_reservation_callback(self, timestamp, market_name, buyer_seller):
         _log.debug("{}: wants reservation for {} as {} at {}".format(self.name,
                                                                      market_name,
@@ -582,6 +737,7 @@ class TCCModel(LocalAsset):
                        f" {self.day_ahead_mixmarket_running}")
             return True
 
+    @instrumented('tcc_model.real_time_offer_callback')
     def real_time_offer_callback(self, timestamp, market_name, buyer_seller):
         # Get price from marginal price of TNT market
         price = self.tnt_real_time_market.marginalPrices
@@ -603,29 +759,29 @@ class TCCModel(LocalAsset):
         success, message = self.tcc_agent.make_offer(market_name, SELLER, supply_curve)
         _log.debug("{}: offer has {} - Message: {}".format(self.name, success, message))
 
+    @instrumented('tcc_model.real_time_aggregate_callback')
     def real_time_aggregate_callback(self, timestamp, market_name, buyer_seller, aggregate_demand):
         tn = self.tn()
         if buyer_seller == BUYER and market_name == self.real_time_market_name:
-            _log.debug("{}: at ts {} min of aggregate curve : {}".format(self.name,
-                                                                         timestamp,
-                                                                         aggregate_demand.points[0]))
-            _log.debug("{}: at ts {} max of aggregate curve : {}".format(self.name,
-                                                                         timestamp,
-                                                                         aggregate_demand.points[- 1]))
-            _log.debug("At {}: Report aggregate Market: {} buyer Curve: {}".format(Timer.get_cur_time(),
-                                                                                   market_name,
-                                                                                   aggregate_demand))
-            self.real_time_building_demand_curve = [(aggregate_demand.points[0], aggregate_demand.points[-1])]
+            curve = np.array([p.tuppleize() for p in aggregate_demand.points], dtype=float)
+            if _log.isEnabledFor(logging.DEBUG):
+                _log.debug(f"{self.name}: at ts {timestamp} aggregate curve of {market_name} from {curve[0].tolist()}"
+                           f" to {curve[-1].tolist()} ({len(curve)} points)")
+            self.real_time_building_demand_curve.set(0, curve)
             db_topic = "/".join([tn.db_topic, self.name, "AggregateDemand"])
             message = {
                 "Timestamp": format_timestamp(timestamp),
                 "MarketName": market_name,
-                "Curve": aggregate_demand.points
+                "Curve": curve.tolist()
             }
             headers = {headers_mod.DATE: format_timestamp(Timer.get_cur_time())}
-            # TODO: Should this use tcc_agent?
-            tn.vip.pubsub.publish("pubsub", db_topic, headers, message).get()
+            # The aggregate demand of every mix-market is published to this topic, so these must not be coalesced.
+            tn.publisher.publish(db_topic, message, headers, coalesce=False)
+            if getattr(tn, 'record_store', None) is not None:
+                tn.record_store.append('aggregate_demand', Timer.get_cur_time(), market=market_name, entity=self.name,
+                                       payload=message)
 
+    @instrumented('tcc_model.real_time_price_callback')
     def real_time_price_callback(self, timestamp, market_name, buyer_seller, price, quantity):
         _log.debug("{}: cleared price ({}, {}) for {} as {} at {}".format(Timer.get_cur_time(),
                                                                           price,
@@ -643,19 +799,17 @@ class TCCModel(LocalAsset):
 
         self.real_time_mix_market_running = False
 
-        curves_arr = [(c[0].tuppleize(), c[1].tuppleize()) if c is not None else None
-                      for c in self.real_time_building_demand_curve]
-        _log.debug("Real Time market Data at time {}:".format(Timer.get_cur_time()))
-        _log.debug("Real Time market Market intervals: {}".format(market.name))
-        _log.debug("Real Time market Quantities: {}".format(self.real_time_quantity))
-        _log.debug("Real Time market Prices: {}".format(self.real_time_price))
-        _log.debug("Real Time market Curves: {}".format(curves_arr))
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug("Real Time market Data at time {}:".format(Timer.get_cur_time()))
+            _log.debug("Real Time market Market intervals: {}".format(market.name))
+            _log.debug("Real Time market Quantities: {}".format(self.real_time_quantity))
+            _log.debug("Real Time market Prices: {}".format(self.real_time_price))
+            _log.debug("Real Time market Curves: {}".format(self.real_time_building_demand_curve))
 
         db_topic = "/".join([tn.db_topic, self.name, "RealTimeDemand"])
-        message = {"Timestamp": format_timestamp(timestamp), "Curves": self.real_time_building_demand_curve}
+        message = {"Timestamp": format_timestamp(timestamp), "Curves": self.real_time_building_demand_curve.to_wire()}
         headers = {headers_mod.DATE: format_timestamp(Timer.get_cur_time())}
-        # TODO: Should this use tcc_agent?
-        tn.vip.pubsub.publish("pubsub", db_topic, headers, message).get()
+        tn.publisher.publish(db_topic, message, headers)
 
         # SN: Setting TCC curves in local asset model (TccModel)
         self.set_scheduled_power(self.real_time_quantity,
@@ -667,6 +821,7 @@ class TCCModel(LocalAsset):
     # Shared TCC MixMarket methods
     #########################################################################
 
+    @instrumented('tcc_model.error_callback')
     def error_callback(self, timestamp, market_name, buyer_seller, error_code, error_message, aux):
         _log.debug("{}: error for {} as {} at {} - Message: {}".format(self.name,
                                                                        market_name,
@@ -674,17 +829,22 @@ class TCCModel(LocalAsset):
                                                                        timestamp,
                                                                        error_message))
 
-    def set_tcc_curves(self, quantities, prices, curves):
+    def set_tcc_curves(self, quantities, prices, curves: DemandCurveArray):
         self.quantities = quantities
         # Ignoring first element since state machine based market does not the correction
-        self.tcc_curves = curves
+        # The curves are copied, since the mix market reuses its arrays for the next clearing.
+        if self.tcc_curves is None:
+            self.tcc_curves = DemandCurveArray(len(curves), curves.max_points)
+        self.tcc_curves.copy_from(curves)
         self.prices = prices
         _log.info("TCC set_tcc_curves are: q: {}, p: {}, c: {}".format(len(self.quantities),
                                                                        len(self.tcc_curves),
                                                                        len(self.prices)))
-        _log.info("TCC set_tcc_curves actual demand curves: c: {}".format(self.tcc_curves))
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug("TCC set_tcc_curves actual demand curves: c: {}".format(self.tcc_curves))
 
     # SN: Schedule Power by starting Mix market
+    @instrumented('tcc_model.schedule_power')
     def schedule_power(self, mkt):
         _log.info("Market TCC tcc_model schedule_power()")
         if self.tcc_agent is not None and not self.mix_market_running:
@@ -713,21 +873,22 @@ class TCCModel(LocalAsset):
             self.update_vertices(mkt)
             self.scheduleCalculated = True
 
+        marginal_prices = IntervalValueStore(mkt.marginalPrices)
         for i in range(len(time_intervals)):
             time_interval = time_intervals[i]
             value = self.defaultPower
             if self.tcc_curves is not None:
                 # Update power at this marginal_price
-                marginal_price = find_obj_by_ti(mkt.marginalPrices, time_interval)
+                marginal_price = marginal_prices.get(time_interval)
                 marginal_price = marginal_price.value
                 value = production(self, marginal_price, time_interval)  # [avg. kW]
 
             iv = IntervalValue(self, time_interval, mkt, MeasurementType.ScheduledPower, value)
-            self.scheduledPowers.append(iv)
+            self.scheduledPowers.replace(time_interval, [iv])
 
         # 200929DJH: This following line is needed to make sure the list of scheduled powers does not grow indefinitely.
         #            Scheduled powers are retained only if their markets have not expired.
-        self.scheduledPowers = [x for x in self.scheduledPowers if x.market.marketState != MarketState.Expired]
+        self.scheduledPowers.expire()
 
         sp = [(x.timeInterval.name, x.value) for x in self.scheduledPowers]
         _log.debug("Market TCC scheduledPowers are: {}, length: {}".format(sp, len(sp)))
@@ -735,6 +896,7 @@ class TCCModel(LocalAsset):
         if self.scheduleCalculated:
             self.calculate_reserve_margin(mkt)
 
+    @instrumented('tcc_model.update_vertices')
     def update_vertices(self, mkt):
         if self.tcc_curves is None:
             super(TCCModel, self).update_vertices(mkt)
@@ -745,37 +907,32 @@ class TCCModel(LocalAsset):
             # #            multiple network markets having differing interval durations, numbers of intervals, etc.
 
             for i in range(len(time_intervals)):
-                if self.tcc_curves[i] is None:
+                if i >= len(self.tcc_curves) or self.tcc_curves[i] is None:
                     continue
                 # 200925DJH: Clean up active vertices that are to be replaced. This should be fine in Version 3 because
                 #            time intervals are unique to their markets.
                 try:
                     time_interval = time_intervals[i]
-                    self.activeVertices = [x for x in self.activeVertices if x.timeInterval != time_interval]
-                    point1 = self.tcc_curves[i][0].tuppleize()
-                    q1 = -point1[0]
-                    p1 = point1[1]
-                    point2 = self.tcc_curves[i][1].tuppleize()
-                    q2 = -point2[0]
-                    p2 = point2[1]
-
-                    if q2 != q1:
-                        v2 = Vertex(p2, 0, q2)
-                        iv2 = IntervalValue(self, time_intervals[i], mkt, MeasurementType.ActiveVertex, v2)
-                        self.activeVertices.append(iv2)
-                        v1 = Vertex(p1, 0, q1)
-                        iv1 = IntervalValue(self, time_interval, mkt, MeasurementType.ActiveVertex, v1)
-                        self.activeVertices.append(iv1)
+                    curve = self.tcc_curves[i]
+                    # The curves are the demand of the building, which this asset supplies.
+                    quantities = -curve[:, 0]
+                    prices = curve[:, 1]
+
+                    if np.any(quantities != quantities[0]):
+                        # Vertices are created from the last point of the curve to the first.
+                        self.activeVertices.replace(time_interval, [
+                            IntervalValue(self, time_interval, mkt, MeasurementType.ActiveVertex, Vertex(p, 0, q))
+                            for q, p in zip(quantities[::-1].tolist(), prices[::-1].tolist())])
                     else:
-                        v1 = Vertex(float("inf"), 0, q1)
+                        v1 = Vertex(float("inf"), 0, float(quantities[0]))
                         iv1 = IntervalValue(self, time_interval, mkt, MeasurementType.ActiveVertex, v1)
-                        self.activeVertices.append(iv1)
+                        self.activeVertices.replace(time_interval, [iv1])
                 except IndexError as e:
                     _log.debug("TCC model e: {}, i: {}".format(e, i))
 
         # 200929DJH: This is a good place to make sure the list of active vertices is trimmed and does not grow
         #            indefinitely.
-        self.activeVertices = [x for x in self.activeVertices if x.market.marketState != MarketState.Expired]
+        self.activeVertices.expire()
 
         av = [(x.timeInterval.name, x.value.marginalPrice, x.value.power) for x in self.activeVertices]
         _log.debug("TCC active vertices are: {}".format(av))
@@ -46,10 +46,12 @@ import logging
 import numpy as np
 
 from datetime import datetime
-from typing import Iterable, List
+from typing import Iterable, List, Sequence
 
 from volttron.platform.agent import utils
 
+from transactive_node.model_frame.time_series import DeviceHistory
+
 _log = logging.getLogger(__name__)
 utils.setup_logging()
 __version__ = "0.1"
@@ -61,6 +63,10 @@ class ModelFrame(object):
     def __init__(self, config, **kwargs):
         self.models = {}
         self.cleared_quantity = None
+        config = config if config else {}
+        # Recent device data of every model topic, for rolling statistics, calibration and gap detection.
+        self.device_history = DeviceHistory(config.get('history_capacity', 1440), config.get('history_horizon'),
+                                            config.get('history_sample_period'))
         if not config:
             return
         self.demand_curve_points = config.get('demand_curve_points', 2)
@@ -76,6 +82,7 @@ class ModelFrame(object):
             module = importlib.import_module(base_module + _file)
             self.model_class = getattr(module, model_type)
             model['model_config']['demand_curve_points'] = self.demand_curve_points
+            model['model_config'].setdefault('topic', topic)
             self.models[topic] = self.model_class(model['model_config'], parent=self)
 
     def model_flexibility(self, params: dict = None) -> List[float]:
@@ -100,6 +107,45 @@ class ModelFrame(object):
                 _log.debug("Error making prediction for %s", model.topic)
         return q
 
+    def model_flexibility_many(self, interval_times: Sequence[datetime], oats: Sequence[float] = None,
+                               occupied: Sequence[bool] = None) -> np.ndarray:
+        """Predict the flexibility of all models over many intervals at once.
+
+        Returns an (intervals x demand_curve_points) array with the summed power of all models at each point.
+        A NaN outdoor air temperature falls back to the latest measurement of each model.
+        """
+        hours, oats, occupied = self._interval_arrays(interval_times, oats, occupied)
+        q = np.zeros((len(hours), self.demand_curve_points))
+        for model in self.models.values():
+            try:
+                q += model.predict_flexibility_many(hours, oats, occupied)
+            except KeyError:
+                _log.debug("Error making prediction for %s", model.topic)
+        return q
+
+    def model_power_many(self, interval_times: Sequence[datetime], oats: Sequence[float] = None,
+                         occupied: Sequence[bool] = None) -> np.ndarray:
+        """Predict the summed power of all models for each of many intervals at once."""
+        hours, oats, occupied = self._interval_arrays(interval_times, oats, occupied)
+        q = np.zeros(len(hours))
+        for model in self.models.values():
+            try:
+                q += model.predict_power_many(hours, oats, occupied)
+            except KeyError:
+                _log.debug("Error making prediction for %s", model.topic)
+        return q
+
+    @staticmethod
+    def _interval_arrays(interval_times, oats=None, occupied=None):
+        if isinstance(interval_times, np.ndarray) and np.issubdtype(interval_times.dtype, np.datetime64):
+            hours = interval_times.astype('datetime64[h]').astype(np.int64) % 24
+        else:
+            hours = np.fromiter((t.hour for t in interval_times), dtype=np.int64)
+        n = len(hours)
+        oats = np.full(n, np.nan) if oats is None else np.asarray(oats, dtype=float)
+        occupied = np.ones(n, dtype=bool) if occupied is None else np.asarray(occupied, dtype=bool)
+        return hours, oats, occupied
+
 #
 # class BaseModel(object):
 #     def __init__(self, actuation_topic: str = None):
@@ -111,6 +157,12 @@ class ModelFrame(object):
 #     def predict_power(self, params: dict = None, set_point: float = None) -> float:
 #         pass
 #
+#     def predict_flexibility_many(self, hours: np.ndarray, oats: np.ndarray, occupied: np.ndarray) -> np.ndarray:
+#         pass
+#
+#     def predict_power_many(self, hours: np.ndarray, oats: np.ndarray, occupied: np.ndarray) -> np.ndarray:
+#         pass
+#
 #     def set_point_range(self, interval_start_time: datetime = None) -> Iterable[float]:
 #         pass
 #
@@ -36,6 +36,16 @@ class Lighting(object):
             power = set_point * self.rated_power
         return -power
 
+    def predict_flexibility_many(self, hours, oats=None, occupied=None):
+        """Array kernel for predict_flexibility over many intervals: returns an (intervals x n_points) array."""
+        schedule = np.asarray(self.lighting_schedule, dtype=float)[hours][:, np.newaxis]
+        offsets = np.linspace(-self.max_set_point_offset, self.max_set_point_offset, num=self.n_points)
+        set_points = schedule + offsets[np.newaxis, :]
+        return -np.where(set_points, set_points, schedule) * self.rated_power
+
+    def predict_power_many(self, hours, oats=None, occupied=None):
+        return -np.asarray(self.lighting_schedule, dtype=float)[hours] * self.rated_power
+
     # TODO: Make nominal setpoint max and double default offset max.
     def set_point_range(self, interval_start_time: datetime):
         index = interval_start_time.hour
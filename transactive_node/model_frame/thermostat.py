@@ -42,6 +42,7 @@ under Contract DE-AC05-76RL01830
 """
 
 import logging
+from datetime import datetime
 from volttron.platform.agent import utils
 import numpy as np
 
@@ -56,10 +57,9 @@ TIN = "ZoneTemperature"
 class Thermostat(object):
     def __init__(self, config, **kwargs):
         self.name = "Thermostat"
-        self.c1 = config["c1"]
-        self.c2 = config["c2"]
-        self.c3 = config["c3"]
-        self.c4 = config["c4"]
+        # Hourly coefficients as columns of one array, so that calibration updates are seen through c1 - c4.
+        self.coefficient_array = np.column_stack([np.asarray(config[c], dtype=float) for c in ("c1", "c2", "c3", "c4")])
+        self.c1, self.c2, self.c3, self.c4 = (self.coefficient_array[:, i] for i in range(4))
         self.nominal_set_point = config.get('nominal_setpoint', 22.8)
         self.unoccupied_set_point = config.get('unoccupied_set_point', self.nominal_set_point)
         self.max_set_point_offset = config.get('max_set_point_offset', 2.0)
@@ -71,9 +71,24 @@ class Thermostat(object):
         self.rated_power = config["rated_power"]
         self.n_points = config.get("demand_curve_points", 2)
         self.topic = config.get("topic", None)
+        self.parent = kwargs.get('parent')
         self.error = False
         self.actuation_topic = config.get('actuation_topic', None)
 
+        # Online calibration of the hourly coefficients by recursive least squares (disabled unless configured).
+        self.calibrate = config.get('calibrate', False)
+        self.calibration_point = config.get('calibration_point', None)  # On/off status, duty cycle or scaled power.
+        self.calibration_point_scale = float(config.get('calibration_point_scale', 1.0))
+        # Seconds of device data averaged into each calibration sample. The coefficients are hourly, so it should
+        # divide an hour.
+        self.calibration_window = float(config.get('calibration_window', 3600))
+        self._calibration_window_start = None
+        self.forgetting_factor = float(config.get('forgetting_factor', 0.995))
+        self.max_covariance = float(config.get('calibration_max_covariance', 1.0e4))
+        initial_covariance = float(config.get('calibration_initial_covariance', 100.0))
+        self.covariance = np.tile(np.eye(4) * initial_covariance, (len(self.coefficient_array), 1, 1))
+        self.calibration_samples = np.zeros(len(self.coefficient_array), dtype=int)
+
     def predict_flexibility(self, params=None):
         params = params if params else {}
         if not params.get('occupied'):
@@ -96,6 +111,32 @@ class Thermostat(object):
         power = duty_cycle * self.rated_power
         return -power
 
+    def predict_flexibility_many(self, hours, oats, occupied):
+        """Array kernel for predict_flexibility over many intervals: returns an (intervals x n_points) array."""
+        min_set_point, max_set_point = self.set_point_range()
+        csp_flex = np.linspace(min_set_point, max_set_point, num=self.n_points)
+        csp = np.where(occupied[:, np.newaxis], csp_flex[np.newaxis, :], self.unoccupied_set_point)
+        return self._predict_power_array(hours, oats, csp)
+
+    def predict_power_many(self, hours, oats, occupied):
+        """Array kernel for predict_power at the current set point over many intervals."""
+        csp = np.where(occupied, self.csp, self.unoccupied_set_point)
+        return self._predict_power_array(hours, oats, csp)
+
+    def _predict_power_array(self, hours, oats, csp):
+        oats = np.where(np.isnan(oats), self.oat, oats)
+        if csp.ndim == 2:
+            hours = hours[:, np.newaxis]
+            oats = oats[:, np.newaxis]
+        c1, c2, c3, c4 = (np.asarray(c, dtype=float)[hours] for c in (self.c1, self.c2, self.c3, self.c4))
+        q = csp * c1 + self.room_temp * c2 + oats * c3 + c4
+        return -np.clip(q, 0, 1) * self.rated_power
+
+    def history(self):
+        """Return the ring buffer time series of this model's device data, if its ModelFrame keeps one."""
+        device_history = getattr(self.parent, 'device_history', None)
+        return device_history.get(self.topic) if device_history is not None and self.topic else None
+
     def set_point_range(self, interval_start_time=None):
         set_point = self.nominal_set_point  # TODO: Extend for time_based schedule.
         return set_point - self.max_set_point_offset, set_point + self.max_set_point_offset
@@ -113,6 +154,53 @@ class Thermostat(object):
         except KeyError:
             _log.debug("Error for %s input data on topic %s", self.name, self.topic)
             self.error = True
+            return
+        if self.calibrate and self.calibration_point and now is not None:
+            self.calibrate_window(now)
+
+    def calibrate_window(self, now):
+        """Calibrate the coefficients with the means of the device data over each completed calibration window.
+
+        The calibration point is usually an on/off status, such as FirstStageCooling, which only becomes a duty cycle
+        when averaged over a window. The means are read from the device history of the ModelFrame.
+        """
+        series = self.history()
+        if series is None:
+            return
+        window_start = now.timestamp() // self.calibration_window * self.calibration_window
+        if self._calibration_window_start is None:
+            self._calibration_window_start = window_start
+        if window_start <= self._calibration_window_start:
+            return
+        start, self._calibration_window_start = self._calibration_window_start, window_start
+        end = start + self.calibration_window
+        means = [series.interval_mean(point, start, end) for point in (self.calibration_point, CSP, TIN, OAT)]
+        if any(mean is None for mean in means):
+            return
+        duty_cycle, csp, temp, oat = means
+        hour = datetime.fromtimestamp(start, now.tzinfo).hour
+        self.calibrate_sample(hour, csp, temp, oat, duty_cycle / self.calibration_point_scale)
+
+    def calibrate_sample(self, hour, csp, temp, oat, duty_cycle):
+        """Update the coefficients of the hour with one measured duty cycle by recursive least squares.
+
+        Each sample costs a fixed 4 x 4 update of that hour's covariance. Older samples are discounted by the
+        forgetting factor, so the coefficients follow slow changes in the zone.
+        """
+        if not 0.0 < duty_cycle < 1.0:
+            return  # The model is clipped at saturation, so a saturated duty cycle says little about q.
+        x = np.array([csp, temp, oat, 1.0])
+        p = self.covariance[hour]
+        px = p @ x
+        gain = px / (self.forgetting_factor + x @ px)
+        self.coefficient_array[hour] += gain * (duty_cycle - self.coefficient_array[hour] @ x)
+        p -= np.outer(gain, px)
+        p /= self.forgetting_factor
+        # Without excitation the forgetting factor inflates the covariance without bound, so limit it.
+        trace = np.trace(p)
+        if trace > self.max_covariance:
+            p *= self.max_covariance / trace
+        self.calibration_samples[hour] += 1
 
     def _get_q(self, oat, temp, temp_stpt, index):
         # _log.debug(f'oat: {oat}, temp: {temp}, temp_stpt: {temp_stpt}, index: {index}')
@@ -0,0 +1,142 @@
+import logging
+import math
+import numpy as np
+
+from datetime import datetime
+from typing import Dict, Iterable, Tuple
+
+from volttron.platform.agent import utils
+
+_log = logging.getLogger(__name__)
+utils.setup_logging()
+
+
+class RingBufferSeries(object):
+    """Preallocated time series of the points of one device.
+
+    Every row is written twice, at its position and one capacity further on, so that the latest rows (up to the
+    capacity) are always a contiguous slice of the buffer. Windows are returned as views of the buffer without
+    copying. Memory is fixed at creation, whatever the publish rate. Timestamps are stored as epoch seconds and rows
+    are expected in time order; rows older than the latest are dropped.
+    """
+    def __init__(self, points: Iterable[str], capacity: int = 1440):
+        self.capacity = max(int(capacity), 1)
+        self.points = list(points)
+        self._columns = {point: i for i, point in enumerate(self.points)}
+        self._times = np.full(2 * self.capacity, np.nan)
+        self._values = np.full((2 * self.capacity, len(self.points)), np.nan)
+        self._next = 0
+        self.size = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return self.size
+
+    @staticmethod
+    def _seconds(time) -> float:
+        return time.timestamp() if isinstance(time, datetime) else float(time)
+
+    def append(self, time, data: dict):
+        """Add a row. Points of the data which the series does not have are added as new columns."""
+        t = self._seconds(time)
+        if self.size and t < self._times[self._next + self.capacity - 1]:
+            self.dropped += 1
+            return
+        new_points = [p for p in data if p not in self._columns]
+        if new_points:
+            self._add_columns(new_points)
+        row = np.full(len(self.points), np.nan)
+        for point, value in data.items():
+            try:
+                row[self._columns[point]] = value
+            except (TypeError, ValueError):
+                pass  # Non-numeric points (e.g., status strings) are not kept.
+        i = self._next
+        self._times[i] = self._times[i + self.capacity] = t
+        self._values[i] = self._values[i + self.capacity] = row
+        self._next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def _add_columns(self, points):
+        for point in points:
+            self._columns[point] = len(self.points)
+            self.points.append(point)
+        self._values = np.hstack((self._values, np.full((2 * self.capacity, len(points)), np.nan)))
+
+    def _window_slice(self, seconds: float = None, count: int = None) -> slice:
+        end = self._next + self.capacity
+        n = self.size if count is None else min(int(count), self.size)
+        start = end - n
+        if seconds is not None and n:
+            start += int(np.searchsorted(self._times[start:end], self._times[end - 1] - seconds, side='left'))
+        return slice(start, end)
+
+    def window(self, seconds: float = None, count: int = None) -> Tuple[np.ndarray, np.ndarray]:
+        """Return views of the times and (rows x points) values of the latest rows, within seconds of the latest."""
+        window = self._window_slice(seconds, count)
+        return self._times[window], self._values[window]
+
+    def column(self, point: str, seconds: float = None, count: int = None) -> np.ndarray:
+        """Return a view of the values of one point in the window."""
+        column = self._columns.get(point)
+        if column is None:
+            return np.empty(0)
+        return self._values[self._window_slice(seconds, count), column]
+
+    def latest(self, point: str, default=None):
+        column = self._columns.get(point)
+        if column is None or not self.size:
+            return default
+        value = self._values[self._next + self.capacity - 1, column]
+        return default if np.isnan(value) else float(value)
+
+    def stats(self, point: str, seconds: float = None) -> Dict[str, float]:
+        """Rolling statistics of a point over the window, ignoring missing values."""
+        values = self.column(point, seconds)
+        values = values[~np.isnan(values)]
+        if not values.size:
+            return {'count': 0, 'mean': None, 'std': None, 'min': None, 'max': None}
+        return {'count': int(values.size), 'mean': float(values.mean()), 'std': float(values.std()),
+                'min': float(values.min()), 'max': float(values.max())}
+
+    def interval_mean(self, point: str, start, end) -> float:
+        """Mean of a point over the rows from start (inclusive) to end (exclusive), ignoring missing values.
+
+        The mean of an on/off status point over an interval is its duty cycle. Returns None if there are no values.
+        """
+        column = self._columns.get(point)
+        if column is None or not self.size:
+            return None
+        window = self._window_slice()
+        times = self._times[window]
+        first, last = np.searchsorted(times, (self._seconds(start), self._seconds(end)), side='left')
+        values = self._values[window][first:last, column]
+        values = values[~np.isnan(values)]
+        return float(values.mean()) if values.size else None
+
+    def gaps(self, max_interval: float, seconds: float = None):
+        """Return (start, end) epoch seconds of each gap between rows longer than max_interval seconds."""
+        times, _ = self.window(seconds)
+        idx = np.nonzero(np.diff(times) > max_interval)[0]
+        return [(float(times[i]), float(times[i + 1])) for i in idx]
+
+
+class DeviceHistory(object):
+    """Ring buffer time series of each device topic, shared by the models of a ModelFrame."""
+    def __init__(self, capacity: int = 1440, horizon: float = None, sample_period: float = None):
+        if horizon and sample_period:
+            capacity = math.ceil(float(horizon) / float(sample_period))
+        self.capacity = max(int(capacity), 1)
+        self.series: Dict[str, RingBufferSeries] = {}
+
+    def append(self, topic: str, time, data: dict):
+        series = self.series.get(topic)
+        if series is None:
+            series = self.series[topic] = RingBufferSeries(data, self.capacity)
+        series.append(time, data)
+
+    def get(self, topic: str) -> RingBufferSeries:
+        return self.series.get(topic)
+
+    def __contains__(self, topic):
+        return topic in self.series
@@ -1,5 +1,6 @@
 import datetime
 import logging
+import numpy as np
 
 from volttron.platform.agent import utils
 
@@ -22,6 +23,13 @@ class UncontrolledLoad(object):
         power = self.load_schedule[index]
         return -power
 
+    def predict_flexibility_many(self, hours, oats=None, occupied=None):
+        power = self.predict_power_many(hours)
+        return np.repeat(power[:, np.newaxis], self.n_points, axis=1)
+
+    def predict_power_many(self, hours, oats=None, occupied=None):
+        return -np.asarray(self.load_schedule, dtype=float)[hours]
+
     @staticmethod
     def set_point_range(interval_start_time: datetime):
         return None, None
@@ -0,0 +1,404 @@
+###########################################################################################
+# The NetworkRunner runs a whole transactive network in a single process without a VOLTTRON
+# platform. Each node is a TransactiveNodeAgent whose connection to the platform is replaced
+# by an in-memory stand-in for the message bus, and the markets of all nodes are driven from
+# a single loop. With a discrete event clock, a day of market operation takes only as long
+# as the computation it requires.
+# Remote platform connections (vip.auth) and the RPC calls of agents outside the network
+# (weather, actuators) are not available in process. Dependencies which need them must be
+# configured with their offline fallbacks, and RPC calls to peers outside the network fail.
+###########################################################################################
+
+import argparse
+import fnmatch
+import gevent
+import json
+import logging
+import re
+import sys
+
+from collections import deque, OrderedDict
+from datetime import timedelta
+from dateutil import parser
+from gevent.event import AsyncResult, Event
+
+from tent.utils.helpers import json_encoder
+from tent.utils.log import setup_logging
+from tent.utils.timer import Timer
+
+from transactive_node.agent import TransactiveNodeAgent
+from transactive_node.util.timer import Timer as SimulationTimer
+
+setup_logging()
+_log = logging.getLogger(__name__)
+
+# Match JSON strings along with '#' comments or trailing commas, so that these are only removed outside of strings.
+_STRING_OR_COMMENT = re.compile(r'"(?:\\.|[^"\\])*"|#[^\n]*')
+_STRING_OR_TRAILING_COMMA = re.compile(r'"(?:\\.|[^"\\])*"|,(?=\s*[}\]])')
+
+
+def _strip_outside_strings(pattern, text):
+    return pattern.sub(lambda m: m.group(0) if m.group(0).startswith('"') else '', text)
+
+
+def load_config(path):
+    """Load a JSON configuration file, ignoring the '#' comments and trailing commas of the sample configurations.
+
+    Raises ValueError, with the offending line, for anything else which is not JSON. Some sample configurations are
+    templates with placeholder expressions (e.g., minimum_power/2), which must be filled in before they can be run.
+    """
+    with open(path) as f:
+        text = f.read()
+    text = _strip_outside_strings(_STRING_OR_COMMENT, text)
+    text = _strip_outside_strings(_STRING_OR_TRAILING_COMMA, text)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        line = text.splitlines()[e.lineno - 1].strip() if e.lineno <= len(text.splitlines()) else ''
+        raise ValueError(f'{path}, line {e.lineno}: {e.msg} in "{line}". Template values must be replaced with'
+                         f' JSON values before the configuration can be loaded.') from None
+
+
+def _result(value=None, exception=None):
+    result = AsyncResult()
+    if exception is not None:
+        result.set_exception(exception)
+    else:
+        result.set(value)
+    return result
+
+
+class InMemoryBus(object):
+    """Stand-in for the VOLTTRON message bus which connects the nodes of a single process.
+
+    Published messages are queued and delivered in order by deliver(), so that, as on the platform, a publisher never
+    runs the callbacks of its subscribers in its own call stack.
+    """
+    def __init__(self, copy_messages: bool = True):
+        # Messages on the platform are serialized, so by default subscribers receive a copy rather than the object
+        # the publisher still holds.
+        self.copy_messages = copy_messages
+        self.published_count = 0
+        self.delivered_count = 0
+        self.error_count = 0
+
+        self._peers = OrderedDict()  # identity -> agent
+        self._subscriptions = []  # [(identity, prefix, callback)]
+        self._pending = deque()  # [(sender, topic, headers, message)]
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def add_peer(self, identity, agent):
+        self._peers[identity] = agent
+
+    def peers(self):
+        return list(self._peers)
+
+    def subscribe(self, identity, prefix, callback):
+        self._subscriptions.append((identity, prefix, callback))
+
+    def unsubscribe(self, identity, prefix=None, callback=None):
+        self._subscriptions = [(i, p, c) for i, p, c in self._subscriptions
+                               if not (i == identity and prefix in (None, p) and callback in (None, c))]
+
+    def publish(self, sender, topic, headers=None, message=None):
+        headers = headers if headers else {}
+        if self.copy_messages:
+            headers, message = json.loads(json.dumps([headers, message], default=json_encoder))
+        self._pending.append((sender, topic, headers, message))
+        self.published_count += 1
+
+    def deliver(self, limit: int = None) -> int:
+        """Deliver queued messages, including any published by the subscribers, until none remain."""
+        delivered = 0
+        while self._pending and (limit is None or delivered < limit):
+            sender, topic, headers, message = self._pending.popleft()
+            for identity, prefix, callback in list(self._subscriptions):
+                if topic.startswith(prefix):
+                    try:
+                        callback('pubsub', sender, '', topic, headers, message)
+                        self.delivered_count += 1
+                    except Exception as e:
+                        self.error_count += 1
+                        _log.exception(f'{identity} failed to handle message on {topic}: {e}')
+            delivered += 1
+        return delivered
+
+    def call(self, identity, method, *args, **kwargs):
+        peer = self._peers.get(identity)
+        if peer is None:
+            raise ValueError(f'No peer {identity} is connected to the in-process bus.')
+        return getattr(peer, method)(*args, **kwargs)
+
+
+class _InProcessPubSub(object):
+    def __init__(self, bus, identity):
+        self.bus = bus
+        self.identity = identity
+
+    def subscribe(self, peer, prefix, callback, bus='', all_platforms=False):
+        self.bus.subscribe(self.identity, prefix, callback)
+        return _result()
+
+    def unsubscribe(self, peer, prefix, callback, bus='', all_platforms=False):
+        self.bus.unsubscribe(self.identity, prefix, callback)
+        return _result()
+
+    def publish(self, peer, topic, headers=None, message=None, bus=''):
+        self.bus.publish(self.identity, topic, headers, message)
+        return _result()
+
+
+class _InProcessRPC(object):
+    def __init__(self, bus):
+        self.bus = bus
+
+    def call(self, peer, method, *args, **kwargs):
+        try:
+            return _result(self.bus.call(peer, method, *args, **kwargs))
+        except Exception as e:
+            return _result(exception=e)
+
+
+class _InProcessPeerList(object):
+    def __init__(self, bus):
+        self.bus = bus
+
+    def list(self):
+        return _result(self.bus.peers())
+
+
+class _InProcessConfigStore(object):
+    def __init__(self):
+        self._defaults = {}
+        self._configs = {}
+        self._callbacks = []  # [(callback, actions, pattern)]
+
+    def set_default(self, config_name, contents):
+        self._defaults[config_name] = contents
+
+    def subscribe(self, callback, actions=None, pattern='*'):
+        self._callbacks.append((callback, actions, pattern))
+
+    def get(self, config_name='config'):
+        return self._configs.get(config_name, self._defaults.get(config_name))
+
+    def set(self, config_name, contents):
+        action = 'UPDATE' if config_name in self._configs else 'NEW'
+        self._configs[config_name] = contents
+        for callback, actions, pattern in self._callbacks:
+            if (not actions or action in actions) and fnmatch.fnmatch(config_name, pattern):
+                callback(config_name, action, contents)
+
+
+class _InProcessVIP(object):
+    def __init__(self, bus, identity):
+        self.pubsub = _InProcessPubSub(bus, identity)
+        self.rpc = _InProcessRPC(bus)
+        self.peerlist = _InProcessPeerList(bus)
+        self.config = _InProcessConfigStore()
+
+
+class _InProcessCore(object):
+    def __init__(self, identity):
+        self.identity = identity
+
+    @staticmethod
+    def spawn(func, *args, **kwargs):
+        return gevent.spawn(func, *args, **kwargs)
+
+    @staticmethod
+    def spawn_later(seconds, func, *args, **kwargs):
+        return gevent.spawn_later(seconds, func, *args, **kwargs)
+
+    @staticmethod
+    def periodic(period, func, wait=0):
+        # Periodic work (flushes, snapshots, instrumentation) is housekeeping of the process rather than of the markets,
+        # so it runs on the wall clock, even when the market clock is discrete.
+        def loop():
+            if wait:
+                gevent.sleep(wait)
+            while True:
+                func()
+                gevent.sleep(period)
+        return gevent.spawn(loop)
+
+
+class InProcessTransactiveNode(TransactiveNodeAgent):
+    """TransactiveNodeAgent attached to an InMemoryBus instead of a VOLTTRON platform.
+
+    Its markets are not run by its own scheduler loop, but by the NetworkRunner which owns it.
+    """
+    def __init__(self, bus: InMemoryBus, identity: str, wake_event: Event = None):
+        self.bus = bus
+        self.identity = identity
+        self._network_wake_event = wake_event
+        super(InProcessTransactiveNode, self).__init__()
+
+    def _init_platform(self, *args, **kwargs):
+        self.vip = _InProcessVIP(self.bus, self.identity)
+        self.core = _InProcessCore(self.identity)
+
+    def state_machine_loop(self):
+        pass  # The NetworkRunner evaluates the markets of all nodes.
+
+    def wake_scheduler(self, reason: str = None):
+        super(InProcessTransactiveNode, self).wake_scheduler(reason)
+        if self._network_wake_event is not None:
+            self._network_wake_event.set()
+
+
+class NetworkRunner(object):
+    """Builds TransactiveNodes from their configurations and runs them together in this process.
+
+    By default, the nodes share a discrete event clock. Each cycle evaluates the markets of every node and delivers
+    the messages this produced until the network is quiet. The clock then advances to the earliest market deadline
+    of any node.
+    """
+    def __init__(self,
+                 simulation_start_time=None,
+                 simulation_one_hour_in_seconds: int = 3600,
+                 discrete_event: bool = True,
+                 settle_time: float = 0.0,
+                 max_sleep: float = 60.0,
+                 copy_messages: bool = True):
+        self.simulation_start_time = parser.parse(simulation_start_time) \
+            if isinstance(simulation_start_time, str) else simulation_start_time
+        self.simulation_one_hour_in_seconds = int(simulation_one_hour_in_seconds)
+        self.discrete_event = bool(discrete_event)
+        self.settle_time = float(settle_time)  # Wall seconds to let other greenlets run before each clock advance.
+        self.max_sleep = float(max_sleep)
+        self.bus = InMemoryBus(copy_messages)
+        self.nodes = OrderedDict()  # name -> InProcessTransactiveNode
+        self.cycle_count = 0
+
+        self._wake_event = Event()
+
+    def add_node(self, config: dict, name: str = None) -> InProcessTransactiveNode:
+        """Create and configure a node. The name defaults to the one in its configuration.
+
+        Nodes and their dependencies are addressed on the bus by name, so empty or duplicate names are rejected.
+        """
+        config = dict(config)
+        name = name if name else config.get('name')
+        if not name:
+            raise ValueError('Nodes in a network must have a name. Set "name" in the node configuration.')
+        if name in self.nodes:
+            raise ValueError(f'The network already has a node named {name}.')
+        for attribute, dependency_type in TransactiveNodeAgent.DEPENDENCY_TYPES:
+            if attribute not in TransactiveNodeAgent.REFERENCING_DEPENDENCIES:
+                continue
+            if any(not dependency.get('name') for dependency in config.get(attribute) or []):
+                raise ValueError(f'{dependency_type} of node {name} must have names. Template configurations must be'
+                                 f' filled in before they can be run.')
+        config['name'] = name
+        config['simulation'] = True
+        config['simulation_discrete_event'] = self.discrete_event
+        config['simulation_one_hour_in_seconds'] = self.simulation_one_hour_in_seconds
+        if self.simulation_start_time is not None:
+            config['simulation_start_time'] = self.simulation_start_time.isoformat()
+        node = InProcessTransactiveNode(self.bus, name, self._wake_event)
+        self.bus.add_peer(name, node)
+        self.nodes[name] = node
+        node.vip.config.set('config', config)
+        return node
+
+    def add_node_from_file(self, path: str, name: str = None) -> InProcessTransactiveNode:
+        """Create a node from a configuration file. The name defaults to the configured one."""
+        config = load_config(path)
+        try:
+            return self.add_node(config, name)
+        except ValueError as e:
+            raise ValueError(f'{path}: {e}') from None
+
+    def run(self, until=None, max_cycles: int = None):
+        """Run the network until the market time reaches until or max_cycles cycles have run."""
+        until = parser.parse(until) if isinstance(until, str) else until
+        cycles = 0
+        while self.nodes and (max_cycles is None or cycles < max_cycles):
+            if until is not None and Timer.get_cur_time() >= until:
+                break
+            self.run_once()
+            cycles += 1
+            if any(node.market_scheduler.woken for node in self.nodes.values()):
+                continue  # Messages at this instant may change the markets, so evaluate them again.
+            self.advance(until)
+
+    def run_once(self):
+        """Evaluate the markets of every node, then deliver messages until the network is quiet."""
+        self.cycle_count += 1
+        self._wake_event.clear()
+        for node in self.nodes.values():
+            node.market_scheduler.clear_wake()
+            node.market_scheduler.run_once(node)
+        self.settle()
+
+    def settle(self):
+        self.bus.deliver()
+        gevent.sleep(self.settle_time)
+        while self.bus.pending:
+            self.bus.deliver()
+            gevent.sleep(0)
+
+    def advance(self, until=None):
+        """Advance the discrete clock to the next deadline, or wait for it on the wall clock."""
+        if self.discrete_event:
+            deadlines = [node.market_scheduler.earliest_deadline() for node in self.nodes.values()]
+            deadlines = [d for d in deadlines if d is not None]
+            next_time = min(deadlines) if deadlines else Timer.get_cur_time() + timedelta(seconds=self.max_sleep)
+            SimulationTimer.advance_to(min(next_time, until) if until is not None else next_time)
+        else:
+            timeout = min(node.market_scheduler.seconds_until_next_deadline() for node in self.nodes.values())
+            self._wake_event.wait(timeout=timeout)
+
+    def stop(self):
+        for node in self.nodes.values():
+            node.onstop(self)
+        self.bus.deliver()
+
+    def get_metrics(self) -> dict:
+        return {
+            'cycle_count': self.cycle_count,
+            'market_time': Timer.get_cur_time(),
+            'published_count': self.bus.published_count,
+            'delivered_count': self.bus.delivered_count,
+            'error_count': self.bus.error_count,
+            'nodes': {name: {'cycle_count': node.market_scheduler.cycle_count,
+                             'wake_count': node.market_scheduler.wake_count,
+                             'markets': [m.name for m in node.markets]}
+                      for name, node in self.nodes.items()}
+        }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description='Run a transactive network in a single process.')
+    arg_parser.add_argument('configs', nargs='+', help='node configuration files')
+    arg_parser.add_argument('--start', help='simulation start time (default: from the first configuration)')
+    arg_parser.add_argument('--hours', type=float, default=24.0, help='hours of market time to run')
+    arg_parser.add_argument('--real-time', action='store_true',
+                            help='follow the (scaled) wall clock instead of a discrete event clock')
+    arg_parser.add_argument('--one-hour-in-seconds', type=int, default=3600,
+                            help='wall seconds per simulated hour with --real-time')
+    arg_parser.add_argument('--settle-time', type=float, default=0.0)
+    args = arg_parser.parse_args(argv)
+
+    configs = [(path, load_config(path)) for path in args.configs]
+    start = args.start if args.start else configs[0][1].get('simulation_start_time')
+    runner = NetworkRunner(start, args.one_hour_in_seconds, not args.real_time, args.settle_time)
+    for path, config in configs:
+        try:
+            runner.add_node(config)
+        except ValueError as e:
+            raise ValueError(f'{path}: {e}') from None
+    until = Timer.get_cur_time() + timedelta(hours=args.hours)
+    try:
+        runner.run(until)
+    finally:
+        runner.stop()
+    _log.info(f'Network run complete: {runner.get_metrics()}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
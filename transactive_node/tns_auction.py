@@ -4,19 +4,31 @@ from tent.market.auction import Auction
 from tent.utils.helpers import format_timestamp
 from tent.utils.timer import Timer
 
+from transactive_node.tns_publisher import RecordDeltaTracker
+from transactive_node.util.instrumentation import instrumented
+from transactive_node.util.price_statistics import invalidate_price_statistics
+from transactive_node.util.versioning import content_version
+
 from volttron.platform.messaging import headers as headers_mod
 
 
 class TNSAuction(Auction):
+    # Whether the transactive operation records of this market report the actual demand.
+    include_actual_records = False
+
     def __init__(self, *args, **kwargs):
         super(TNSAuction, self).__init__(*args, **kwargs)
 
+    @instrumented('auction.transition_from_active_to_negotiation')
     def transition_from_active_to_negotiation(self, my_transactive_node):
         super(TNSAuction, self).transition_from_active_to_negotiation(my_transactive_node)
+        self.prices_updated(my_transactive_node)
         # self.publish_records(my_transactive_node)
 
+    @instrumented('auction.while_in_negotiation')
     def while_in_negotiation(self, my_transactive_node):
         super(TNSAuction, self).while_in_negotiation(my_transactive_node)
+        self.prices_updated(my_transactive_node)
         #
         # headers = {headers_mod.DATE: format_timestamp(Timer.get_cur_time())}
         # for local_asset in my_transactive_node.localAssets:
@@ -33,16 +45,21 @@ class TNSAuction(Auction):
     #     super(TNSAuction, self).transition_from_inactive_to_active(my_transactive_node)
     #     self.publish_records(my_transactive_node)
 
+    @instrumented('auction.transition_from_negotiation_to_market_lead')
     def transition_from_negotiation_to_market_lead(self, my_transactive_node):
         super(TNSAuction, self).transition_from_negotiation_to_market_lead(my_transactive_node)
+        self.prices_updated(my_transactive_node)
         self.publish_records(my_transactive_node)
 
+    @instrumented('auction.transition_from_market_lead_to_delivery_lead')
     def transition_from_market_lead_to_delivery_lead(self, my_transactive_node):
         super(TNSAuction, self).transition_from_market_lead_to_delivery_lead(my_transactive_node)
         self.publish_records(my_transactive_node)
 
+    @instrumented('auction.transition_from_delivery_lead_to_delivery')
     def transition_from_delivery_lead_to_delivery(self, my_transactive_node):
         super(TNSAuction, self).transition_from_delivery_lead_to_delivery(my_transactive_node)
+        self.prices_updated(my_transactive_node)
         headers = {headers_mod.DATE: format_timestamp(Timer.get_cur_time())}
         scheduled_powers = defaultdict(dict)
         for entity in my_transactive_node.neighbors + my_transactive_node.localAssets:
@@ -57,31 +74,170 @@ class TNSAuction(Auction):
             'balanced_prices': {format_timestamp(p.timeInterval.startTime): p.value for p in self.marginalPrices},
             'schedule_powers': scheduled_powers
         }
-        my_transactive_node.vip.pubsub.publish(peer='pubsub',
-                                               topic=my_transactive_node.market_balanced_price_topic,
-                                               headers=headers,
-                                               message=msg)
+        # Each market publishes its own balanced prices to this topic, so these must not be coalesced.
+        my_transactive_node.publisher.publish(my_transactive_node.market_balanced_price_topic, msg, headers,
+                                              coalesce=False)
+        self.store_clearing(my_transactive_node)
         self.publish_records(my_transactive_node)
 
+    @instrumented('auction.transition_from_delivery_to_reconcile')
+    def transition_from_delivery_to_reconcile(self, my_transactive_node):
+        super(TNSAuction, self).transition_from_delivery_to_reconcile(my_transactive_node)
+        self.reconcile_meters(my_transactive_node)
+
+    def reconcile_meters(self, my_transactive_node):
+        """Average the readings of each meter over each delivered interval of this market.
+
+        The averages come from the rolling windows of the meters, so no historian is queried. They are published and
+        kept in the local record store, if there is one.
+        """
+        meter_averages = defaultdict(dict)
+        store = getattr(my_transactive_node, 'record_store', None)
+        now = Timer.get_cur_time()
+        for meter in my_transactive_node.meterPoints:
+            if not hasattr(meter, 'interval_average'):
+                continue
+            for time_interval in self.timeIntervals:
+                average = meter.interval_average(time_interval.startTime,
+                                                 time_interval.startTime + time_interval.duration)
+                if average is None:
+                    continue
+                meter_averages[format_timestamp(time_interval.startTime)][meter.name] = average
+                if store is not None:
+                    store.append('meter_interval_average', now, average, market=self.name,
+                                 interval_start=time_interval.startTime, entity=meter.name)
+        if meter_averages:
+            headers = {headers_mod.DATE: format_timestamp(now)}
+            topic = f'{my_transactive_node.db_topic}/{my_transactive_node.name}/meter_reconciliation'
+            msg = {'tnt_market_name': self.name, 'meter_averages': meter_averages}
+            # Each market publishes its own averages to this topic, so these must not be coalesced.
+            my_transactive_node.publisher.publish(topic, msg, headers, coalesce=False)
+
+    @instrumented('auction.transition_from_reconcile_to_expired')
     def transition_from_reconcile_to_expired(self, my_transactive_node):
         super(TNSAuction, self).transition_from_reconcile_to_expired(my_transactive_node)
+        self.prices_updated(my_transactive_node)
         self.publish_records(my_transactive_node)
 
+    def prices_updated(self, my_transactive_node):
+        """Invalidate the price statistics of this market and of the markets sharing its price model.
+
+        Called after the transitions in which the marginal prices or the price model of the market may change.
+        """
+        price_model = getattr(self, 'priceModel', None)
+        invalidate_price_statistics(m for m in my_transactive_node.markets
+                                    if m is self or (price_model is not None and m.priceModel is price_model))
+
+    @instrumented('auction.publish_records')
     def publish_records(self, my_transactive_node, upstream_agents=None, downstream_agents=None):
         headers = {headers_mod.DATE: format_timestamp(Timer.get_cur_time())}
+        transactive_operation = self.transactive_operation_record(my_transactive_node,
+                                                                  include_actual=self.include_actual_records)
+        topic = "{}/{}".format(my_transactive_node.transactive_operation_topic, self.marketSeriesName)
+        # Markets of a series share this topic, so only coalesce records from the same market. A delta record must
+        # not be replaced by a later one, since the later delta would not repeat its changes.
+        full_record = transactive_operation.get('snapshot', 'full') == 'full'
+        my_transactive_node.publisher.publish(topic, transactive_operation, headers, coalesce=full_record,
+                                              coalesce_key=self.name)
+        self.store_record(my_transactive_node, transactive_operation)
+#        _log.debug("AUCTION: Publishing on market topic: {} and info: {}".format(topic, transactive_operation))
+
+    def store_clearing(self, my_transactive_node):
+        """Keep the cleared prices and scheduled powers of this market in the local record store, if there is one."""
+        store = getattr(my_transactive_node, 'record_store', None)
+        if store is None:
+            return
+        now = Timer.get_cur_time()
+        for p in self.marginalPrices:
+            store.append('cleared_price', now, p.value, market=self.name, interval_start=p.timeInterval.startTime)
+        for entity in my_transactive_node.neighbors + my_transactive_node.localAssets:
+            for p in entity.scheduledPowers:
+                if p.timeInterval.market is self:
+                    store.append('scheduled_power', now, p.value, market=self.name,
+                                 interval_start=p.timeInterval.startTime, entity=entity.name)
+
+    def store_record(self, my_transactive_node, transactive_operation):
+        store = getattr(my_transactive_node, 'record_store', None)
+        if store is not None:
+            store.append('transactive_operation', Timer.get_cur_time(), market=self.name,
+                         entity=self.marketSeriesName, payload=transactive_operation)
+
+    def transactive_operation_record(self, my_transactive_node, include_actual=False):
+        """Build the transactive operation record of this market.
+
+        If the node publishes transactive operation deltas, only prices, neighbors and assets which changed since the
+        last record of this market are included, except in the periodic full snapshots. Neighbor signals and asset
+        vertices which track their versions are only serialized when they have changed. Entries of the last record
+        which no longer exist are listed under 'removed'.
+        """
+        tracker = self._get_record_tracker(my_transactive_node)
+        if tracker is not None:
+            tracker.start_record()
+
+        def changed(key, content, serialize):
+            """Return the serialized content if it changed since the last record, otherwise None."""
+            if tracker is None:
+                return serialize()
+            version = content_version(content)
+            if version is not None:
+                return serialize() if tracker.changed(key, version) else None
+            value = serialize()
+            return value if tracker.changed(key, value) else None
+
         transactive_operation = dict()
         transactive_operation['prices'] = list()
         transactive_operation['demand'] = dict()
         transactive_operation['demand']['bid'] = dict()
 
-        #        _log.debug("AUCTION: BEFORE: info: {}".format(transactive_operation))
-        for idx, p in enumerate(self.marginalPrices):
-            transactive_operation['prices'].append((format_timestamp(p.timeInterval.startTime), p.value))
+        for p in self.marginalPrices:
+            time_stamp = format_timestamp(p.timeInterval.startTime)
+            if tracker is None or tracker.changed(('prices', time_stamp), p.value):
+                transactive_operation['prices'].append((time_stamp, p.value))
+
+        # Only neighbors and assets with a change are serialized, and each of them only once.
+        entity_dicts = {}
+
+        def get_dict(entity):
+            if entity.name not in entity_dicts:
+                entity_dicts[entity.name] = entity.get_dict()
+            return entity_dicts[entity.name]
 
         for neighbor in my_transactive_node.neighbors:
-            transactive_operation['demand']['bid'][neighbor.name] = neighbor.get_dict()['sent_signal']
+            sent_signal = changed(('bid', neighbor.name), getattr(neighbor, 'sentSignal', None),
+                                  lambda: get_dict(neighbor)['sent_signal'])
+            if sent_signal is not None:
+                transactive_operation['demand']['bid'][neighbor.name] = sent_signal
 
-        topic = "{}/{}".format(my_transactive_node.transactive_operation_topic, self.marketSeriesName)
-        my_transactive_node.vip.pubsub.publish(peer='pubsub', topic=topic,
-                                               headers=headers, message=transactive_operation)
-#        _log.debug("AUCTION: Publishing on market topic: {} and info: {}".format(topic, transactive_operation))
+        if include_actual:
+            transactive_operation['demand']['actual'] = dict()
+            transactive_operation['demand']['actual']['neighbor'] = dict()
+            transactive_operation['demand']['actual']['assets'] = dict()
+            for neighbor in my_transactive_node.neighbors:
+                received_signal = changed(('neighbor', neighbor.name), getattr(neighbor, 'receivedSignal', None),
+                                          lambda: get_dict(neighbor)['received_signal'])
+                if received_signal is not None:
+                    transactive_operation['demand']['actual']['neighbor'][neighbor.name] = received_signal
+            for asset in my_transactive_node.localAssets:
+                vertices = changed(('assets', asset.name), getattr(asset, 'activeVertices', None),
+                                   lambda: get_dict(asset)['vertices'])
+                if vertices is not None:
+                    transactive_operation['demand']['actual']['assets'][asset.name] = vertices
+
+        if tracker is not None:
+            transactive_operation['snapshot'] = 'full' if tracker.full else 'delta'
+            transactive_operation['sequence'] = tracker.sequence
+            removed = defaultdict(list)
+            for kind, name in tracker.removed():
+                removed[kind].append(name)
+            if removed and not tracker.full:
+                transactive_operation['removed'] = dict(removed)
+        return transactive_operation
+
+    def _get_record_tracker(self, my_transactive_node):
+        if not getattr(my_transactive_node, 'transactive_operation_deltas', False):
+            return None
+        tracker = getattr(self, '_record_tracker', None)
+        if tracker is None:
+            tracker = self._record_tracker = RecordDeltaTracker(
+                getattr(my_transactive_node, 'transactive_operation_full_interval', 10))
+        return tracker
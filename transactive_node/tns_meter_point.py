@@ -1,20 +1,166 @@
 import logging
+import numpy as np
+
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
 
 from volttron.platform.agent import utils
 
 from tent.meter_point.push_meter_point import PushMeterPoint
 from tent.utils.helpers import setup_logging, validate_bool
+from tent.utils.timer import Timer
+
+from transactive_node.util.instrumentation import instrumented
 
 setup_logging()
 _log = logging.getLogger(__name__)
 
 
+@lru_cache(maxsize=256)
+def parse_date_header(date_header: str) -> datetime:
+    """Parse a message Date header.
+
+    Headers are normally in the ISO 8601 format VOLTTRON writes, which the standard library parses directly. Meters
+    on the same device topic receive the same header, so recent results are cached.
+    """
+    try:
+        return datetime.fromisoformat(date_header)
+    except ValueError:
+        return utils.parse_timestamp_string(date_header)
+
+
+class MeterRegistry(list):
+    """List of meter points indexed by hook and topic.
+
+    This is the plain list the node has always held, but lookups by hook or topic do not scan it. The indexes are
+    rebuilt on the first lookup after the list changes.
+    """
+    def __init__(self, meters=()):
+        super(MeterRegistry, self).__init__(meters)
+        self._by_hook = None
+        self._by_topic = None
+
+    def _invalidate(self):
+        self._by_hook = None
+        self._by_topic = None
+
+    def _index(self):
+        self._by_hook = defaultdict(list)
+        self._by_topic = defaultdict(list)
+        for meter in self:
+            self._by_hook[getattr(meter, 'hook', None)].append(meter)
+            self._by_topic[getattr(meter, 'topic', None)].append(meter)
+
+    def by_hook(self, hook):
+        if self._by_hook is None:
+            self._index()
+        return self._by_hook.get(hook, [])
+
+    def by_topic(self, topic):
+        if self._by_topic is None:
+            self._index()
+        return self._by_topic.get(topic, [])
+
+    def _mutator(name):
+        method = getattr(list, name)
+
+        def mutate(self, *args, **kwargs):
+            self._invalidate()
+            return method(self, *args, **kwargs)
+        mutate.__name__ = name
+        return mutate
+
+    append = _mutator('append')
+    extend = _mutator('extend')
+    insert = _mutator('insert')
+    remove = _mutator('remove')
+    pop = _mutator('pop')
+    clear = _mutator('clear')
+    sort = _mutator('sort')
+    reverse = _mutator('reverse')
+    __setitem__ = _mutator('__setitem__')
+    __delitem__ = _mutator('__delitem__')
+    __iadd__ = _mutator('__iadd__')
+    __imul__ = _mutator('__imul__')
+    del _mutator
+
+
+class MeterWindow(object):
+    """Rolling window of meter readings with the running integral of the readings over time.
+
+    Readings hold until the next one, so the average over any interval is the difference of the integral at its ends
+    divided by its length. This needs two bisections and constant work, however many readings the interval holds.
+    """
+    def __init__(self, capacity: int = 360):
+        self.capacity = max(int(capacity), 2)
+        # Each reading is written twice so the window is always one contiguous slice (see RingBufferSeries).
+        self._times = np.full(2 * self.capacity, np.nan)
+        self._values = np.full(2 * self.capacity, np.nan)
+        self._integrals = np.full(2 * self.capacity, np.nan)  # Integral of the readings up to each reading time.
+        self._next = 0
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _slice(self):
+        end = self._next + self.capacity
+        return slice(end - self.size, end)
+
+    def append(self, time, value: float):
+        t = time.timestamp() if isinstance(time, datetime) else float(time)
+        last = self._next + self.capacity - 1
+        if self.size:
+            if t < self._times[last]:
+                return  # Readings must arrive in time order.
+            integral = self._integrals[last] + self._values[last] * (t - self._times[last])
+        else:
+            integral = 0.0
+        i = self._next
+        self._times[i] = self._times[i + self.capacity] = t
+        self._values[i] = self._values[i + self.capacity] = value
+        self._integrals[i] = self._integrals[i + self.capacity] = integral
+        self._next = (i + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def latest(self):
+        if not self.size:
+            return None
+        return float(self._values[self._next + self.capacity - 1])
+
+    def latest_time(self):
+        if not self.size:
+            return None
+        return float(self._times[self._next + self.capacity - 1])
+
+    def _integral_at(self, times, values, integrals, t):
+        k = int(np.searchsorted(times, t, side='right')) - 1
+        return integrals[k] + values[k] * (t - times[k])
+
+    def interval_average(self, start, end):
+        """Return the time-weighted average reading from start to end, or None if the window does not cover start."""
+        start = start.timestamp() if isinstance(start, datetime) else float(start)
+        end = end.timestamp() if isinstance(end, datetime) else float(end)
+        window = self._slice()
+        times, values, integrals = self._times[window], self._values[window], self._integrals[window]
+        if not self.size or start < times[0] or end <= start:
+            return None
+        return float((self._integral_at(times, values, integrals, end)
+                      - self._integral_at(times, values, integrals, start)) / (end - start))
+
+
 class TNSMeterPoint(PushMeterPoint):
     def __init__(self, topic, point_name, external_platform, hook=None, *args, **kwargs):
         self.hook = str(hook)
         self.topic = str(topic)
         self.point_name = str(point_name)
         self.external_platform = validate_bool(external_platform, 'external_platform')
+        # Keep the readings of the last max_buffer_seconds for interval averages at reconciliation.
+        max_buffer_seconds = float(kwargs.get('max_buffer_seconds', 3600))
+        data_period_seconds = float(kwargs.get('data_period_seconds', 10)) or 1.0
+        self.window = MeterWindow(int(max_buffer_seconds / data_period_seconds) + 1)
+        self.window_scale_factor = float(kwargs.get('scale_factor', 1.0))
         PushMeterPoint.__init__(self, *args, **kwargs)
 
     # Implements method from PushMeterPoint.
@@ -23,24 +169,47 @@ class TNSMeterPoint(PushMeterPoint):
             all_platforms = {'all_platforms': True} if self.external_platform else {}
             self.tn().vip.pubsub.subscribe('pubsub', self.topic, self.on_topic, **all_platforms)
 
+    @instrumented('meter_point.on_topic')
     def on_topic(self, peer, sender, bus, topic, headers, message):
         if self.tn and self.tn() and not self.tn().simulation:
             date_header = headers.get('Date')
-            d_time = utils.parse_timestamp_string(date_header) if date_header is not None else None
+            d_time = parse_date_header(date_header) if date_header is not None else None
         else:
             d_time = None
         datum = message[0].get(self.point_name)
         if datum:
             self.set_meter_value(datum, d_time)
+            try:
+                self.window.append(d_time if d_time is not None else Timer.get_cur_time(),
+                                   float(datum) * self.window_scale_factor)
+            except (TypeError, ValueError):
+                pass
+            else:
+                self.store()
+            if self.tn and hasattr(self.tn(), 'wake_scheduler'):
+                self.tn().wake_scheduler(f'meter update for {self.name}')
         else:
             _log.warning('Received bad message from {} on topic {}, bus {} from peer {}. Message: {} Headers: {}'
                          .format(sender, topic, bus, peer, message, headers))
 
     def store(self):
-        _log.warning('MeterPoint.store() is not implemented for VOLTTRON. Use historian.')
+        """Keep the latest reading in the local record store of the node, if it has one.
+
+        Recent readings are also kept in self.window as they arrive.
+        """
+        tn = self.tn() if self.tn else None
+        store = getattr(tn, 'record_store', None)
+        if store is not None and self.window.size:
+            store.append('meter', self.window.latest_time(), self.window.latest(), entity=self.name)
+
+    def interval_average(self, start, end):
+        """Return the time-weighted average of the scaled readings from start to end, if they are in the window."""
+        return self.window.interval_average(start, end)
 
     @classmethod
     def get_meters_by_hook(cls, meter_list, hook):
+        if isinstance(meter_list, MeterRegistry):
+            return [m for m in meter_list.by_hook(hook) if isinstance(m, cls)]
         return [m for m in meter_list if m.hook == hook and isinstance(m, cls)]
 
     @classmethod
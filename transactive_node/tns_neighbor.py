@@ -1,3 +1,5 @@
+import gevent
+import hashlib
 import json
 import logging
 
@@ -5,9 +7,13 @@ from volttron.platform.agent import utils
 from volttron.platform.messaging import headers as headers_mod
 
 from tent.neighbor import Neighbor
-from tent.utils.helpers import format_timestamp, json_encoder
+from tent.utils.helpers import format_timestamp
 from tent.utils.timer import Timer
 
+from transactive_node.util.instrumentation import instrumented
+from transactive_node.util.versioning import VersionedList
+from transactive_node.util.wire_encoding import JSON, pack, supported_encodings, to_wire, unpack
+
 
 utils.setup_logging()
 _log = logging.getLogger(__name__)
@@ -17,8 +23,27 @@ class TNSNeighbor(Neighbor):
     def __init__(self,
                  subscription_topic_postfix,
                  publication_topic_postfix,
+                 signal_encoding: str = JSON,
+                 deduplicate_signals: bool = True,
                  *args, **kwargs):
         super(TNSNeighbor, self).__init__(*args, **kwargs)
+        # Encoding preferred for signals sent to this neighbor. It is only used once the neighbor has advertised
+        # that it accepts it; until then signals are sent as plain JSON.
+        self.signal_encoding = str(signal_encoding) if signal_encoding else JSON
+        if self.signal_encoding not in supported_encodings():
+            _log.warning(f'Signal encoding {self.signal_encoding} is not available for neighbor {self.name},'
+                         f' using {JSON}.')
+            self.signal_encoding = JSON
+        self.neighbor_accepted_encodings = [JSON]
+        # Signals wait in a latest-wins mailbox, so a burst of signals is processed once, with the newest curves.
+        self.deduplicate_signals = bool(deduplicate_signals)
+        self._pending_signal = None
+        self._signal_greenlet = None
+        self._last_signal_hash = None
+        self.signals_received = 0
+        self.signals_superseded = 0
+        self.signals_deduplicated = 0
+        self.signals_failed = 0
 
         tn = self.tn()
         subscription_topic_postfix = str(subscription_topic_postfix)
@@ -36,30 +61,100 @@ class TNSNeighbor(Neighbor):
         _log.info(f'{tn.name} {self.name} neighbor subscribed to {self.subscribeTopic}')
         _log.debug(f'{tn.name} {self.name} neighbor get_dict: {self.get_dict()}')
 
+    # The signals are kept in VersionedLists, so that transactive operation records can tell whether they changed
+    # without serializing them.
+    @property
+    def sentSignal(self) -> VersionedList:
+        return self._sent_signal
+
+    @sentSignal.setter
+    def sentSignal(self, value):
+        self._sent_signal = value if isinstance(value, VersionedList) else VersionedList(value if value else [])
+
+    @property
+    def receivedSignal(self) -> VersionedList:
+        return self._received_signal
+
+    @receivedSignal.setter
+    def receivedSignal(self, value):
+        # The received signals are cleared for a new market, after which the same curves must be processed again.
+        if not value:
+            self._last_signal_hash = None
+        self._received_signal = value if isinstance(value, VersionedList) else VersionedList(value if value else [])
+
+    @instrumented('neighbor.new_transactive_signal')
     def new_transactive_signal(self, peer, sender, bus, topic, headers, message):
-        tn = self.tn()
-        _log.debug(f'At {Timer.get_cur_time()}, {tn.name}  receives new transactive signal from {self.name}'
-                   f' neighbor -- peer: {peer}, sender: {sender}, bus: {bus}, topic: {topic}, headers: {headers},'
-                   f' message: {message}')
+        if _log.isEnabledFor(logging.DEBUG):
+            _log.debug(f'At {Timer.get_cur_time()}, {self.tn().name}  receives new transactive signal from {self.name}'
+                       f' neighbor -- peer: {peer}, sender: {sender}, bus: {bus}, topic: {topic}, headers: {headers},'
+                       f' message: {message}')
+        self.neighbor_accepted_encodings = message.get('accept_encoding', [JSON])
+        self.signals_received += 1
+        if self._pending_signal is not None:
+            self.signals_superseded += 1
+        self._pending_signal = message
+        if self._signal_greenlet is None or self._signal_greenlet.dead:
+            self._signal_greenlet = gevent.spawn(self.process_signals)
+
+    @staticmethod
+    def _signal_hash(message) -> bytes:
         curves = message['curves']
-        # TODO: These properties may not be needed anymore unless they are necessary for the consensus mkt.
-        # source = message['source']
-        # start_of_cycle = message['start_of_cycle']
-        # fail_to_converged = message['fail_to_converged']
+        # Packed (e.g., msgpack) curves are already a string. JSON curves arrive as lists.
+        content = curves if isinstance(curves, str) else json.dumps(curves, sort_keys=True, separators=(',', ':'))
+        return hashlib.blake2b(content.encode(), digest_size=16).digest()
+
+    @instrumented('neighbor.process_signals')
+    def process_signals(self):
+        """Process the newest pending signal, unless its curves are the same as those of the last one."""
+        tn = self.tn()
+        while self._pending_signal is not None and tn is not None:
+            message, self._pending_signal = self._pending_signal, None
+            signal_hash = None
+            try:
+                if self.deduplicate_signals:
+                    signal_hash = self._signal_hash(message)
+                    if signal_hash == self._last_signal_hash:
+                        self.signals_deduplicated += 1
+                        continue
+                curves = unpack(message['curves'], message.get('encoding', JSON))
+                # TODO: These properties may not be needed anymore unless they are necessary for the consensus mkt.
+                # source = message['source']
+                # start_of_cycle = message['start_of_cycle']
+                # fail_to_converged = message['fail_to_converged']
+
+                self.receive_transactive_signal(tn, curves)
+            except Exception as e:
+                # The signal is not remembered, so the same curves are processed again if they are resent.
+                self.signals_failed += 1
+                _log.exception(f'{tn.name} could not process transactive signal from {self.name}: {e!r}')
+                continue
+            self._last_signal_hash = signal_hash
+            if hasattr(tn, 'wake_scheduler'):
+                tn.wake_scheduler(f'transactive signal from {self.name}')
 
-        self.receive_transactive_signal(tn, curves)
+    def get_signal_metrics(self) -> dict:
+        return {
+            'received': self.signals_received,
+            'superseded': self.signals_superseded,
+            'deduplicated': self.signals_deduplicated,
+            'failed': self.signals_failed,
+            'pending': self._pending_signal is not None
+        }
 
+    @instrumented('neighbor.publish_signal')
     def publish_signal(self, transactive_records):
         _log.debug('IN TNS_NEIGHBOR.PUBLISH_SIGNAL.')
         _log.debug(f'SELF.PUBLISH_TOPIC IS: {self.publishTopic}')
-        msg = json.dumps(transactive_records, default=json_encoder)
-        msg = json.loads(msg)
+        msg = to_wire(transactive_records)
         tn = self.tn()
         if tn:
             if self.publishTopic:
+                encoding = self.signal_encoding if self.signal_encoding in self.neighbor_accepted_encodings else JSON
                 tn.vip.pubsub.publish(peer='pubsub',
                                       topic=self.publishTopic,
-                                      message={'curves': msg,
+                                      message={'curves': pack(msg, encoding),
+                                               'encoding': encoding,
+                                               'accept_encoding': supported_encodings(),
                                                # TODO: These properties are probably not necessary unless
                                                #  needed for consensus market.
                                                # 'source': self.location,
@@ -1,5 +1,5 @@
 ###########################################################################################
-# This file is a stub for eventually extracting publication stuff from other classes.
+# The Publisher extracts publication stuff from other classes.
 # This would potentially allow far fewer subclasses to be necessary for other dependencies.
 # The publisher class could be moved into the library and do something not specific to
 # VOLTTRON, while the TNSPublisher would remain in the TransactiveNodeAgent.
@@ -7,16 +7,228 @@
 #  the base class?
 ###########################################################################################
 
+import abc
+import gevent
+import logging
+import time
+import weakref
 
-class Publisher(object):
-    def __init__(self, *args, **kwargs):
+from collections import deque, OrderedDict
+from gevent.event import Event
+
+from tent.utils.log import setup_logging
+
+from transactive_node.util.wire_encoding import to_wire
+
+setup_logging()
+_log = logging.getLogger(__name__)
+
+
+class Publisher(abc.ABC):
+    """Queues records per topic and sends them in batches.
+
+    Records are converted to plain (JSON) types when they are queued, so a record holds the state at the time it was
+    published, even if the objects it was built from change before it is sent. A record published to a topic which
+    already has an unsent record with the same coalesce key replaces that record in its place in the queue, so a burst
+    of updates results in a single message carrying the latest state. The coalesce key defaults to the topic. Records
+    which must all be delivered should be published with coalesce=False.
+
+    At most max_queue_depth records are held. Beyond that, the oldest record of the topic (or, if the topic has none,
+    of the oldest topic) is dropped.
+    """
+    def __init__(self, batch_size: int = 100, coalesce_window: float = 0.5, max_queue_depth: int = 10000,
+                 *args, **kwargs):
+        self.batch_size = int(batch_size)
+        self.coalesce_window = float(coalesce_window)  # Seconds to hold records for coalescing before flushing.
+        self.max_queue_depth = max(int(max_queue_depth), 1)
+
+        self._queues = OrderedDict()  # topic -> deque([[headers, message, enqueue_time, coalesce_key]])
+        self._coalesce_index = {}  # topic -> {coalesce key: queued entry}
+        self._queue_depth = 0
+        self.published_count = 0
+        self.coalesced_count = 0
+        self.dropped_count = 0
+        self._dropped_since_flush = 0
+        self.error_count = 0
+        self.flush_count = 0
+        self.last_flush_duration = 0.0
+        self.max_flush_duration = 0.0
+        self.last_queue_latency = 0.0
+        self.max_queue_latency = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue_depth
+
+    def publish(self, topic: str, message, headers: dict = None, coalesce: bool = True, coalesce_key=None):
+        """Queue a record for publication to the topic."""
+        message = to_wire(message)
+        headers = dict(headers) if headers else None
+        key = (topic if coalesce_key is None else coalesce_key) if coalesce else None
+        if key is not None:
+            entry = self._coalesce_index.get(topic, {}).get(key)
+            if entry is not None:
+                entry[0] = headers
+                entry[1] = message
+                self.coalesced_count += 1
+                return
+        if self._queue_depth >= self.max_queue_depth:
+            self._drop_oldest(topic)
+        queue = self._queues.get(topic)
+        if queue is None:
+            queue = self._queues[topic] = deque()
+        entry = [headers, message, time.monotonic(), key]
+        queue.append(entry)
+        self._queue_depth += 1
+        if key is not None:
+            self._coalesce_index.setdefault(topic, {})[key] = entry
+
+    def _pop(self, topic: str) -> list:
+        queue = self._queues[topic]
+        entry = queue.popleft()
+        if not queue:
+            del self._queues[topic]
+        self._queue_depth -= 1
+        if entry[3] is not None:
+            index = self._coalesce_index.get(topic)
+            if index is not None and index.get(entry[3]) is entry:
+                del index[entry[3]]
+                if not index:
+                    del self._coalesce_index[topic]
+        return entry
+
+    def _drop_oldest(self, topic: str):
+        self._pop(topic if topic in self._queues else next(iter(self._queues)))
+        self.dropped_count += 1
+        self._dropped_since_flush += 1
+
+    def flush(self, limit: int = None) -> int:
+        """Send up to limit queued records, taking them from the topics in turn. Returns the number sent."""
+        if self._dropped_since_flush:
+            _log.warning(f'Dropped {self._dropped_since_flush} records, since more than {self.max_queue_depth} were'
+                         f' waiting to be published.')
+            self._dropped_since_flush = 0
+        limit = self.batch_size if limit is None else limit
+        start = time.monotonic()
+        sent = 0
+        while self._queues and sent < limit:
+            for topic in list(self._queues):
+                headers, message, enqueue_time, _ = self._pop(topic)
+                try:
+                    self._send(topic, headers, message)
+                    self.published_count += 1
+                except Exception as e:
+                    self.error_count += 1
+                    _log.warning(f'Failed to publish to {topic}: {e}')
+                latency = time.monotonic() - enqueue_time
+                self.last_queue_latency = latency
+                self.max_queue_latency = max(self.max_queue_latency, latency)
+                sent += 1
+                if sent >= limit:
+                    break
+        if sent:
+            self.flush_count += 1
+            self.last_flush_duration = time.monotonic() - start
+            self.max_flush_duration = max(self.max_flush_duration, self.last_flush_duration)
+        return sent
+
+    def flush_all(self):
+        while self._queues:
+            self.flush()
+
+    def get_metrics(self) -> dict:
+        return {
+            'queue_depth': self.queue_depth,
+            'published_count': self.published_count,
+            'coalesced_count': self.coalesced_count,
+            'dropped_count': self.dropped_count,
+            'error_count': self.error_count,
+            'flush_count': self.flush_count,
+            'last_flush_duration': self.last_flush_duration,
+            'max_flush_duration': self.max_flush_duration,
+            'last_queue_latency': self.last_queue_latency,
+            'max_queue_latency': self.max_queue_latency
+        }
+
+    @abc.abstractmethod
+    def _send(self, topic, headers, message):
         pass
 
 
 class TNSPublisher(Publisher):
-    def __init__(self, *args, **kwargs):
+    """Publisher which asynchronously flushes its queues to the VOLTTRON message bus from a greenlet."""
+    def __init__(self, transactive_node, *args, **kwargs):
         super(TNSPublisher, self).__init__(*args, **kwargs)
-        pass
+        self.tn = weakref.ref(transactive_node)
+        self._greenlet = None
+        self._pending = Event()
 
-    def publish(self):
-        pass
+    @property
+    def running(self):
+        return self._greenlet is not None and not self._greenlet.dead
+
+    def start(self):
+        if not self.running:
+            self._greenlet = gevent.spawn(self._run)
+
+    def stop(self, flush: bool = True):
+        if self.running:
+            self._greenlet.kill()
+        self._greenlet = None
+        if flush:
+            self.flush_all()
+
+    def publish(self, topic: str, message, headers: dict = None, coalesce: bool = True, coalesce_key=None):
+        super(TNSPublisher, self).publish(topic, message, headers, coalesce, coalesce_key)
+        self._pending.set()
+
+    def _run(self):
+        while True:
+            self._pending.wait()
+            # Hold the records briefly so that repeated publishes to a topic can be coalesced.
+            gevent.sleep(self.coalesce_window)
+            self._pending.clear()
+            while self._queues:
+                self.flush()
+                gevent.sleep(0)  # Yield between batches so a large backlog does not starve the market scheduler.
+
+    def _send(self, topic, headers, message):
+        tn = self.tn()
+        if tn is not None:
+            tn.vip.pubsub.publish(peer='pubsub', topic=topic, headers=headers if headers else {}, message=message)
+
+
+class RecordDeltaTracker(object):
+    """Tracks the last published value or version of each entry of a record so that only changed entries need to be
+    published.
+
+    Every full_record_interval records, all entries are reported as changed so consumers can resynchronize. Entries of
+    the last record which are missing from the current one are reported as removed.
+    """
+    def __init__(self, full_record_interval: int = 10):
+        self.full_record_interval = max(int(full_record_interval), 1)
+        self.sequence = 0
+        self.full = True
+        self._last = {}
+        self._seen = set()
+
+    def start_record(self) -> bool:
+        """Begin a new record. Returns True if it should be a full snapshot."""
+        self.full = self.sequence % self.full_record_interval == 0
+        self.sequence += 1
+        self._seen = set()
+        return self.full
+
+    def changed(self, key, value) -> bool:
+        self._seen.add(key)
+        if not self.full and key in self._last and self._last[key] == value:
+            return False
+        self._last[key] = value
+        return True
+
+    def removed(self) -> list:
+        """Return the keys of the entries which were not in the current record, and forget them."""
+        removed = [key for key in self._last if key not in self._seen]
+        for key in removed:
+            del self._last[key]
+        return removed
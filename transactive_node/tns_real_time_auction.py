@@ -8,6 +8,7 @@ from tent.utils.log import setup_logging
 from tent.utils.timer import Timer
 
 from transactive_node.tns_auction import TNSAuction
+from transactive_node.util.instrumentation import instrumented
 
 from volttron.platform.messaging import headers as headers_mod
 
@@ -16,11 +17,16 @@ _log = logging.getLogger(__name__)
 
 
 class TNSRealTimeAuction(RealTimeAuction, TNSAuction):
+    # Real-time records also report the actual demand of the neighbors and assets.
+    include_actual_records = True
+
     def __init__(self, *args, **kwargs):
         super(TNSRealTimeAuction, self).__init__(*args, **kwargs)
 
+    @instrumented('real_time_auction.transition_from_delivery_lead_to_delivery')
     def transition_from_delivery_lead_to_delivery(self, my_transactive_node):
         RealTimeAuction.transition_from_delivery_lead_to_delivery(self, my_transactive_node)
+        self.prices_updated(my_transactive_node)
         headers = {headers_mod.DATE: format_timestamp(Timer.get_cur_time())}
         scheduled_powers = defaultdict(dict)
         for entity in my_transactive_node.neighbors + my_transactive_node.localAssets:
@@ -32,37 +38,9 @@ class TNSRealTimeAuction(RealTimeAuction, TNSAuction):
             'balanced_prices': {format_timestamp(p.timeInterval.startTime): p.value for p in self.marginalPrices},
             'schedule_powers': scheduled_powers
         }
-        my_transactive_node.vip.pubsub.publish(peer='pubsub',
-                                               topic=my_transactive_node.market_balanced_price_topic,
-                                               headers=headers,
-                                               message=msg)
+        # Each market publishes its own balanced prices to this topic, so these must not be coalesced.
+        my_transactive_node.publisher.publish(my_transactive_node.market_balanced_price_topic, msg, headers,
+                                              coalesce=False)
+        self.store_clearing(my_transactive_node)
         self.publish_records(my_transactive_node)
 
-    def publish_records(self, my_transactive_node, upstream_agents=None, downstream_agents=None):
-        headers = {headers_mod.DATE: format_timestamp(Timer.get_cur_time())}
-        transactive_operation = dict()
-        transactive_operation['prices'] = list()
-        transactive_operation['demand'] = dict()
-        transactive_operation['demand']['bid'] = dict()
-
-        #        _log.debug("AUCTION: BEFORE: info: {}".format(transactive_operation))
-        for idx, p in enumerate(self.marginalPrices):
-            transactive_operation['prices'].append((format_timestamp(p.timeInterval.startTime), p.value))
-
-        for neighbor in my_transactive_node.neighbors:
-            transactive_operation['demand']['bid'][neighbor.name] = neighbor.get_dict()['sent_signal']
-
-        transactive_operation['demand']['actual'] = dict()
-        transactive_operation['demand']['actual']['neighbor'] = dict()
-        transactive_operation['demand']['actual']['assets'] = dict()
-
-        for neighbor in my_transactive_node.neighbors:
-            transactive_operation['demand']['actual']['neighbor'][neighbor.name] = \
-                neighbor.get_dict()['received_signal']
-        for asset in my_transactive_node.localAssets:
-            transactive_operation['demand']['actual']['assets'][asset.name] = asset.get_dict()['vertices']
-
-        topic = "{}/{}".format(my_transactive_node.transactive_operation_topic, self.marketSeriesName)
-        my_transactive_node.vip.pubsub.publish(peer='pubsub', topic=topic,
-                                               headers=headers, message=transactive_operation)
-#        _log.debug("AUCTION: Publishing on market topic: {} and info: {}".format(topic, transactive_operation))
@@ -0,0 +1,147 @@
+import functools
+import logging
+import time
+
+from bisect import bisect_left
+
+from tent.utils.log import setup_logging
+
+setup_logging()
+_log = logging.getLogger(__name__)
+
+
+class LatencyHistogram(object):
+    """Fixed bucket histogram of latencies in seconds.
+
+    Bucket bounds double from 10 microseconds to about three minutes, so recording is a single bisection and the
+    percentiles are accurate to within a factor of two.
+    """
+    BOUNDS = tuple(1e-5 * 2 ** i for i in range(25))
+
+    def __init__(self):
+        self.buckets = [0] * (len(self.BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.buckets[bisect_left(self.BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q: float):
+        """Return the upper bound of the bucket containing the q-th percentile (0 - 100)."""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for i, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank and bucket_count:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return self.max
+
+    def get_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p90': self.percentile(90),
+            'p99': self.percentile(99),
+            'buckets': {f'{bound:.6g}': n for bound, n in zip(self.BOUNDS + (float('inf'),), self.buckets) if n}
+        }
+
+
+class Instrumentation(object):
+    """Per-operation call counters and latency histograms of a transactive node.
+
+    Every call is counted, but only one in sample_every calls of each operation is timed, which keeps the overhead
+    low enough to leave on in production.
+    """
+    def __init__(self, enabled: bool = True, sample_every: int = 1):
+        self.enabled = enabled
+        self.sample_every = max(int(sample_every), 1)
+        self.counters = {}
+        self.errors = {}
+        self.histograms = {}
+
+    def call(self, name: str, func, *args, **kwargs):
+        """Call func, counting the call and timing it if it is sampled."""
+        if not self.enabled:
+            return func(*args, **kwargs)
+        count = self.counters[name] = self.counters.get(name, 0) + 1
+        if count % self.sample_every:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            self.errors[name] = self.errors.get(name, 0) + 1
+            raise
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = LatencyHistogram()
+        histogram.record(seconds)
+
+    def wrap(self, obj, attribute: str, name: str = None):
+        """Replace a method of obj with one which is counted and timed under name."""
+        method = getattr(obj, attribute)
+        name = name if name else attribute
+
+        @functools.wraps(method)
+        def wrapper(*args, **kwargs):
+            return self.call(name, method, *args, **kwargs)
+        setattr(obj, attribute, wrapper)
+        return wrapper
+
+    def reset(self):
+        self.counters = {}
+        self.errors = {}
+        self.histograms = {}
+
+    def get_metrics(self, reset: bool = False) -> dict:
+        metrics = {
+            'enabled': self.enabled,
+            'sample_every': self.sample_every,
+            'counters': dict(self.counters),
+            'errors': dict(self.errors),
+            'latencies': {name: histogram.get_dict() for name, histogram in self.histograms.items()}
+        }
+        if reset:
+            self.reset()
+        return metrics
+
+
+def _find_instrumentation(obj, args):
+    # Market methods are passed the transactive node, while assets hold a weak reference to it.
+    if args:
+        instrumentation = getattr(args[0], 'instrumentation', None)
+        if isinstance(instrumentation, Instrumentation):
+            return instrumentation
+    tn = getattr(obj, 'tn', None)
+    tn = tn() if callable(tn) else tn
+    return getattr(tn, 'instrumentation', None)
+
+
+def instrumented(name: str):
+    """Decorate a method of a market, asset or other node component to be counted and timed by its node."""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            instrumentation = _find_instrumentation(self, args)
+            if instrumentation is None:
+                return method(self, *args, **kwargs)
+            return instrumentation.call(name, method, self, *args, **kwargs)
+        return wrapper
+    return decorator
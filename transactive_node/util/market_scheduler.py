@@ -0,0 +1,185 @@
+import gevent
+import heapq
+import logging
+import weakref
+
+from datetime import timedelta
+from gevent.event import Event
+
+from tent.enumerations.market_state import MarketState
+from tent.utils.log import setup_logging
+from tent.utils.timer import Timer
+
+from transactive_node.util.price_statistics import invalidate_price_statistics
+from transactive_node.util.timer import Timer as SimulationTimer
+
+setup_logging()
+_log = logging.getLogger(__name__)
+
+
+class MarketScheduler(object):
+    """Event driven replacement for polling market.events() in a tight loop.
+
+    The scheduler computes the next state transition deadline of every market (activation, negotiation, market lead,
+    clearing, delivery, end of delivery, spawning of the next market in the series) and sleeps until the earliest of
+    these. Anything that may change the outcome of a market (a neighbor signal, a meter update, a configuration
+    change) should call wake() to have the markets evaluated immediately.
+
+    When the SimulationTimer runs in discrete event mode, the scheduler does not sleep at all. Once nothing has woken it
+    during a settle period at the current instant, it advances the clock straight to the earliest deadline.
+    """
+    def __init__(self,
+                 transactive_node,
+                 poll_interval: float = 1.0,
+                 max_sleep: float = 60.0,
+                 settle_time: float = 0.0):
+        self.tn = weakref.ref(transactive_node)
+        self.poll_interval = float(poll_interval)  # Seconds between while_in_* evaluations of polled states.
+        self.max_sleep = float(max_sleep)  # Upper bound on any sleep, in case a deadline cannot be determined.
+        self.settle_time = float(settle_time)  # Wall seconds to wait for messages before advancing a discrete clock.
+        self.wake_count = 0
+        self.cycle_count = 0
+
+        self._deadlines = []
+        self._greenlet = None
+        self._sequence = 0
+        self._wake_event = Event()
+
+    @property
+    def running(self):
+        return self._greenlet is not None and not self._greenlet.dead
+
+    def start(self):
+        """Start the scheduler loop. Calling start on a running scheduler has no effect."""
+        if not self.running:
+            self._greenlet = gevent.spawn(self.run)
+        return self._greenlet
+
+    def stop(self):
+        if self.running:
+            self._greenlet.kill()
+        self._greenlet = None
+
+    def wake(self, reason: str = None):
+        """Evaluate all markets as soon as possible."""
+        self.wake_count += 1
+        if reason:
+            _log.debug(f'Market scheduler woken by {reason}.')
+        self._wake_event.set()
+
+    @property
+    def woken(self):
+        return self._wake_event.is_set()
+
+    def clear_wake(self):
+        self._wake_event.clear()
+
+    def earliest_deadline(self):
+        """Return the earliest market deadline from the last evaluation, or None if there are no markets."""
+        return self._deadlines[0][0] if self._deadlines else None
+
+    def run(self, until=None):
+        """Evaluate the markets until the agent stops or, if given, the market time reaches until."""
+        while True:
+            tn = self.tn()
+            if tn is None or getattr(tn, '_stop_agent', False):
+                break
+            if until is not None and Timer.get_cur_time() >= until:
+                break
+            # Clear before evaluating so that a wake() arriving during market events is not lost.
+            self.clear_wake()
+            self.run_once(tn)
+            if self.discrete_event:
+                self.advance_discrete_clock()
+            else:
+                self._wake_event.wait(timeout=self.seconds_until_next_deadline())
+
+    @property
+    def discrete_event(self):
+        return SimulationTimer.simulation and SimulationTimer.discrete_event
+
+    def advance_discrete_clock(self):
+        """Advance the discrete event clock to the next deadline once all work at the current instant is done."""
+        # Yield so message handlers and other greenlets can finish their work at the current instant.
+        gevent.sleep(self.settle_time)
+        if self.woken:
+            return  # Something happened at this instant, so evaluate the markets again before moving on.
+        if self._deadlines:
+            SimulationTimer.advance_to(self.earliest_deadline())
+        else:
+            SimulationTimer.advance_to(Timer.get_cur_time() + timedelta(seconds=self.max_sleep))
+
+    def run_once(self, tn):
+        """Evaluate the events of every market and recalculate the deadlines.
+
+        The events of any market may change its marginal prices or the price model it shares with other markets, so
+        the price statistics of all markets are invalidated after each, whatever the kind of market.
+        """
+        self.cycle_count += 1
+        instrumentation = getattr(tn, 'instrumentation', None)
+        # Markets may spawn or remove markets during their events, so iterate over a copy.
+        for market in list(tn.markets):
+            if instrumentation is not None:
+                instrumentation.call('market.events', market.events, tn)
+            else:
+                market.events(tn)
+            invalidate_price_statistics(tn.markets)
+        self.reschedule(tn.markets)
+
+    def reschedule(self, markets):
+        self._deadlines = []
+        now = Timer.get_cur_time()
+        for market in markets:
+            deadline = self.next_deadline(market, now)
+            self._sequence += 1
+            heapq.heappush(self._deadlines, (deadline, self._sequence, market.name))
+
+    def next_deadline(self, market, now):
+        """Return the time at which the state of the market may next change."""
+        state = market.marketState
+        polled = now + self._to_market_time(self.poll_interval)
+        if state in (MarketState.Negotiation, MarketState.Reconcile):
+            # Negotiation converges and reconciliation completes on their own schedules, so keep polling these states.
+            return polled
+        clearing_time = market.marketClearingTime
+        zero = timedelta(0)
+        activation_lead = getattr(market, 'activationLeadTime', zero)
+        negotiation_lead = getattr(market, 'negotiationLeadTime', zero)
+        market_lead = getattr(market, 'marketLeadTime', zero)
+        delivery_lead = getattr(market, 'deliveryLeadTime', zero)
+        delivery_duration = getattr(market, 'intervalDuration', zero) * getattr(market, 'intervalsToClear', 1)
+        clearing_interval = getattr(market, 'marketClearingInterval', None)
+
+        transitions = [
+            clearing_time - activation_lead - negotiation_lead - market_lead,  # Activation
+            clearing_time - negotiation_lead - market_lead,  # Negotiation
+            clearing_time - market_lead,  # Market lead
+            clearing_time,  # Clearing (delivery lead)
+            clearing_time + delivery_lead,  # Delivery
+            clearing_time + delivery_lead + delivery_duration,  # Reconcile
+        ]
+        if clearing_interval:
+            # Activation of the next market in the series.
+            transitions.append(clearing_time + clearing_interval - activation_lead - negotiation_lead - market_lead)
+        upcoming = [t for t in transitions if t > now]
+        if not upcoming:
+            return polled
+        return min(upcoming)
+
+    def seconds_until_next_deadline(self):
+        if not self._deadlines:
+            return self.max_sleep
+        deadline = self._deadlines[0][0]
+        market_seconds = (deadline - Timer.get_cur_time()).total_seconds()
+        return min(max(self._to_wall_seconds(market_seconds), 0.0), self.max_sleep)
+
+    @staticmethod
+    def _to_wall_seconds(market_seconds):
+        if Timer.simulation:
+            return market_seconds * Timer.sim_one_hr_in_sec / 3600
+        return market_seconds
+
+    def _to_market_time(self, wall_seconds):
+        if Timer.simulation and not self.discrete_event:
+            return timedelta(seconds=wall_seconds * 3600 / Timer.sim_one_hr_in_sec)
+        return timedelta(seconds=wall_seconds)
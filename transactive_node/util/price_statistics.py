@@ -0,0 +1,50 @@
+import logging
+
+from datetime import datetime
+from typing import Iterable, Tuple
+
+from tent.utils.log import setup_logging
+
+setup_logging()
+_log = logging.getLogger(__name__)
+
+
+class PriceStatistics(object):
+    """Average price and standard deviation of each interval of a market, from its price model.
+
+    The statistics of all of the market's intervals are filled at once and then shared by every local asset on the
+    node until they are invalidated by invalidate_price_statistics(). The market scheduler invalidates them after the
+    events of every market, and TNS markets also do so within their events, when their marginal prices or price model
+    change.
+    """
+    def __init__(self, market):
+        self.market = market
+        self.statistics = {}
+        for time_interval in market.timeIntervals:
+            self._compute(time_interval.startTime)
+
+    def _compute(self, start_time: datetime) -> Tuple[float, float]:
+        statistics = self.statistics[start_time] = tuple(self.market.priceModel.get(start_time))
+        return statistics
+
+    def get(self, start_time: datetime) -> Tuple[float, float]:
+        """Return (average price, standard deviation) at start_time, as market.priceModel.get does."""
+        statistics = self.statistics.get(start_time)
+        return statistics if statistics is not None else self._compute(start_time)
+
+
+def get_price_statistics(market) -> PriceStatistics:
+    """Return the price statistics of the market for the current cycle, filling them if they were invalidated."""
+    statistics = getattr(market, 'price_statistics', None)
+    if statistics is None:
+        statistics = market.price_statistics = PriceStatistics(market)
+    return statistics
+
+
+def invalidate_price_statistics(markets: Iterable):
+    """Drop the price statistics of the markets, after their marginal prices or price models have changed.
+
+    The markets of a series share one price model, so an update of the model must invalidate all of them.
+    """
+    for market in markets:
+        market.price_statistics = None
@@ -0,0 +1,217 @@
+import glob
+import json
+import logging
+import math
+import os
+import sqlite3
+
+import numpy as np
+
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Tuple
+
+from tent.utils.log import setup_logging
+
+from transactive_node.util.wire_encoding import to_wire
+
+setup_logging()
+_log = logging.getLogger(__name__)
+
+_SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS records (time REAL NOT NULL, kind TEXT NOT NULL, market TEXT, interval_start REAL,'
+    ' entity TEXT, value REAL, payload TEXT)',
+    'CREATE INDEX IF NOT EXISTS records_market ON records (market, interval_start)',
+    'CREATE INDEX IF NOT EXISTS records_entity ON records (entity, time)',
+    'CREATE INDEX IF NOT EXISTS records_kind ON records (kind, time)'
+)
+_COLUMNS = ('time', 'kind', 'market', 'interval_start', 'entity', 'value', 'payload')
+
+
+def _seconds(time):
+    if time is None:
+        return None
+    return time.timestamp() if isinstance(time, datetime) else float(time)
+
+
+class RecordStore(object):
+    """Append-only local store of the records of a node, for analysis and model calibration without the historian.
+
+    Records are kept in SQLite segment files, one for each segment_seconds of record time, so that range queries open
+    only the segments they overlap and retention drops whole files. Rows are buffered and written in a single
+    transaction when flushed. Each row has a kind (e.g., cleared_price, scheduled_power, meter), the market, interval
+    start and entity it belongs to, a numeric value and an optional JSON payload for structured records.
+    """
+    def __init__(self, directory: str, segment_seconds: float = 86400, retention_seconds: float = 2592000,
+                 batch_size: int = 1000, max_open_segments: int = 4, max_pending: int = 100000):
+        self.directory = directory
+        self.segment_seconds = float(segment_seconds)
+        self.retention_seconds = float(retention_seconds)
+        self.batch_size = max(int(batch_size), 1)
+        self.max_open_segments = max(int(max_open_segments), 1)
+        self.max_pending = max(int(max_pending), self.batch_size)
+        self._flush_size = self.batch_size  # Pending rows at which append() flushes. Grows while writes fail.
+        self._pending = []
+        self._connections = OrderedDict()  # segment start -> sqlite3.Connection, least recently used first.
+        self.latest_time = None
+        self.written_count = 0
+        self.dropped_count = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def append(self, kind: str, time, value: float = None, market: str = None, interval_start=None,
+               entity: str = None, payload=None):
+        """Buffer a record. Payloads are stored as JSON."""
+        self._pending.append((_seconds(time), kind, market, _seconds(interval_start), entity,
+                              None if value is None else float(value),
+                              None if payload is None else json.dumps(to_wire(payload))))
+        if len(self._pending) >= self._flush_size:
+            self.flush()
+
+    def flush(self) -> int:
+        """Write the buffered records to their segments. Returns the number written.
+
+        This is called from bus callbacks through append(), so it never raises. The rows of a segment which could not
+        be written are requeued for the next flush, up to max_pending rows, beyond which the oldest are dropped.
+        """
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, []
+        by_segment = {}
+        for row in pending:
+            by_segment.setdefault(self._segment_start(row[0]), []).append(row)
+        written, failed = [], []
+        for segment_start, rows in sorted(by_segment.items()):
+            try:
+                connection = self._connect(segment_start)
+                with connection:
+                    connection.executemany('INSERT INTO records VALUES (?, ?, ?, ?, ?, ?, ?)', rows)
+                written.extend(rows)
+            except (sqlite3.Error, OSError) as e:
+                _log.warning(f'Could not write {len(rows)} records to segment {segment_start}: {e!r}')
+                self._close_segment(segment_start)
+                failed.extend(rows)
+        if failed:
+            self._pending = failed + self._pending
+            if len(self._pending) > self.max_pending:
+                dropped = len(self._pending) - self.max_pending
+                del self._pending[:dropped]
+                self.dropped_count += dropped
+                _log.error(f'Dropped the {dropped} oldest unwritten records.')
+        # After a failure, wait for another batch before append() tries again rather than retrying on every record.
+        self._flush_size = len(self._pending) + self.batch_size
+        if written:
+            latest_time = max(row[0] for row in written)
+            self.latest_time = latest_time if self.latest_time is None else max(self.latest_time, latest_time)
+            self.written_count += len(written)
+            try:
+                self.expire()
+            except OSError as e:
+                _log.warning(f'Could not remove expired record segments: {e!r}')
+        return len(written)
+
+    def _segment_start(self, seconds: float) -> int:
+        return int(math.floor(seconds / self.segment_seconds) * self.segment_seconds)
+
+    def _segment_path(self, segment_start: int) -> str:
+        return os.path.join(self.directory, f'records-{segment_start:012d}.sqlite')
+
+    def _segments(self) -> List[int]:
+        starts = []
+        for path in glob.glob(os.path.join(self.directory, 'records-*.sqlite')):
+            try:
+                starts.append(int(os.path.basename(path)[len('records-'):-len('.sqlite')]))
+            except ValueError:
+                continue
+        return sorted(starts)
+
+    def _connect(self, segment_start: int) -> sqlite3.Connection:
+        connection = self._connections.pop(segment_start, None)
+        if connection is None:
+            connection = sqlite3.connect(self._segment_path(segment_start))
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in _SCHEMA:
+                connection.execute(statement)
+            if len(self._connections) >= self.max_open_segments:
+                self._connections.popitem(last=False)[1].close()
+        self._connections[segment_start] = connection
+        return connection
+
+    def _close_segment(self, segment_start: int):
+        connection = self._connections.pop(segment_start, None)
+        if connection is not None:
+            connection.close()
+
+    def expire(self):
+        """Remove the segments which ended more than retention_seconds before the latest record."""
+        if self.latest_time is None or self.retention_seconds <= 0:
+            return
+        cutoff = self.latest_time - self.retention_seconds
+        for segment_start in self._segments():
+            if segment_start + self.segment_seconds > cutoff:
+                break
+            self._close_segment(segment_start)
+            path = self._segment_path(segment_start)
+            for path in (path, path + '-wal', path + '-shm'):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            _log.debug(f'Removed expired record segment {segment_start}.')
+
+    def query(self, kind: str = None, market: str = None, entity: str = None, start=None, end=None,
+              interval_start=None, interval_end=None, limit: int = None) -> List[dict]:
+        """Return the records matching all of the passed criteria, in time order.
+
+        start and end bound the record time, interval_start and interval_end the start of the market interval.
+        """
+        self.flush()
+        start, end = _seconds(start), _seconds(end)
+        conditions, parameters = [], []
+        for column, operator, value in (('kind', '=', kind), ('market', '=', market), ('entity', '=', entity),
+                                        ('time', '>=', start), ('time', '<', end),
+                                        ('interval_start', '>=', _seconds(interval_start)),
+                                        ('interval_start', '<', _seconds(interval_end))):
+            if value is not None:
+                conditions.append(f'{column} {operator} ?')
+                parameters.append(value)
+        sql = 'SELECT * FROM records' + (' WHERE ' + ' AND '.join(conditions) if conditions else '') + ' ORDER BY time'
+        if limit is not None:
+            sql += f' LIMIT {int(limit)}'
+        records = []
+        for segment_start in self._segments():
+            if (start is not None and segment_start + self.segment_seconds <= start) \
+                    or (end is not None and segment_start >= end):
+                continue
+            for row in self._connect(segment_start).execute(sql, parameters):
+                record = dict(zip(_COLUMNS, row))
+                if record['payload'] is not None:
+                    record['payload'] = json.loads(record['payload'])
+                records.append(record)
+                if limit is not None and len(records) >= limit:
+                    return records
+        return records
+
+    def values(self, kind: str, entity: str = None, market: str = None, start=None, end=None
+               ) -> Tuple[np.ndarray, np.ndarray]:
+        """Return arrays of the times (epoch seconds) and values of the matching records, e.g. to calibrate a model."""
+        records = self.query(kind=kind, market=market, entity=entity, start=start, end=end)
+        times = np.fromiter((r['time'] for r in records), dtype=float, count=len(records))
+        values = np.fromiter((np.nan if r['value'] is None else r['value'] for r in records), dtype=float,
+                             count=len(records))
+        return times, values
+
+    def close(self):
+        self.flush()
+        for connection in self._connections.values():
+            connection.close()
+        self._connections.clear()
+
+    def get_metrics(self) -> dict:
+        return {
+            'pending': len(self._pending),
+            'written_count': self.written_count,
+            'dropped_count': self.dropped_count,
+            'segments': len(self._segments()),
+            'latest_time': self.latest_time
+        }
@@ -0,0 +1,256 @@
+import copy
+import glob
+import hashlib
+import json
+import logging
+import os
+import struct
+import zlib
+
+from datetime import datetime, timedelta
+
+from tent.containers.interval_value import IntervalValue
+from tent.containers.time_interval import TimeInterval
+from tent.containers.transactive_record import TransactiveRecord
+from tent.containers.vertex import Vertex
+from tent.enumerations.market_state import MarketState
+from tent.enumerations.measurement_type import MeasurementType
+from tent.utils.log import setup_logging
+from tent.utils.timer import Timer
+
+from transactive_node.util.price_statistics import invalidate_price_statistics
+
+setup_logging()
+_log = logging.getLogger(__name__)
+
+MAGIC = b'TNSS'
+# Version of the snapshot record. It must be incremented whenever the fields of the record change.
+FORMAT_VERSION = 3
+# Magic, format version, flags (unused), CRC32 and length of the compressed payload.
+_HEADER = struct.Struct('>4sHHIQ')
+
+# Dependencies whose negotiation state is restored onto the dependencies rebuilt from configuration.
+STATE_DEPENDENCIES = ('localAssets', 'neighbors')
+# Interval values of the dependencies which are restored, with their measurement types.
+_INTERVAL_VALUES = (('scheduledPowers', 'scheduled_powers', MeasurementType.ScheduledPower),
+                    ('reserveMargins', 'reserve_margins', MeasurementType.ReserveMargin))
+# Transactive signals of the neighbors, which are restored so that negotiation resumes where it stopped.
+_SIGNALS = (('sentSignal', 'sent_signal'), ('receivedSignal', 'received_signal'))
+_VERTEX_FIELDS = ('marginalPrice', 'cost', 'power', 'continuity', 'powerUncertainty', 'voltage')
+
+
+def config_fingerprint(config) -> str:
+    """Hash of a configuration, to tell whether a snapshot was taken from the same market and asset configuration."""
+    return hashlib.sha1(json.dumps(config, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class SnapshotStore(object):
+    """Directory of node state snapshots.
+
+    Each snapshot is a header (magic, format version, CRC32 and length) followed by a compressed JSON record. Snapshots
+    are written to a temporary file which is synced and then renamed over the final name, so a crash while writing
+    never leaves a partial snapshot behind. Only the latest keep snapshots are retained.
+    """
+    def __init__(self, directory: str, keep: int = 3, compression_level: int = 6):
+        self.directory = directory
+        self.keep = max(int(keep), 1)
+        self.compression_level = compression_level
+
+    def _paths(self):
+        # Names sort by the time they were written.
+        return sorted(glob.glob(os.path.join(self.directory, 'snapshot-*.tns')), reverse=True)
+
+    def write(self, payload: bytes) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        compressed = zlib.compress(payload, self.compression_level)
+        header = _HEADER.pack(MAGIC, FORMAT_VERSION, 0, zlib.crc32(compressed), len(compressed))
+        path = os.path.join(self.directory, f"snapshot-{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}.tns")
+        temp_path = path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(header)
+            f.write(compressed)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+        try:
+            directory_fd = os.open(self.directory, os.O_RDONLY)
+            try:
+                os.fsync(directory_fd)
+            finally:
+                os.close(directory_fd)
+        except OSError:
+            pass  # Not every platform can sync a directory.
+        for old_path in self._paths()[self.keep:]:
+            try:
+                os.remove(old_path)
+            except OSError as e:
+                _log.warning(f'Could not remove old snapshot {old_path}: {e}')
+        return path
+
+    @staticmethod
+    def read(path: str) -> bytes:
+        with open(path, 'rb') as f:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                raise ValueError('truncated header')
+            magic, version, _, crc, length = _HEADER.unpack(header)
+            if magic != MAGIC:
+                raise ValueError('not a node snapshot')
+            if version != FORMAT_VERSION:
+                raise ValueError(f'unsupported snapshot format version {version}')
+            compressed = f.read(length)
+        if len(compressed) != length or zlib.crc32(compressed) != crc:
+            raise ValueError('corrupt payload')
+        return zlib.decompress(compressed)
+
+    def latest(self):
+        """Yield (path, payload) of the valid snapshots, newest first."""
+        for path in self._paths():
+            try:
+                yield path, self.read(path)
+            except (OSError, ValueError, zlib.error) as e:
+                _log.warning(f'Skipping invalid snapshot {path}: {e}')
+
+
+def _interval_key(interval_value) -> list:
+    return [interval_value.market.name, interval_value.timeInterval.startTime.isoformat()]
+
+
+def _capture_market(market) -> dict:
+    prices = {p.timeInterval.startTime: p.value for p in market.marginalPrices}
+    return {
+        'name': market.name,
+        'series': market.marketSeriesName,
+        'state': market.marketState.name,
+        'clearing_time': market.marketClearingTime.isoformat(),
+        'intervals': [{'start': ti.startTime.isoformat(),
+                       'duration': ti.duration.total_seconds(),
+                       'marginal_price': prices.get(ti.startTime)} for ti in market.timeIntervals]
+    }
+
+
+def _capture_record(transactive_record) -> dict:
+    fields = dict(vars(transactive_record))
+    if isinstance(fields.get('timeStamp'), datetime):
+        fields['timeStamp'] = fields['timeStamp'].isoformat()
+    if not isinstance(fields.get('timeInterval'), (str, type(None))):
+        fields['timeInterval'] = fields['timeInterval'].name
+    return fields
+
+
+def _restore_record(fields: dict) -> TransactiveRecord:
+    # The records are rebuilt as they were, without the defaults and time stamp of a new record.
+    transactive_record = TransactiveRecord.__new__(TransactiveRecord)
+    vars(transactive_record).update(fields)
+    if isinstance(fields.get('timeStamp'), str):
+        transactive_record.timeStamp = datetime.fromisoformat(fields['timeStamp'])
+    return transactive_record
+
+
+def _capture_dependency(dependency) -> dict:
+    record = {key: [_interval_key(iv) + [iv.value] for iv in getattr(dependency, attribute, None) or []]
+              for attribute, key, _ in _INTERVAL_VALUES}
+    record['vertices'] = [_interval_key(iv) + [[getattr(iv.value, f) for f in _VERTEX_FIELDS]]
+                          for iv in getattr(dependency, 'activeVertices', None) or []]
+    for attribute, key in _SIGNALS:
+        if hasattr(dependency, attribute):
+            record[key] = [_capture_record(r) for r in getattr(dependency, attribute) or []]
+    return record
+
+
+def capture(tn, fingerprint: str = None) -> bytes:
+    """Record the markets of the node, the scheduled powers, reserve margins and vertices of its assets and neighbors,
+    and the transactive signals sent to and received from its neighbors."""
+    record = {
+        'version': FORMAT_VERSION,
+        'node': tn.name,
+        'fingerprint': fingerprint,
+        'time': Timer.get_cur_time().isoformat(),
+        'markets': [_capture_market(m) for m in tn.markets],
+        'dependencies': {attribute: {d.name: _capture_dependency(d) for d in (getattr(tn, attribute, None) or [])}
+                         for attribute in STATE_DEPENDENCIES}
+    }
+    return json.dumps(record, separators=(',', ':')).encode()
+
+
+def load(payload: bytes) -> dict:
+    """Decode and validate a snapshot record. Raises ValueError if it is not a record of this format version."""
+    record = json.loads(payload.decode())
+    if not isinstance(record, dict) or record.get('version') != FORMAT_VERSION:
+        raise ValueError('unsupported snapshot record version')
+    for key in ('node', 'fingerprint', 'time', 'markets', 'dependencies'):
+        if key not in record:
+            raise ValueError(f'snapshot record has no {key}')
+    record['time'] = datetime.fromisoformat(record['time'])
+    return record
+
+
+def _new_market(template):
+    # Further markets of a series share the configuration of the first, but none of its intervals or values.
+    market = copy.copy(template)
+    for name, value in vars(market).items():
+        if isinstance(value, (list, dict, set)):
+            setattr(market, name, type(value)())
+    return market
+
+
+def _restore_market(market, record: dict, now: datetime) -> dict:
+    """Set the intervals and marginal prices of the market from its record. Returns its intervals by start time."""
+    market.name = record['name']
+    market.marketState = MarketState[record['state']]
+    market.marketClearingTime = datetime.fromisoformat(record['clearing_time'])
+    market.timeIntervals = []
+    market.marginalPrices = []
+    intervals = {}
+    for interval in record['intervals']:
+        time_interval = TimeInterval(now, timedelta(seconds=interval['duration']), market, market.marketClearingTime,
+                                     datetime.fromisoformat(interval['start']))
+        market.timeIntervals.append(time_interval)
+        intervals[interval['start']] = time_interval
+        if interval['marginal_price'] is not None:
+            market.marginalPrices.append(IntervalValue(market, time_interval, market, MeasurementType.MarginalPrice,
+                                                       interval['marginal_price']))
+    return intervals
+
+
+def restore(tn, record: dict) -> bool:
+    """Rebuild the markets of the snapshot on the configured markets of the same series and restore the scheduled
+    powers, reserve margins and vertices of the dependencies onto their intervals, and the signals of the neighbors.
+    """
+    configured = {m.marketSeriesName: m for m in tn.markets}
+    markets, intervals, used = [], {}, set()
+    now = Timer.get_cur_time()
+    for market_record in record['markets']:
+        template = configured.get(market_record['series'])
+        if template is None:
+            continue
+        market = template if market_record['series'] not in used else _new_market(template)
+        used.add(market_record['series'])
+        for start, time_interval in _restore_market(market, market_record, now).items():
+            intervals[(market.name, start)] = (market, time_interval)
+        markets.append(market)
+    if not markets:
+        return False
+    tn.markets = markets
+    invalidate_price_statistics(markets)
+    for attribute in STATE_DEPENDENCIES:
+        dependency_records = record['dependencies'].get(attribute, {})
+        for dependency in getattr(tn, attribute, None) or []:
+            dependency_record = dependency_records.get(dependency.name)
+            if dependency_record is None:
+                continue
+            for attribute, key, measurement_type in _INTERVAL_VALUES:
+                if hasattr(dependency, attribute) and key in dependency_record:
+                    setattr(dependency, attribute, [
+                        IntervalValue(dependency, intervals[(name, start)][1], intervals[(name, start)][0],
+                                      measurement_type, value)
+                        for name, start, value in dependency_record[key] if (name, start) in intervals])
+            for attribute, key in _SIGNALS:
+                if hasattr(dependency, attribute) and key in dependency_record:
+                    setattr(dependency, attribute, [_restore_record(fields) for fields in dependency_record[key]])
+            if hasattr(dependency, 'activeVertices'):
+                dependency.activeVertices = [
+                    IntervalValue(dependency, intervals[(name, start)][1], intervals[(name, start)][0],
+                                  MeasurementType.ActiveVertex, Vertex(*fields))
+                    for name, start, fields in dependency_record['vertices'] if (name, start) in intervals]
+    return True
@@ -52,6 +52,10 @@ class Timer(datetime):
     sim_one_hr_in_sec = 1200
     sim_start_time = None
     simulation = False
+    # In discrete event mode, time stands still until it is explicitly advanced to the next scheduled event.
+    discrete_event = False
+    discrete_time = None
+    _installed = {}  # Timer classes this one is installed in -> their own now and get_cur_time, if any.
 
     @classmethod
     def now(cls, tz=None):
@@ -59,6 +63,9 @@ class Timer(datetime):
         Calculate current time based on the amount of time has passed since this object is created
         :return:
         """
+        if cls.simulation and cls.discrete_event:
+            return cls.discrete_time
+
         cur_time = super(Timer, cls).now(tz)
         if cls.simulation:
             ratio = 3600 / cls.sim_one_hr_in_sec
@@ -69,11 +76,45 @@ class Timer(datetime):
         return cur_time
 
     @classmethod
-    def set(cls, sim_one_hr_in_sec=1200, sim_start_time=None, simulation=False):
+    def get_cur_time(cls):
+        return cls.now()
+
+    @classmethod
+    def set(cls, sim_one_hr_in_sec=1200, sim_start_time=None, simulation=False, discrete_event=False):
+        if discrete_event and sim_start_time is None:
+            raise ValueError('A discrete event clock needs a simulation start time.')
         cls.created_time = datetime.now()
         cls.sim_one_hr_in_sec = sim_one_hr_in_sec
         cls.sim_start_time = sim_start_time
         cls.simulation = simulation
+        cls.discrete_event = discrete_event
+        cls.discrete_time = sim_start_time
+
+    @classmethod
+    def advance_to(cls, time):
+        """Jump the discrete event clock forward to time. The clock never moves backward."""
+        if cls.discrete_time is None or time > cls.discrete_time:
+            cls.discrete_time = time
+
+    @classmethod
+    def install(cls, timer_class):
+        """Make another Timer class, e.g., the one used by the library, report the time of this one."""
+        if timer_class not in cls._installed:
+            cls._installed[timer_class] = {name: vars(timer_class).get(name) for name in ('now', 'get_cur_time')}
+        timer_class.now = cls.now
+        timer_class.get_cur_time = cls.get_cur_time
+
+    @classmethod
+    def uninstall(cls, timer_class):
+        """Restore the methods of a Timer class which install() replaced."""
+        originals = cls._installed.pop(timer_class, None)
+        if originals is None:
+            return
+        for name, method in originals.items():
+            if method is None:
+                delattr(timer_class, name)
+            else:
+                setattr(timer_class, name, method)
 
 
 if __name__ == '__main__':
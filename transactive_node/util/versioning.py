@@ -0,0 +1,44 @@
+import functools
+import itertools
+
+_versions = itertools.count(1)
+
+
+def next_version() -> int:
+    """Return a version number which no other collection has had, so replacing a collection is seen as a change."""
+    return next(_versions)
+
+
+def content_version(value):
+    """Return the version of a collection which tracks changes to its content, or None if it does not."""
+    return getattr(value, 'version', None)
+
+
+def _versioned(method):
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        self.version = next_version()
+        return result
+    return wrapper
+
+
+class VersionedList(list):
+    """List which takes a new version whenever it is changed, so that consumers can tell it changed without comparing
+    its content."""
+    def __init__(self, *args):
+        super(VersionedList, self).__init__(*args)
+        self.version = next_version()
+
+    append = _versioned(list.append)
+    extend = _versioned(list.extend)
+    insert = _versioned(list.insert)
+    remove = _versioned(list.remove)
+    pop = _versioned(list.pop)
+    clear = _versioned(list.clear)
+    sort = _versioned(list.sort)
+    reverse = _versioned(list.reverse)
+    __setitem__ = _versioned(list.__setitem__)
+    __delitem__ = _versioned(list.__delitem__)
+    __iadd__ = _versioned(list.__iadd__)
+    __imul__ = _versioned(list.__imul__)
@@ -0,0 +1,123 @@
+import base64
+import logging
+
+from tent.utils.helpers import json_encoder
+from tent.utils.log import setup_logging
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+setup_logging()
+_log = logging.getLogger(__name__)
+
+JSON = 'json'
+MSGPACK = 'msgpack'
+
+_PRIMITIVES = frozenset((str, int, float, bool, type(None)))
+
+
+def supported_encodings():
+    return [JSON, MSGPACK] if msgpack is not None else [JSON]
+
+
+class WireEncoder(object):
+    """Converts objects directly to the plain Python types that a JSON encode and decode would produce.
+
+    This replaces json.loads(json.dumps(obj, default=default)) without building the intermediate string. The
+    conversion for each type is looked up once and cached, and objects which JSON cannot encode are passed to the
+    default function, just as json.dumps would do.
+    """
+    def __init__(self, default=json_encoder):
+        self.default = default
+        self._encoders = {
+            str: self._identity,
+            int: self._identity,
+            float: self._identity,
+            bool: self._identity,
+            type(None): self._identity,
+            dict: self._encode_dict,
+            list: self._encode_sequence,
+            tuple: self._encode_sequence
+        }
+
+    def encode(self, obj):
+        encoder = self._encoders.get(type(obj))
+        if encoder is None:
+            encoder = self._encoders[type(obj)] = self._resolve_encoder(type(obj))
+        return encoder(obj)
+
+    def _resolve_encoder(self, cls):
+        # Subclasses are encoded as JSON would encode their base types.
+        if issubclass(cls, str):
+            return str.__str__
+        if issubclass(cls, int):
+            return int.__int__
+        if issubclass(cls, float):
+            return float.__float__
+        if issubclass(cls, dict):
+            return self._encode_dict
+        if issubclass(cls, (list, tuple)):
+            return self._encode_sequence
+        return self._encode_default
+
+    @staticmethod
+    def _identity(obj):
+        return obj
+
+    def _encode_default(self, obj):
+        return self.encode(self.default(obj))
+
+    # Primitives are by far the most common values, so they are checked inline rather than through encode().
+    def _encode_sequence(self, obj):
+        encode = self.encode
+        return [item if type(item) in _PRIMITIVES else encode(item) for item in obj]
+
+    def _encode_dict(self, obj):
+        encode = self.encode
+        encode_key = self._encode_key
+        return {key if type(key) is str else encode_key(key): value if type(value) in _PRIMITIVES else encode(value)
+                for key, value in obj.items()}
+
+    @staticmethod
+    def _encode_key(key):
+        if isinstance(key, str):
+            return str.__str__(key)
+        if key is True:
+            return 'true'
+        if key is False:
+            return 'false'
+        if key is None:
+            return 'null'
+        if isinstance(key, int):
+            return int.__repr__(key)
+        if isinstance(key, float):
+            return float.__repr__(key)
+        raise TypeError(f'keys must be str, int, float, bool or None, not {key.__class__.__name__}')
+
+
+_default_encoder = WireEncoder()
+
+
+def to_wire(obj):
+    """Convert obj to wire-ready primitives using the library json_encoder for non-primitive types."""
+    return _default_encoder.encode(obj)
+
+
+def pack(wire_obj, encoding=JSON):
+    """Pack wire-ready primitives as a message payload in the requested encoding."""
+    if encoding == MSGPACK:
+        if msgpack is None:
+            raise ValueError('msgpack encoding requested, but msgpack is not installed.')
+        # The message bus itself carries JSON, so the binary payload is sent as base64 text.
+        return base64.b64encode(msgpack.packb(wire_obj, use_bin_type=True)).decode('ascii')
+    return wire_obj
+
+
+def unpack(payload, encoding=JSON):
+    if encoding == MSGPACK:
+        if msgpack is None:
+            raise ValueError('Received msgpack payload, but msgpack is not installed.')
+        return msgpack.unpackb(base64.b64decode(payload), raw=False)
+    return payload